@@ -1,109 +1,208 @@
 import pandas as pd
 import numpy as np
 import os
+from csmar_catalog import load_catalog
+from csmar_loader import load_tables, spec_files
+from table_specs import TFP_SPECS, INDUSTRY_SPECS
+from tfp_lp import estimate_lp
+from tfp_grouped import fill_industry, assign_groups, estimate_ols_grouped, estimate_lp_grouped, min_group_obs
 from statsmodels.formula.api import ols
+from panel_store import write_panel
+import instrument
 
 # 1. 设置路径
 base_path = r"D:\SHLT\cqgs\cqbylw\tfp_data"
-output_path = os.path.join(r"D:\SHLT\cqgs\cqbylw\data", "tfp_result.csv")
+# 行业代码所在的目录 (基本信息年度表、管理层治理能力表不在 tfp_data 下)
+industry_path = r"D:\SHLT\cqgs\cqbylw"
+# 输出：按年份分区的列式数据集 (见 panel_store.py)，CSV 只是导出的副本 (设为 None 则不导出)
+output_path = os.path.join(r"D:\SHLT\cqgs\cqbylw\data", "tfp_result")
+csv_path = os.path.join(r"D:\SHLT\cqgs\cqbylw\data", "tfp_result.csv")
+report_path = os.path.join(r"D:\SHLT\cqgs\cqbylw\data", "run_report_tfp.json")
 
-# 辅助函数：统一证券代码
-def standardize_stkcd(stkcd):
-    try:
-        s = str(stkcd).strip()
-        if s.isdigit():
-            return s.zfill(6)
-        return s
-    except:
-        return str(stkcd)
-
-print("Reading TFP source files...")
-
-# (1) 产出 Y: 营业收入 (B001101000)
-# 注意：FS_Comins.xlsx 中 B001101000 是营业收入
-income = pd.read_excel(os.path.join(base_path, "226利润表133904769", "FS_Comins.xlsx"))
-income = income[pd.to_numeric(income['Stkcd'], errors='coerce').notna()] # 去表头
-income = income.rename(columns={'Stkcd': 'Stkcd', 'Accper': 'Year', 'B001101000': 'Y_Revenue'})
-income['Year'] = pd.to_datetime(income['Year']).dt.year.astype('int64')
-income['Stkcd'] = income['Stkcd'].apply(standardize_stkcd)
-income = income.sort_values(['Stkcd', 'Year']).drop_duplicates(['Stkcd', 'Year'], keep='last')
-
-# (2) 中间投入 M: 购买商品支付现金 (C001014000)
-cash = pd.read_excel(os.path.join(base_path, "226现金流量表(直接法)134129681", "FS_Comscfd.xlsx"))
-cash = cash[pd.to_numeric(cash['Stkcd'], errors='coerce').notna()]
-cash = cash.rename(columns={'Stkcd': 'Stkcd', 'Accper': 'Year', 'C001014000': 'M_Input'})
-cash['Year'] = pd.to_datetime(cash['Year']).dt.year.astype('int64')
-cash['Stkcd'] = cash['Stkcd'].apply(standardize_stkcd)
-cash = cash.sort_values(['Stkcd', 'Year']).drop_duplicates(['Stkcd', 'Year'], keep='last')
-
-# (3) 资本 K: 固定资产净额 (A001212000)
-balance = pd.read_excel(os.path.join(base_path, "226资产负债表133659536", "FS_Combas.xlsx"))
-balance = balance[pd.to_numeric(balance['Stkcd'], errors='coerce').notna()]
-balance = balance.rename(columns={'Stkcd': 'Stkcd', 'Accper': 'Year', 'A001212000': 'K_Capital'})
-balance['Year'] = pd.to_datetime(balance['Year']).dt.year.astype('int64')
-balance['Stkcd'] = balance['Stkcd'].apply(standardize_stkcd)
-balance = balance.sort_values(['Stkcd', 'Year']).drop_duplicates(['Stkcd', 'Year'], keep='last')
-
-# (4) 劳动 L: 员工人数 (Y0601b)
-# 来源：治理综合信息文件 (CG_Ybasic.xlsx)
-staff = pd.read_excel(os.path.join(base_path, "226治理综合信息文件142353163", "CG_Ybasic.xlsx"))
-staff = staff[pd.to_numeric(staff['Stkcd'], errors='coerce').notna()]
-
-staff = staff.rename(columns={'Stkcd': 'Stkcd', 'Reptdt': 'Year', 'Y0601b': 'L_Labor'})
-staff['Year'] = pd.to_datetime(staff['Year']).dt.year.astype('int64')
-staff['Stkcd'] = staff['Stkcd'].apply(standardize_stkcd)
-staff = staff.sort_values(['Stkcd', 'Year']).drop_duplicates(['Stkcd', 'Year'], keep='last')
 
-# 2. 合并数据
-print("Merging data...")
-# 使用外连接并打印每一步的数据量，以便排查问题
-df = pd.merge(income[['Stkcd', 'Year', 'Y_Revenue']], 
-              cash[['Stkcd', 'Year', 'M_Input']], on=['Stkcd', 'Year'], how='inner')
-print(f"After Income-Cash merge: {df.shape}")
+# 读取 Y, M, K, L 四张表 (列名映射见 table_specs.TFP_SPECS，并行读取)
+def load_sources(catalog):
+    print("Reading TFP source files...")
+    with instrument.step('load', kind='load') as s:
+        tables = load_tables(TFP_SPECS, catalog)
+        s.details['rows'] = {name: len(t) for name, t in tables.items()}
+        s.rows_out = sum(s.details['rows'].values())
+    return tables
 
-df = pd.merge(df, balance[['Stkcd', 'Year', 'K_Capital']], on=['Stkcd', 'Year'], how='inner')
-print(f"After Balance merge: {df.shape}")
 
-df = pd.merge(df, staff[['Stkcd', 'Year', 'L_Labor']], on=['Stkcd', 'Year'], how='inner')
-print(f"After Staff merge: {df.shape}")
+# 2. 合并数据
+def merge_inputs(tables):
+    print("Merging data...")
+    # 使用内连接并打印每一步的数据量，以便排查问题 (运行报告中另有每一步的键匹配率)
+    df = tables['income']
+    for name, label in (('cash', 'Income-Cash'), ('balance', 'Balance'), ('staff', 'Staff')):
+        with instrument.step(f'merge {name}', kind='merge', rows_in=len(df)) as s:
+            s.match(name, df, tables[name])
+            df = s.output(pd.merge(df, tables[name], on=['Stkcd', 'Year'], how='inner'))
+        print(f"After {label} merge: {df.shape}")
+    return df
+
 
 # 3. 预处理
-print("Preprocessing...")
-# 转换为数值型
-cols = ['Y_Revenue', 'M_Input', 'K_Capital', 'L_Labor']
-for col in cols:
-    df[col] = pd.to_numeric(df[col], errors='coerce')
-
-# 去除缺失值和负值/零值 (取对数要求 > 0)
-df = df.dropna()
-df = df[(df['Y_Revenue'] > 0) & (df['M_Input'] > 0) & (df['K_Capital'] > 0) & (df['L_Labor'] > 0)]
-
-# 取对数
-df['lnY'] = np.log(df['Y_Revenue'])
-df['lnM'] = np.log(df['M_Input'])
-df['lnK'] = np.log(df['K_Capital'])
-df['lnL'] = np.log(df['L_Labor'])
-
-# 4. 计算 TFP (简化版 LP 法 / OLS 替代)
-# 真正的 LP 法需要 GMM 估计，比较复杂。
-# 这里我们先用 OLS 估计残差作为 TFP 的近似 (TFP_OLS)，这也是一种常见的基础做法。
-# 如果需要严格的 LP 法，可以后续引入 pyprods 库或 semipy。
-
-print("Estimating TFP (OLS)...")
-# 模型：lnY = alpha * lnL + beta * lnK + gamma * lnM + epsilon
-# TFP = lnY - (alpha * lnL + beta * lnK + gamma * lnM)
-# 注意：有些文献把 M 放在左边 (Value Added)，这里我们用 Gross Output 模型
-
-# 分行业回归 (如果没有行业数据，先做全样本回归)
-model = ols('lnY ~ lnL + lnK + lnM', data=df).fit()
-print(model.summary())
-
-# 计算 TFP
-df['TFP_OLS'] = model.resid + model.params['Intercept'] 
-# 或者直接用残差代表 TFP 的波动部分
-# 这里保留截距项代表平均技术水平
+def preprocess(df):
+    print("Preprocessing...")
+    with instrument.step('preprocess', rows_in=len(df)) as s:
+        df = s.output(_preprocess(df))
+        s.null_shares(df, ['lnY', 'lnL', 'lnK', 'lnM'])
+    return df
+
+
+def _preprocess(df):
+    # 转换为数值型
+    cols = ['Y_Revenue', 'M_Input', 'K_Capital', 'L_Labor']
+    for col in cols:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+
+    # 去除缺失值和负值/零值 (取对数要求 > 0)
+    df = df.dropna()
+    df = df[(df['Y_Revenue'] > 0) & (df['M_Input'] > 0) & (df['K_Capital'] > 0) & (df['L_Labor'] > 0)].copy()
+
+    # 取对数
+    df['lnY'] = np.log(df['Y_Revenue'])
+    df['lnM'] = np.log(df['M_Input'])
+    df['lnK'] = np.log(df['K_Capital'])
+    df['lnL'] = np.log(df['L_Labor'])
+    return df
+
+
+# 4. 计算 TFP
+# TFP_OLS：用 OLS 估计残差作为 TFP 的近似，这也是一种常见的基础做法。
+# TFP_LP：Levinsohn-Petrin 控制函数法 (两步法 + GMM)，实现见 tfp_lp.py。
+# tfp_methods 中列出要计算的方法，'ols' 总是计算 (LP 用它作为初值参考)。
+tfp_methods = ['ols', 'lp']
+# LP 默认按总产出模型估计 (lnY 为营业收入，lnM 进入生产函数)；
+# 设为 False 则按《TFP计算指南_LP法》第 3 节的写法，第二步只估计资本弹性
+lp_gross_output = True
+
+# 分行业估计：None 表示只做全样本估计；'industry' 按行业分组，'industry_period' 按 行业 x 时期 分组
+# 分组估计的结果写入 TFP_OLS_IND / TFP_LP_IND，全样本的 TFP_OLS / TFP_LP 保持不变
+group_mode = 'industry'
+group_period = 5
+
+def estimate_tfp(df, methods=tfp_methods):
+    with instrument.step('estimate', kind='estimate', rows_in=len(df)) as s:
+        df = _estimate_tfp(df, methods)
+        s.null_shares(df, [c for c in ('TFP_OLS', 'TFP_LP') if c in df.columns])
+    return df
+
+
+def _estimate_tfp(df, methods):
+    print("Estimating TFP (OLS)...")
+    # 模型：lnY = alpha * lnL + beta * lnK + gamma * lnM + epsilon
+    # TFP = lnY - (alpha * lnL + beta * lnK + gamma * lnM)
+    # 注意：有些文献把 M 放在左边 (Value Added)，这里我们用 Gross Output 模型
+
+    # 分行业回归 (如果没有行业数据，先做全样本回归)
+    model = ols('lnY ~ lnL + lnK + lnM', data=df).fit()
+    print(model.summary())
+
+    # 计算 TFP
+    df['TFP_OLS'] = model.resid + model.params['Intercept']
+    # 或者直接用残差代表 TFP 的波动部分
+    # 这里保留截距项代表平均技术水平
+
+    if 'lp' in methods:
+        print("Estimating TFP (LP)...")
+        res = estimate_lp(df, gross_output=lp_gross_output)
+        print(res.summary())
+        df['TFP_LP'] = res.tfp
+    return df
+
+
+# 读取行业代码，合并两个来源 (同一企业-年度以基本信息年度表为准)
+def load_industry(industry_path=industry_path):
+    with instrument.step('load industry', kind='load') as s:
+        industry = s.output(_load_industry(industry_path))
+    return industry
+
+
+def _load_industry(industry_path):
+    tables = load_tables(INDUSTRY_SPECS, load_catalog(industry_path))
+    parts = [t[['Stkcd', 'Year', 'IndustryCode']] for t in tables.values() if not t.empty]
+    if not parts:
+        return pd.DataFrame(columns=['Stkcd', 'Year', 'IndustryCode'])
+    industry = pd.concat(parts, ignore_index=True).dropna(subset=['IndustryCode'])
+    return industry.drop_duplicates(subset=['Stkcd', 'Year'], keep='first')
+
+
+# 分行业估计 TFP (每组一套生产函数系数)
+# 各组 OLS 用分组累加的正规方程一次解出；LP 各组之间并行计算
+def estimate_tfp_grouped(df, industry, mode=group_mode, period=group_period, methods=tfp_methods):
+    print(f"Estimating TFP by group ({mode})...")
+    with instrument.step('merge industry', kind='merge', rows_in=len(df)) as s:
+        s.match('industry', df, industry)
+        df = pd.merge(df, industry, on=['Stkcd', 'Year'], how='left')
+        df['IndustryCode'] = fill_industry(df)
+        s.null_shares(df, ['IndustryCode'])
+        s.output(df)
+    print(f"Industry code coverage: {df['IndustryCode'].notna().mean():.1%}")
+    df['TFP_Group'] = assign_groups(df, min_obs=min_group_obs,
+                                    period=period if mode == 'industry_period' else None)
+    print(f"{df['TFP_Group'].nunique()} estimation groups (min {min_group_obs} obs per group)")
+
+    with instrument.step('estimate grouped', kind='estimate', rows_in=len(df)) as s:
+        s.details['groups'] = int(df['TFP_Group'].nunique())
+        df['TFP_OLS_IND'], coef = estimate_ols_grouped(df)
+        print(coef.to_string())
+        if 'lp' in methods:
+            df['TFP_LP_IND'], coef = estimate_lp_grouped(df, gross_output=lp_gross_output)
+            print(coef.to_string())
+        s.null_shares(df, [c for c in ('TFP_OLS_IND', 'TFP_LP_IND') if c in df.columns])
+    return df
+
+
+# TFP 阶段的完整流程：读取 -> 合并 -> 预处理 -> 估计 (run_pipeline.py 直接调用)
+def build_tfp(base_path=base_path):
+    # 按表名在 base_path 下查找文件 (见 csmar_catalog.py)
+    catalog = load_catalog(base_path)
+
+    tables = load_sources(catalog)
+    df = merge_inputs(tables)
+    df = preprocess(df)
+    df = estimate_tfp(df)
+    if group_mode:
+        df = estimate_tfp_grouped(df, load_industry(industry_path), mode=group_mode, period=group_period)
+    return select_output(df)
+
+
+# TFP 阶段输出的列
+def select_output(df):
+    tfp_cols = [c for c in ('TFP_OLS', 'TFP_LP', 'TFP_OLS_IND', 'TFP_LP_IND', 'IndustryCode', 'TFP_Group')
+                if c in df.columns]
+    return df[['Stkcd', 'Year'] + tfp_cols + ['lnY', 'lnL', 'lnK', 'lnM']].reset_index(drop=True)
+
+
+# TFP 阶段依赖的源文件
+def source_files(base_path=base_path):
+    files = spec_files(TFP_SPECS, load_catalog(base_path))
+    if group_mode:
+        files += spec_files(INDUSTRY_SPECS, load_catalog(industry_path))
+    return files
+
 
 # 5. 保存结果
-print(f"Saving TFP results to {output_path}...")
-df[['Stkcd', 'Year', 'TFP_OLS', 'lnY', 'lnL', 'lnK', 'lnM']].to_csv(output_path, index=False, encoding='utf-8-sig')
-print("Done! Shape:", df.shape)
+def save_tfp(df, output_path=output_path, csv_path=csv_path):
+    print(f"Saving TFP results to {output_path}...")
+    try:
+        write_panel(df, output_path, csv_path=csv_path)
+        print("Done! Shape:", df.shape)
+    except PermissionError:
+        print(f"Permission denied: {output_path}")
+        print("Please close the file if it is open in Excel or another program.")
+
+
+def main():
+    instrument.start_run('tfp', report_path=report_path)
+    df = build_tfp(base_path)
+    save_tfp(df, output_path, csv_path)
+    instrument.finish_run()
+
+
+# Windows 下进程池需要 main 保护
+if __name__ == "__main__":
+    main()
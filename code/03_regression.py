@@ -1,25 +1,26 @@
 import pandas as pd
 import numpy as np
 import os
+import re
+import argparse
 from statsmodels.formula.api import ols
 import statsmodels.api as sm
+from hdfe import fit_hdfe
+from spec_grid import SpecGrid, run_grid
+from wild_bootstrap import wild_cluster_bootstrap
+from panel_store import read_panel
+from window_sweep import sweep_windows, stability_grid, stability_summary
+import instrument
 
 # 1. 读取数据
-file_path = r"D:\SHLT\cqgs\cqbylw\data\final_data.csv"
-print(f"Reading data from {file_path}...")
-df = pd.read_csv(file_path)
-
-# 2. 数据筛选 (2016-2024)
-print("Filtering data (Year >= 2016)...")
-df = df[df['Year'] >= 2016]
-
-# 3. 填补缺失值 (简单的均值填补，仅供参考)
-# 注意：严谨的研究应该用插值法或直接剔除
-print("Handling missing values...")
-cols_to_fill = ['GDP', 'ROA']
-for col in cols_to_fill:
-    if col in df.columns:
-        df[col] = df[col].fillna(df[col].mean())
+# 清洗阶段输出的列式数据集 (见 panel_store.py)：只读回归用到的列和 min_year 以后的年份
+file_path = r"D:\SHLT\cqgs\cqbylw\data\final_data"
+report_path = r"D:\SHLT\cqgs\cqbylw\data\run_report_regression.json"
+# 样本区间扫描的结果 (每个 起止年份 x 被解释变量 一行，画图数据见 window_sweep.stability_grid / stability_path)
+sweep_path = r"D:\SHLT\cqgs\cqbylw\data\window_sweep.csv"
+
+# 样本起始年份
+min_year = 2016
 
 # 4. 定义模型公式
 # 被解释变量：TFP_OLS, ROA
@@ -27,26 +28,248 @@ for col in cols_to_fill:
 # 控制变量：Size, Lev, TobinQ, Board, Indb, Top1, Age, GDP, SOE
 controls = "Size + Lev + TobinQ + Board + Indb + Top1 + Age + GDP + C(SOE) + C(Year)"
 
-# 模型 1: TFP 回归
-formula_tfp = f"TFP_OLS ~ Treat_time + {controls}"
-print(f"\n=== Regression 1: TFP ~ Digitalization ===")
-print(f"Formula: {formula_tfp}")
-
-try:
-    model_tfp = ols(formula_tfp, data=df).fit(cov_type='HC1') # 使用稳健标准误
-    print(model_tfp.summary())
-except Exception as e:
-    print(f"Error in TFP regression: {e}")
-
-# 模型 2: ROA 回归
-formula_roa = f"ROA ~ Treat_time + {controls}"
-print(f"\n=== Regression 2: ROA ~ Digitalization ===")
-print(f"Formula: {formula_roa}")
-
-try:
-    model_roa = ols(formula_roa, data=df).fit(cov_type='HC1')
-    print(model_roa.summary())
-except Exception as e:
-    print(f"Error in ROA regression: {e}")
-
-print("\nRegression analysis completed.")
+# 被解释变量及其在输出中的标题
+dep_vars = {
+    'TFP_OLS': "Regression 1: TFP ~ Digitalization",
+    'ROA': "Regression 2: ROA ~ Digitalization",
+}
+
+# 固定效应模型：吸收企业、年份固定效应 (不生成虚拟变量，见 hdfe.py)，按企业聚类
+# 行业 x 年份固定效应写成 ('IndustryCode', 'Year')；设为 None 则不跑固定效应模型
+fe_absorb = ['Stkcd', 'Year']
+fe_cluster = 'Stkcd'
+
+# 野聚类自助法：按行业 (及省份，数据中有 Province 列时) 聚类，检验 Treat_time 系数
+bootstrap_clusters = ['IndustryCode', 'Province']
+bootstrap_reps = 9999
+bootstrap_weights = 'webb'
+
+# 稳健性检验：逐步加入控制变量 (嵌套)，并按产权性质分样本
+robustness_controls = {
+    'finance': "Size + Lev + TobinQ + C(Year)",
+    'governance': "Size + Lev + TobinQ + C(Year) + Board + Indb + Top1",
+    'full': "Size + Lev + TobinQ + C(Year) + Board + Indb + Top1 + Age + GDP + C(SOE)",
+}
+robustness_samples = {
+    'all': None,
+    'SOE': lambda d: d['SOE'] == 1,
+    'non-SOE': lambda d: d['SOE'] == 0,
+}
+
+# 样本区间扫描：数据中所有连续的 [起始年, 结束年] 组合 (至少 sweep_min_years 年)，检验 Treat_time 系数的稳定性
+# python 03_regression.py --sweep 只运行这一项 (见 window_sweep.py)
+sweep_min_years = 3
+
+
+# 回归用到的列：各模型公式中的变量，加上面板键、固定效应、聚类和分样本变量
+def regression_columns():
+    formulas = [controls, *robustness_controls.values(), *dep_vars]
+    names = set(re.findall(r'[A-Za-z_]\w*', ' '.join(formulas))) - {'C'}
+    names |= {'Stkcd', 'Year', 'Treat_time', 'SOE', fe_cluster, *bootstrap_clusters}
+    for fe in fe_absorb or []:
+        names |= set(fe) if isinstance(fe, tuple) else {fe}
+    return sorted(names)
+
+
+# 2. 数据筛选 + 3. 填补缺失值
+def prepare_sample(df, min_year=min_year, fill_cols=('GDP', 'ROA')):
+    # 2. 数据筛选 (2016-2024)
+    print(f"Filtering data (Year >= {min_year})...")
+    with instrument.step('sample', rows_in=len(df)) as s:
+        df = df[df['Year'] >= min_year].copy()
+        # 填补之前的缺失比例 (整列缺失的变量均值填补后仍然全是缺失)
+        s.null_shares(df, [c for c in ('TFP_OLS', 'ROA', 'Treat_time', 'Size', 'Lev', 'TobinQ', 'Board', 'Indb',
+                                       'Top1', 'Age', 'GDP', 'SOE') if c in df.columns])
+
+        # 3. 填补缺失值 (简单的均值填补，仅供参考)
+        # 注意：严谨的研究应该用插值法或直接剔除
+        print("Handling missing values...")
+        for col in fill_cols:
+            if col in df.columns:
+                df[col] = df[col].fillna(df[col].mean())
+        s.output(df)
+    return df
+
+
+# 5. 逐个被解释变量回归，返回 {被解释变量: 回归结果}
+def run_regressions(df, controls=controls, dep_vars=dep_vars, cov_type='HC1'):
+    results = {}
+    for dep, title in dep_vars.items():
+        formula = f"{dep} ~ Treat_time + {controls}"
+        print(f"\n=== {title} ===")
+        print(f"Formula: {formula}")
+
+        with instrument.step(f'ols {dep}', kind='estimate', rows_in=len(df)) as s:
+            try:
+                model = ols(formula, data=df).fit(cov_type=cov_type) # 使用稳健标准误
+                print(model.summary())
+                results[dep] = model
+                s.rows_out = int(model.nobs)
+            except Exception as e:
+                print(f"Error in {dep} regression: {e}")
+                s.details['error'] = str(e)
+    return results
+
+
+# 把公式里的控制变量拆成 hdfe 的解释变量列表
+# C(x) 中 x 已被固定效应吸收的直接去掉，否则展开为虚拟变量 (首个类别为基准组)
+def fe_design(df, controls, absorb):
+    absorbed = {c for a in absorb for c in ([a] if isinstance(a, str) else a)}
+    df = df.copy()
+    xs = ['Treat_time']
+    for term in controls.split('+'):
+        term = term.strip()
+        if term.startswith('C(') and term.endswith(')'):
+            var = term[2:-1]
+            if var in absorbed:
+                continue
+            dummies = pd.get_dummies(df[var], prefix=var, drop_first=True, dtype='float64')
+            dummies = dummies.where(df[var].notna())
+            df = pd.concat([df, dummies], axis=1)
+            xs += list(dummies.columns)
+        elif term:
+            xs.append(term)
+    return df, xs
+
+
+# 5b. 固定效应模型 (企业 + 年份固定效应，聚类标准误)
+def run_fe_regressions(df, controls=controls, dep_vars=dep_vars, absorb=fe_absorb, cluster=fe_cluster):
+    data, xs = fe_design(df, controls, absorb)
+    results = {}
+    for dep, title in dep_vars.items():
+        print(f"\n=== {title} (fixed effects) ===")
+        with instrument.step(f'fe {dep}', kind='estimate', rows_in=len(data)) as s:
+            try:
+                res = fit_hdfe(data, dep, xs, absorb=absorb, cluster=cluster)
+                print(res.summary())
+                results[dep] = res
+                s.rows_out = int(res.nobs)
+            except Exception as e:
+                print(f"Error in {dep} FE regression: {e}")
+                s.details['error'] = str(e)
+    return results
+
+
+# 5c. 稳健性检验表：所有 被解释变量 x 控制变量组 x 子样本 一次跑完 (见 spec_grid.py)
+def run_robustness(df, dep_vars=dep_vars, control_sets=robustness_controls, samples=robustness_samples):
+    grid = SpecGrid(deps=list(dep_vars), control_sets=control_sets, samples=samples)
+    print(f"\n=== Robustness grid ({grid.size()} specifications) ===")
+    with instrument.step('robustness', kind='estimate', rows_in=len(df)) as s:
+        try:
+            table = run_grid(df, grid)
+        except Exception as e:
+            print(f"Error in robustness grid: {e}")
+            s.details['error'] = str(e)
+            return None
+        s.details['specifications'] = grid.size()
+    print(table.to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+    return table
+
+
+# 5d. 野聚类自助法 p 值与置信区间 (聚类数少时替代 HC1 / 聚类标准误的 t 检验，见 wild_bootstrap.py)
+def run_wild_bootstrap(df, controls=controls, dep_vars=dep_vars, clusters=bootstrap_clusters,
+                       reps=bootstrap_reps, weights=bootstrap_weights):
+    results = {}
+    for cluster in clusters:
+        if cluster not in df.columns:
+            continue
+        for dep, title in dep_vars.items():
+            print(f"\n=== {title} (wild cluster bootstrap by {cluster}) ===")
+            with instrument.step(f'bootstrap {dep} by {cluster}', kind='estimate', rows_in=len(df)) as s:
+                try:
+                    res = wild_cluster_bootstrap(df, dep, controls, cluster=cluster, reps=reps, weights=weights)
+                    print(res.summary())
+                    results[(dep, cluster)] = res
+                    s.rows_out = res.nobs
+                except Exception as e:
+                    print(f"Error in {dep} bootstrap: {e}")
+                    s.details['error'] = str(e)
+    return results
+
+
+# 5e. 样本区间稳定性：所有起止年份组合的 Treat_time 系数 (年份固定效应 + 控制变量，经典标准误)
+# df 为不按 min_year 截断的全部年份
+def run_window_sweep(df, controls=controls, dep_vars=dep_vars, min_years=sweep_min_years, output_path=sweep_path):
+    with instrument.step('window sweep', kind='estimate', rows_in=len(df)) as s:
+        table = sweep_windows(df, list(dep_vars), controls, min_years=min_years)
+        s.details['windows'] = int(table[['start', 'end']].drop_duplicates().shape[0])
+    print(f"\n=== Sample window sweep ({s.details['windows']} windows, at least {min_years} years) ===")
+    print(stability_summary(table).to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+    for dep in dep_vars:
+        if not (table['dep'] == dep).any():
+            continue
+        print(f"\nTreat_time coefficient on {dep} (rows: start year, columns: end year)")
+        print(stability_grid(table, dep).to_string(float_format=lambda v: f"{v:.3f}"))
+    if output_path:
+        table.to_csv(output_path, index=False, encoding='utf-8-sig')
+        print(f"Window sweep saved to {output_path}")
+    return table
+
+
+# 清洗阶段输出的可空整数 / category 列转成 patsy 能处理的普通类型
+def plain_types(final):
+    df = final.copy()
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(str).where(df[col].notna())
+        elif pd.api.types.is_extension_array_dtype(df[col].dtype) and pd.api.types.is_numeric_dtype(df[col].dtype):
+            df[col] = df[col].astype('float64')
+    return df
+
+
+# 清洗结果 + TFP 结果在内存中合并 (流水线中的回归、因果分析阶段共用)
+# final_data 中没有 TFP 列时，按 (Stkcd, Year) 从 TFP 结果补上
+def merge_tfp(final, tfp):
+    df = plain_types(final)
+    tfp_cols = [c for c in tfp.columns if c not in df.columns]
+    if tfp_cols:
+        with instrument.step('merge tfp', kind='merge', rows_in=len(df)) as s:
+            df['Stkcd'] = df['Stkcd'].astype(str)
+            tfp = tfp[['Stkcd', 'Year'] + tfp_cols].assign(Stkcd=tfp['Stkcd'].astype(str), Year=tfp['Year'].astype('int64'))
+            df = df.assign(Year=df['Year'].astype('int64'))
+            s.match('tfp', df, tfp)
+            df = s.output(pd.merge(df, tfp, on=['Stkcd', 'Year'], how='left'))
+    return df
+
+
+# 流水线中的回归阶段
+def regression_stage(final, tfp, min_year=min_year, controls=controls, dep_vars=dep_vars, absorb=None, cluster=fe_cluster):
+    df = merge_tfp(final, tfp)
+    df = prepare_sample(df, min_year=min_year)
+    results = run_regressions(df, controls=controls, dep_vars=dep_vars)
+    if absorb:
+        fe = run_fe_regressions(df, controls=controls, dep_vars=dep_vars, absorb=absorb, cluster=cluster)
+        results.update({f"{dep}_FE": res for dep, res in fe.items()})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Baseline, fixed-effect and robustness regressions.")
+    parser.add_argument('--sweep', action='store_true', help="only run the sample window sweep")
+    args = parser.parse_args()
+
+    instrument.start_run('regression', report_path=report_path)
+    if args.sweep:
+        print(f"Reading data from {file_path} (all years)...")
+        with instrument.step('load', kind='load') as s:
+            df = s.output(plain_types(read_panel(file_path, columns=regression_columns())))
+        df = prepare_sample(df, min_year=int(df['Year'].min()))
+        run_window_sweep(df, output_path=sweep_path)
+        instrument.finish_run()
+        return
+
+    print(f"Reading data from {file_path}...")
+    with instrument.step('load', kind='load') as s:
+        df = s.output(plain_types(read_panel(file_path, columns=regression_columns(), min_year=min_year)))
+    df = prepare_sample(df)
+    run_regressions(df)
+    if fe_absorb:
+        run_fe_regressions(df)
+    run_robustness(df)
+    run_wild_bootstrap(df)
+    instrument.finish_run()
+    print("\nRegression analysis completed.")
+
+
+if __name__ == "__main__":
+    main()
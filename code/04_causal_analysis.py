@@ -0,0 +1,83 @@
+import pandas as pd
+import os
+import importlib
+from causal_ml import dml_plr, causal_forest, heterogeneity, ml_controls, het_vars
+from panel_store import read_panel
+import instrument
+
+# 第 5、6 章：双重机器学习 (DML) 与因果森林 (实现见 causal_ml.py / forest.py)
+# 1. 读取数据 (与 03_regression.py 相同的 final_data 数据集)
+file_path = r"D:\SHLT\cqgs\cqbylw\data\final_data"
+# TFP 结果 (02_calculate_tfp.py 的输出)：final_data 中没有 TFP 列，单独运行本脚本时从这里按 (Stkcd, Year) 补上
+tfp_path = os.path.join(r"D:\SHLT\cqgs\cqbylw\data", "tfp_result")
+output_path = os.path.join(r"D:\SHLT\cqgs\cqbylw\data", "cate_result.csv")
+report_path = os.path.join(r"D:\SHLT\cqgs\cqbylw\data", "run_report_causal.json")
+
+regression = importlib.import_module("03_regression")
+
+# 被解释变量 / 处理变量
+outcome = 'TFP_OLS'
+treatment = 'Treat_time'
+# 交叉拟合折数、每个辅助森林的树数、因果森林的树数
+n_folds = 5
+nuisance_trees = 100
+forest_trees = 500
+
+
+# DML + 因果森林 + 异质性分组，返回 (DMLResult, CausalForestResult, 分组表)
+def causal_analysis(df, outcome=outcome, treatment=treatment, n_folds=n_folds,
+                    nuisance_trees=nuisance_trees, forest_trees=forest_trees, max_workers=None):
+    print(f"\n=== DML: {outcome} ~ {treatment} ===")
+    with instrument.step('dml', kind='estimate', rows_in=len(df)) as s:
+        dml = dml_plr(df, y=outcome, treat=treatment, n_folds=n_folds, n_trees=nuisance_trees, max_workers=max_workers)
+        s.rows_out = dml.n_obs
+    print(dml.summary())
+
+    print("\n=== Causal forest ===")
+    with instrument.step('causal forest', kind='estimate', rows_in=dml.n_obs) as s:
+        cf = causal_forest(df, dml, n_trees=forest_trees, max_workers=max_workers)
+        s.null_shares(pd.DataFrame({'CATE': cf.cate.loc[dml.rows]}))
+    print(cf.summary())
+
+    print("\n=== Heterogeneous effects ===")
+    with instrument.step('heterogeneity', kind='estimate') as s:
+        table = s.output(heterogeneity(df, cf, dml))
+    print(table.to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+    return dml, cf, table
+
+
+# 流水线中的因果分析阶段
+def causal_stage(final, tfp, min_year=regression.min_year, **kwargs):
+    df = regression.prepare_sample(regression.merge_tfp(final, tfp), min_year=min_year)
+    dml, cf, table = causal_analysis(df, **kwargs)
+    return {'dml': dml, 'cate': df[['Stkcd', 'Year']].assign(CATE=cf.cate), 'heterogeneity': table}
+
+
+def main():
+    instrument.start_run('causal', report_path=report_path)
+    print(f"Reading data from {file_path}...")
+    with instrument.step('load', kind='load') as s:
+        # TFP 被解释变量只在 tfp_result 中 (final_data 里没有)
+        columns = [c for c in regression.regression_columns() + [treatment] + ml_controls + het_vars if c != outcome]
+        final = read_panel(file_path, columns=columns, min_year=regression.min_year)
+        if os.path.isdir(tfp_path):
+            tfp = read_panel(tfp_path, columns=['Stkcd', 'Year', outcome], min_year=regression.min_year)
+            df = s.output(regression.merge_tfp(final, tfp))
+        else:
+            df = s.output(regression.plain_types(final))
+    for col in (outcome, treatment):
+        if col not in df.columns:
+            raise KeyError(f"{col} not found in {file_path} or {tfp_path}; run 02_calculate_tfp.py first "
+                           f"(or run_pipeline.py causal)")
+    df = regression.prepare_sample(df)
+    dml, cf, table = causal_analysis(df)
+
+    print(f"Saving CATE to {output_path}...")
+    df[['Stkcd', 'Year']].assign(CATE=cf.cate).to_csv(output_path, index=False, encoding='utf-8-sig')
+    instrument.finish_run()
+    print("\nCausal analysis completed.")
+
+
+# Windows 下进程池需要 main 保护
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,41 @@
 import os
-import shutil
+import argparse
+from result_store import ResultStore
 
+# 归档实验结果 (见 result_store.py)：每次保存为一个新版本，不覆盖以前的版本，也不移动 data 下的文件
+#   python archive_old_results.py -m "baseline, Year >= 2016"     # 保存当前结果
+#   python archive_old_results.py --list                           # 列出全部版本
+#   python archive_old_results.py --checkout 20250101-120000       # 恢复某个版本到 data 目录
+#   python archive_old_results.py --import-dir archive_v1 -m "archive_v1"   # 把旧的归档文件夹导入为一个版本
 data_dir = r"D:\SHLT\cqgs\cqbylw\data"
-archive_dir = os.path.join(data_dir, "archive_v1")
 
-files_to_archive = ["final_data.csv", "tfp_result.csv", "实证结果报告.md"]
+# final_data / tfp_result 是按年份分区的数据集目录，CSV 为导出副本
+files_to_archive = ["final_data", "tfp_result", "final_data.csv", "tfp_result.csv", "实证结果报告.md"]
 
-for file in files_to_archive:
-    src = os.path.join(data_dir, file)
-    if os.path.exists(src):
-        dst = os.path.join(archive_dir, file)
-        try:
-            shutil.move(src, dst)
-            print(f"Archived {file} to {dst}")
-        except Exception as e:
-            print(f"Error archiving {file}: {e}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Versioned, deduplicated archive of pipeline results.")
+    parser.add_argument('-m', '--message', default='', help="description of this version")
+    parser.add_argument('--list', action='store_true', help="list saved versions")
+    parser.add_argument('--checkout', metavar='VERSION', help="restore a saved version")
+    parser.add_argument('--dest', default=data_dir, help="target folder for --checkout")
+    parser.add_argument('--import-dir', metavar='DIR', help="archive every file in DIR (relative to the data folder)")
+    args = parser.parse_args()
+
+    store = ResultStore()
+    if args.list:
+        for v in store.versions():
+            print(f"{v['id']}  {v['created']}  {v['bytes'] / 1024 ** 2:8.1f} MB  "
+                  f"(+{v['stored_bytes'] / 1024 ** 2:.2f} MB)  {v['message']}")
+        print(f"Store size on disk: {store.disk_usage() / 1024 ** 2:.1f} MB")
+    elif args.checkout:
+        store.checkout(args.checkout, args.dest)
+    elif args.import_dir:
+        base = os.path.join(data_dir, args.import_dir)
+        store.snapshot(base, sorted(os.listdir(base)), message=args.message or args.import_dir, inputs={})
     else:
-        print(f"{file} not found, skipping.")
+        store.snapshot(data_dir, files_to_archive, message=args.message)
+
+
+if __name__ == "__main__":
+    main()
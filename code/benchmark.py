@@ -0,0 +1,642 @@
+import pandas as pd
+import numpy as np
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import zipfile
+import argparse
+import platform
+import tempfile
+import warnings
+import importlib
+import contextlib
+import subprocess
+from dataclasses import dataclass
+from xml.sax.saxutils import escape
+from csmar_cache import repo_root
+from csmar_catalog import load_catalog
+from instrument import current_rss, cpu_times, cpu_scope, memory_scope, PeakSampler
+
+# 性能基准测试 (合成数据)
+# 真实的 CSMAR 数据不能外传，这里按真实表的 文件名、目录、字段代码、三行表头 (字段代码 / 中文名 / 单位)
+# 生成合成的 xlsx，规模为当前企业-年度数 (base_firm_years) 的 1 倍、10 倍、100 倍，
+# 然后按阶段运行 01_data_cleaning.py、02_calculate_tfp.py、03_regression.py 的各个函数：
+#   clean.load / clean.merge / clean.variables
+#   tfp.load / tfp.merge / tfp.variables / tfp.estimation / tfp.industry
+#   regression.sample / regression.ols / regression.fe / regression.robustness
+# 记录每个阶段的耗时 (墙钟、CPU) 和内存峰值 (后台线程每隔几毫秒采样一次常驻内存 RSS)，
+# CPU 和内存都包括子进程 (进程池)，能统计的范围见 instrument.py，写在结果的 meta 中 (cpu_scope / memory_scope)；
+# 结果写入 JSON，并与保存的基准结果比较，变慢或内存增加超过 regression_tolerance 的阶段标出来；
+# 还没有基准时，第一次运行的结果自动保存为基准 (基准与机器有关，不进版本库)。
+# 每次运行使用临时的缓存目录 (CSMAR_CACHE_DIR)，读取阶段测的是解析 Excel 的时间，不会命中已有缓存。
+#
+# 用法：
+#   python benchmark.py                         # 1x、10x、100x 全部运行 (100x 需要较长时间)；第一次运行保存为基准
+#   python benchmark.py --scale 1               # 只运行 1x
+#   python benchmark.py --scale 1 --save-baseline   # 把本次结果保存为基准 (按规模合并到已有基准中)
+#   python benchmark.py --no-memory             # 不采样内存
+
+# 合成数据放在缓存目录下 (不进版本库)，本次结果和基准放在 data/benchmark 下 (也不进版本库)
+synthetic_dir = os.path.join(repo_root, "data", ".cache", "benchmark")
+bench_dir = os.path.join(repo_root, "data", "benchmark")
+results_path = os.path.join(bench_dir, "results.json")
+baseline_path = os.path.join(bench_dir, "baseline.json")
+
+# 当前真实数据的企业-年度数 (final_data.csv 的行数) 和年份范围
+base_firm_years = 23645
+years = list(range(2020, 2025))
+default_scales = [1, 10, 100]
+
+# 比基准慢 / 内存多 20% 以上，且绝对差值超过下限 (避免计时噪声) 时判定为退化
+regression_tolerance = 0.2
+min_time_delta = 0.05           # 秒
+min_memory_delta = 8.0          # MB
+
+# 生成规则改变时加 1，已生成的合成数据会重新生成
+generator_version = 2
+
+# 证监会行业代码及其权重 (制造业为主，与真实样本的行业分布大致相同)
+industries = ['C39', 'C35', 'C26', 'C38', 'I65', 'C27', 'C34', 'C36', 'C29', 'C30',
+              'C40', 'C33', 'K70', 'F51', 'D44', 'G54', 'I64', 'E48', 'A01', 'B06']
+industry_weights = np.array([12, 8, 7, 7, 7, 6, 4, 4, 3, 3, 3, 3, 3, 3, 3, 2, 2, 2, 1, 1], dtype='float64')
+
+provinces = ['北京市', '上海市', '广东省', '浙江省', '江苏省', '山东省', '四川省', '湖北省', '福建省', '安徽省',
+             '湖南省', '河南省', '河北省', '辽宁省', '陕西省', '重庆市', '天津市', '江西省', '云南省', '广西壮族自治区']
+cities_per_province = 12
+
+quarter_ends = ['03-31', '06-30', '09-30', '12-31']
+
+
+# 一张合成表：所在目录、文件名、生成函数 (面板 -> 以字段代码为列名的 DataFrame)、中文字段名、单位
+@dataclass
+class SynthTable:
+    folder: str
+    file: str
+    build: object
+    labels: dict
+    units: dict = None            # 字段代码 -> 单位；None 表示每列都是 "没有单位"
+    blank_units: bool = False     # 单位行只填 units 中给出的列，其余留空 (如 BDT_ManaGovAbil)
+    shared_strings: bool = False  # 文本写成共享字符串 (CG_Ybasic)，其余表为内联字符串
+
+
+# 1. 合成面板：企业层面特征 + 企业-年度变量
+def synthetic_panel(scale, seed=0):
+    rng = np.random.default_rng(seed)
+    n_firms = int(np.ceil(base_firm_years * scale / len(years)))
+    n_years = len(years)
+
+    firm = pd.DataFrame({
+        'code': [f"{i:06d}" for i in range(1, n_firms + 1)],
+        'name': [f"企业{i}" for i in range(1, n_firms + 1)],
+        'industry': rng.choice(industries, n_firms, p=industry_weights / industry_weights.sum()),
+        'soe': rng.random(n_firms) < 0.3,
+        'established': pd.to_datetime('1980-01-01') + pd.to_timedelta(rng.integers(0, 35 * 365, n_firms), unit='D'),
+        'province': rng.integers(0, len(provinces), n_firms),
+        'city': rng.integers(0, cities_per_province, n_firms),
+        'tfp': rng.normal(0, 0.3, n_firms),
+        'digital': rng.normal(0, 1, n_firms),
+    })
+
+    idx = np.repeat(np.arange(n_firms), n_years)
+    panel = firm.iloc[idx].reset_index(drop=True)
+    panel['year'] = np.tile(years, n_firms)
+    n = len(panel)
+
+    # 生产函数 lnY = 0.05 lnL + 0.10 lnK + 0.80 lnM + tfp，数字化转型对 TFP 有小的正效应
+    panel['lnL'] = rng.normal(7.5, 1.2, n)
+    panel['lnK'] = 20.5 + 0.8 * (panel['lnL'] - 7.5) + rng.normal(0, 1.0, n)
+    panel['lnM'] = 20.9 + 0.9 * (panel['lnL'] - 7.5) + rng.normal(0, 1.0, n)
+    score = rng.poisson(np.exp(0.5 * panel['digital'] + 0.15 * (panel['year'] - years[0])))
+    panel['digital_score'] = score.astype('float64')
+    panel['lnY'] = (0.6 + 0.05 * panel['lnL'] + 0.10 * panel['lnK'] + 0.80 * panel['lnM'] + panel['tfp']
+                    + 0.03 * (score > 0) + rng.normal(0, 0.15, n))
+    panel['total_assets'] = np.exp(panel['lnK'] + 0.9 + rng.normal(0, 0.3, n))
+    panel['lev'] = rng.beta(2, 3, n)
+    panel['roa'] = rng.normal(0.03, 0.06, n)
+    panel['grow'] = rng.normal(0.05, 0.8, n)
+    panel['top1'] = rng.uniform(5, 70, n).round(2)
+    panel['board'] = rng.integers(5, 16, n).astype('float64')
+    panel['indb'] = rng.uniform(33, 50, n).round(2)
+    panel['duality'] = (rng.random(n) < 0.3).astype('float64')
+    panel['tobin_q'] = np.exp(rng.normal(0.6, 0.5, n))
+    return panel
+
+
+# 每张表独立地随机缺 5% 的企业-年度，合并时会丢行，与真实数据一样
+def _sample(panel, seed, share=0.95):
+    keep = np.random.default_rng(seed).random(len(panel)) < share
+    return panel[keep]
+
+
+# 按季度展开 (CSMAR 财务报表一个年度有多期)；with_opening 加上年初 01-01 一期，parent 加上 12-31 的母公司报表 (B)
+def _periods(panel, quarters=quarter_ends, with_opening=False, parent=False):
+    parts = []
+    suffixes = (['01-01'] if with_opening else []) + list(quarters)
+    for q, suffix in enumerate(suffixes):
+        part = panel.assign(accper=panel['year'].astype(str) + '-' + suffix, typrep='A',
+                            scale=(q + 1) / len(suffixes) if suffix != '01-01' else 1.0)
+        parts.append(part)
+    if parent:
+        parts.append(panel.assign(accper=panel['year'].astype(str) + '-12-31', typrep='B', scale=0.4))
+    out = pd.concat(parts)
+    return out.sort_values(['code', 'accper'], kind='stable')
+
+
+def _dates(panel, suffix='12-31'):
+    return panel['year'].astype(str) + '-' + suffix
+
+
+def _pt_lcmainfin(p):
+    p = _sample(p, 1)
+    return pd.DataFrame({'Symbol': p['code'], 'EndDate': _dates(p), 'TotalAssets': p['total_assets'].round(2)})
+
+
+def _fi_t1(p):
+    p = _periods(_sample(p, 2))
+    return pd.DataFrame({'Stkcd': p['code'], 'ShortName': p['name'], 'Accper': p['accper'],
+                         'Typrep': p['typrep'], 'F011201A': p['lev'].round(6)})
+
+
+def _af_actual(p):
+    p = _sample(p, 3, share=0.65)
+    return pd.DataFrame({'Stkcd': p['code'], 'Ddate': _dates(p), 'ROA': p['roa'].round(6)})
+
+
+def _fi_t8(p):
+    p = _periods(_sample(p, 4))
+    return pd.DataFrame({'Stkcd': p['code'], 'ShortName': p['name'], 'Accper': p['accper'],
+                         'Typrep': p['typrep'], 'Source': 0.0, 'F081202B': p['grow'].round(6)})
+
+
+def _equity(p):
+    p = _sample(p, 5)
+    n = len(p)
+    return pd.DataFrame({'Symbol': p['code'], 'ShortName': p['name'], 'EndDate': _dates(p),
+                         'RegisterAddress': (p['province'].map(dict(enumerate(provinces)))
+                                             + p['province'].map(lambda i: provinces[i][:2])
+                                             + (p['city'] + 1).astype(str) + '市某区某路'),
+                         'LargestHolderRate': p['top1'],
+                         'EquityNature': np.where(p['soe'], '国企', '民营'),
+                         'EquityNatureID': np.where(p['soe'], '1', '2'),
+                         'Seperation': np.zeros(n)})
+
+
+def _governance(p):
+    p = _sample(p, 6)
+    return pd.DataFrame({'Symbol': p['code'], 'ShortName': p['name'], 'Enddate': _dates(p),
+                         'IndustryCode': p['industry'], 'IndustryName': p['industry'] + '行业',
+                         'PropertyRightsNature': p['soe'].astype('float64'),
+                         'Boardsize': p['board'], 'IndDirectorRatio': p['indb'], 'IsCocurP': p['duality'],
+                         'StaffNumber': np.exp(p['lnL']).round()})
+
+
+def _base_info(p):
+    p = _sample(p, 7, share=0.99)
+    return pd.DataFrame({'Symbol': p['code'], 'ShortName': p['name'], 'EndDate': _dates(p),
+                         'IndustryName': p['industry'] + '行业', 'IndustryCode': p['industry'],
+                         'EstablishDate': p['established'].dt.strftime('%Y-%m-%d')})
+
+
+# control_data_new 下另一份同名的基本信息表 (没有行业代码)，用来检查按 hint 选文件的逻辑
+def _base_info_old(p):
+    p = _sample(p, 8, share=0.99)
+    return pd.DataFrame({'Symbol': p['code'], 'ShortName': p['name'], 'EndDate': _dates(p),
+                         'EstablishDate': p['established'].dt.strftime('%Y-%m-%d')})
+
+
+def _digital(p):
+    p = _sample(p, 9, share=0.99)
+    return pd.DataFrame({'SgnYear': p['year'].astype(str), 'Symbol': p['code'],
+                         'AITechnology': np.floor(p['digital_score'] / 3), 'CloudComputing': np.floor(p['digital_score'] / 4),
+                         'DigitalTechApplication': p['digital_score'],
+                         'IndustryCode': p['industry'], 'IndustryName': p['industry'] + '行业'})
+
+
+def _fi_t10(p):
+    p = _periods(_sample(p, 10))
+    return pd.DataFrame({'Stkcd': p['code'], 'ShortName': p['name'], 'Accper': p['accper'],
+                         'Typrep': p['typrep'], 'F100901A': p['tobin_q'].round(6)})
+
+
+# 利润表、现金流量表、资产负债表：年初 + 四个季度的合并报表，再加年末母公司报表
+def _statement(p, seed, code, log_col):
+    p = _periods(_sample(p, seed), with_opening=True, parent=True)
+    return pd.DataFrame({'Stkcd': p['code'], 'ShortName': p['name'], 'Accper': p['accper'],
+                         'Typrep': p['typrep'], code: (np.exp(p[log_col]) * p['scale']).round(2)})
+
+
+def _cg_ybasic(p):
+    p = _sample(p, 14)
+    return pd.DataFrame({'Stkcd': p['code'], 'Reptdt': _dates(p), 'Y0601b': np.exp(p['lnL']).round()})
+
+
+def _city_gdp(p):
+    rows = [(str(y), f"{provinces[i][:2]}{j + 1}市", f"{(i + 11) * 10000 + (j + 1) * 100}", provinces[i])
+            for y in years for i in range(len(provinces)) for j in range(cities_per_province)]
+    df = pd.DataFrame(rows, columns=['Sgnyea', 'Ctnm', 'Ctnm_id', 'Prvcnm'])
+    df['Gdpct01'] = np.random.default_rng(15).lognormal(8, 0.8, len(df)).round(2)
+    return df
+
+
+def _prov_gdp(p):
+    rows = [(str(y), f"{(i + 11) * 10000}", provinces[i]) for y in years for i in range(len(provinces))]
+    df = pd.DataFrame(rows, columns=['Sgnyea', 'Prvcnm_id', 'Prvcnm'])
+    df['Gdp0101'] = np.random.default_rng(16).lognormal(10, 0.6, len(df)).round(2)
+    return df
+
+
+code_labels = {'Symbol': '证券代码', 'Stkcd': '证券代码', 'ShortName': '证券简称', 'Accper': '统计截止日期',
+               'Typrep': '报表类型', 'EndDate': '统计截止日期', 'Enddate': '统计截止日期', 'IndustryCode': '行业代码',
+               'IndustryName': '行业名称'}
+
+synthetic_tables = [
+    SynthTable('control_data_new/上市公司主要财务指标152908890', 'PT_LCMAINFIN.xlsx', _pt_lcmainfin,
+               dict(code_labels, TotalAssets='总资产'), units={'TotalAssets': '元'}),
+    SynthTable('control_data_new/偿债能力161242198', 'FI_T1.xlsx', _fi_t1,
+               dict(code_labels, F011201A='资产负债率')),
+    SynthTable('control_data_new/226实际指标文件160900502', 'AF_Actual.xlsx', _af_actual,
+               dict(code_labels, Ddate='报告期间', ROA='总资产收益率')),
+    SynthTable('control_data_new/发展能力161518529', 'FI_T8.xlsx', _fi_t8,
+               dict(code_labels, Source='公告来源', F081202B='营业利润增长率B')),
+    SynthTable('中国上市公司股权性质文件144138690', 'EN_EquityNatureAll.xlsx', _equity,
+               dict(code_labels, RegisterAddress='注册地址', LargestHolderRate='第一大股东持股比率(%)',
+                    EquityNature='股权性质', EquityNatureID='股权性质编码', Seperation='两权分离率(%)')),
+    SynthTable('管理层治理能力152948875', 'BDT_ManaGovAbil.xlsx', _governance,
+               dict(code_labels, PropertyRightsNature='产权性质', Boardsize='董事会规模', IndDirectorRatio='独立董事占比',
+                    IsCocurP='两职合一', StaffNumber='员工人数'),
+               units={'Boardsize': '人', 'IndDirectorRatio': '%', 'StaffNumber': '人'}, blank_units=True),
+    SynthTable('control_data_new/226上市公司基本信息年度表162619177', 'STK_LISTEDCOINFOANL.xlsx', _base_info,
+               dict(code_labels, EstablishDate='公司成立日期')),
+    SynthTable('control_data_new/226上市公司基本信息年度表160546322', 'STK_LISTEDCOINFOANL.xlsx', _base_info_old,
+               dict(code_labels, EstablishDate='公司成立日期')),
+    SynthTable('上市公司数字化转型程度(年)140823112', 'DM_ListedCoDigTrsDegreeY.xlsx', _digital,
+               dict(code_labels, SgnYear='统计年度', AITechnology='人工智能技术', CloudComputing='云计算技术',
+                    DigitalTechApplication='数字技术应用'),
+               units={'AITechnology': '次', 'CloudComputing': '次', 'DigitalTechApplication': '次'}, blank_units=True),
+    SynthTable('control_data_new/相对价值指标142624897', 'FI_T10.xlsx', _fi_t10,
+               dict(code_labels, F100901A='托宾Q值A')),
+    SynthTable('tfp_data/226利润表133904769', 'FS_Comins.xlsx', lambda p: _statement(p, 11, 'B001101000', 'lnY'),
+               dict(code_labels, B001101000='营业收入'), units={'B001101000': '元'}),
+    SynthTable('tfp_data/226现金流量表(直接法)134129681', 'FS_Comscfd.xlsx', lambda p: _statement(p, 12, 'C001014000', 'lnM'),
+               dict(code_labels, C001014000='购买商品、接受劳务支付的现金'), units={'C001014000': '元'}),
+    SynthTable('tfp_data/226资产负债表110235546', 'FS_Combas.xlsx', lambda p: _statement(p, 13, 'A001212000', 'lnK'),
+               dict(code_labels, A001212000='固定资产净额'), units={'A001212000': '元'}),
+    SynthTable('tfp_data/226治理综合信息文件142353163', 'CG_Ybasic.xlsx', _cg_ybasic,
+               dict(code_labels, Reptdt='统计截止日期', Y0601b='员工人数'), units={'Y0601b': '个'},
+               shared_strings=True),
+    SynthTable('yzx_data/226分城市国内生产总值163432395', 'CRE_Gdpct.xlsx', _city_gdp,
+               {'Sgnyea': '年度标识', 'Ctnm': '城市名称', 'Ctnm_id': '城市代码', 'Prvcnm': '省份名称', 'Gdpct01': '国内生产总值'},
+               units={'Gdpct01': '亿元'}),
+    SynthTable('yzx_data/226分省份国内生产总值163304242', 'CRE_Gdp01.xlsx', _prov_gdp,
+               {'Sgnyea': '年度标识', 'Prvcnm_id': '省份编码', 'Prvcnm': '省份名称', 'Gdp0101': '地区生产总值'},
+               units={'Gdp0101': '亿元'}),
+]
+
+
+# 2. 写 xlsx：直接流式写出 sheet XML (openpyxl 逐个单元格写 100x 规模的表太慢)
+xlsx_content_types = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '{shared}</Types>'
+)
+xlsx_shared_type = ('<Override PartName="/xl/sharedStrings.xml" '
+                    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>')
+xlsx_root_rels = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/></Relationships>'
+)
+xlsx_workbook = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="sheet1" sheetId="1" r:id="rId1"/></sheets></workbook>'
+)
+xlsx_workbook_rels = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>{shared}</Relationships>'
+)
+xlsx_shared_rel = ('<Relationship Id="rId2" '
+                   'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings" '
+                   'Target="sharedStrings.xml"/>')
+
+
+def _column_letters(n):
+    letters = []
+    for i in range(n):
+        s, i = '', i + 1
+        while i:
+            i, r = divmod(i - 1, 26)
+            s = chr(65 + r) + s
+        letters.append(s)
+    return letters
+
+
+# 一列值 -> 该列每行的单元格 XML (缺失值不写单元格)
+def _cells(values, letter, first_row, shared):
+    rows = range(first_row, first_row + len(values))
+    if pd.api.types.is_numeric_dtype(values.dtype):
+        is_int = pd.api.types.is_integer_dtype(values.dtype)
+        return [f'<c r="{letter}{r}"><v>{int(v) if is_int else repr(float(v))}</v></c>' if v == v else ''
+                for r, v in zip(rows, values.tolist())]
+    if shared is not None:
+        return [f'<c r="{letter}{r}" t="s"><v>{shared.setdefault(v, len(shared))}</v></c>' if v is not None else ''
+                for r, v in zip(rows, values.tolist())]
+    return [f'<c r="{letter}{r}" t="inlineStr"><is><t>{escape(v)}</t></is></c>' if v is not None else ''
+            for r, v in zip(rows, values.astype(object).where(values.notna(), None).tolist())]
+
+
+def write_xlsx(path, df, labels, units=None, blank_units=False, shared_strings=False, chunk_rows=50000):
+    columns = list(df.columns)
+    letters = _column_letters(len(columns))
+    if blank_units:
+        unit_row = [(units or {}).get(c) for c in columns]
+    else:
+        unit_row = [(units or {}).get(c, '没有单位') for c in columns]
+    head = pd.DataFrame([columns, [labels.get(c, c) for c in columns], unit_row], columns=columns, dtype=object)
+
+    shared = {} if shared_strings else None
+    with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+        with zf.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as f:
+            f.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                    b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+            for start, part in [(1, head)] + [(4 + i, df.iloc[i:i + chunk_rows]) for i in range(0, len(df), chunk_rows)]:
+                cols = [_cells(part[c].where(part[c].notna(), None) if part[c].dtype == object else part[c],
+                               letter, start, shared) for c, letter in zip(columns, letters)]
+                text = ''.join(f'<row r="{start + i}">' + ''.join(cells) + '</row>' for i, cells in enumerate(zip(*cols)))
+                f.write(text.encode('utf-8'))
+            f.write(b'</sheetData></worksheet>')
+        if shared is not None:
+            items = ''.join(f'<si><t>{escape(str(s))}</t></si>' for s in shared)
+            zf.writestr('xl/sharedStrings.xml',
+                        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                        f'<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+                        f'count="{len(shared)}" uniqueCount="{len(shared)}">{items}</sst>')
+        zf.writestr('[Content_Types].xml', xlsx_content_types.format(shared=xlsx_shared_type if shared is not None else ''))
+        zf.writestr('_rels/.rels', xlsx_root_rels)
+        zf.writestr('xl/workbook.xml', xlsx_workbook)
+        zf.writestr('xl/_rels/workbook.xml.rels',
+                    xlsx_workbook_rels.format(shared=xlsx_shared_rel if shared is not None else ''))
+
+
+# 生成 (或复用) 某个规模的合成数据目录，返回根目录
+def ensure_synthetic(scale, seed=0, regenerate=False):
+    root = os.path.join(synthetic_dir, f"scale_{scale}x")
+    manifest_path = os.path.join(root, "manifest.json")
+    manifest = {"version": generator_version, "seed": seed, "scale": scale,
+                "tables": [os.path.join(t.folder, t.file) for t in synthetic_tables]}
+    if not regenerate and os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        if {k: saved.get(k) for k in manifest} == manifest:
+            return root, saved
+
+    print(f"Generating synthetic CSMAR data ({scale}x) in {root}...")
+    shutil.rmtree(root, ignore_errors=True)
+    start = time.perf_counter()
+    panel = synthetic_panel(scale, seed)
+    rows = {}
+    for table in synthetic_tables:
+        folder = os.path.join(root, *table.folder.split('/'))
+        os.makedirs(folder, exist_ok=True)
+        df = table.build(panel)
+        write_xlsx(os.path.join(folder, table.file), df, table.labels, table.units,
+                   blank_units=table.blank_units, shared_strings=table.shared_strings)
+        rows[os.path.join(table.folder, table.file)] = len(df)
+        print(f"  {table.file}: {len(df)} rows")
+    manifest.update(firm_years=len(panel), rows=rows, generate_s=round(time.perf_counter() - start, 2))
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    return root, manifest
+
+
+# 3. 按阶段计时、记录内存峰值
+class StageTimer:
+    def __init__(self, track_memory=True, verbose=False):
+        self.track_memory = track_memory and current_rss() is not None
+        self.verbose = verbose
+        self.stages = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        record = {}
+        out = io.StringIO()
+        redirect = contextlib.nullcontext() if self.verbose else contextlib.redirect_stdout(out)
+        sampler = PeakSampler() if self.track_memory else contextlib.nullcontext()
+        wall, (cpu, cpu_children) = time.perf_counter(), cpu_times()
+        with redirect, sampler:
+            yield record
+        record['wall_s'] = round(time.perf_counter() - wall, 4)
+        own, children = cpu_times()
+        record['cpu_s'] = round(own - cpu + children - cpu_children, 4)
+        if self.track_memory:
+            record['peak_mb'] = round(sampler.peak / 1024 ** 2, 2)
+        self.stages[name] = record
+        mem = f", peak {record['peak_mb']:.1f} MB" if 'peak_mb' in record else ''
+        rows = f", {record['rows']} rows" if 'rows' in record else ''
+        print(f"  {name:<22} {record['wall_s']:8.2f} s{mem}{rows}")
+
+
+# 控制变量中整列缺失的项去掉 (如目前合并不上的 GDP)，否则回归样本为空，测不到回归本身的耗时
+def available_controls(df, controls):
+    terms = [t.strip() for t in controls.split('+') if t.strip()]
+    keep = [t for t in terms if (t[2:-1] if t.startswith('C(') else t) in df.columns
+            and df[t[2:-1] if t.startswith('C(') else t].notna().any()]
+    return " + ".join(keep)
+
+
+def run_stages(root, timer, min_year=2016):
+    cleaning = importlib.import_module("01_data_cleaning")
+    tfp = importlib.import_module("02_calculate_tfp")
+    regression = importlib.import_module("03_regression")
+
+    # 01_data_cleaning.py
+    with timer.stage('clean.load') as r:
+        tables = cleaning.load_sources(load_catalog(root))
+        r['rows'] = sum(len(t) for t in tables.values() if isinstance(t, pd.DataFrame))
+    with timer.stage('clean.merge') as r:
+        final = cleaning.merge_panel(tables)
+        r['rows'] = len(final)
+    with timer.stage('clean.variables') as r:
+        final = cleaning.build_variables(final)
+        r['rows'] = len(final)
+    del tables
+
+    # 02_calculate_tfp.py
+    with timer.stage('tfp.load') as r:
+        tables = tfp.load_sources(load_catalog(os.path.join(root, 'tfp_data')))
+        r['rows'] = sum(len(t) for t in tables.values())
+    with timer.stage('tfp.merge') as r:
+        df = tfp.merge_inputs(tables)
+        r['rows'] = len(df)
+    with timer.stage('tfp.variables') as r:
+        df = tfp.preprocess(df)
+        r['rows'] = len(df)
+    with timer.stage('tfp.estimation') as r:
+        df = tfp.estimate_tfp(df)
+        r['rows'] = len(df)
+    with timer.stage('tfp.industry') as r:
+        df = tfp.estimate_tfp_grouped(df, tfp.load_industry(root), mode=tfp.group_mode or 'industry',
+                                      period=tfp.group_period)
+        r['rows'] = len(df)
+    tfp_result = tfp.select_output(df)
+    del tables, df
+
+    # 03_regression.py
+    with timer.stage('regression.sample') as r:
+        df = regression.prepare_sample(regression.merge_tfp(final, tfp_result), min_year=min_year)
+        r['rows'] = len(df)
+    controls = available_controls(df, regression.controls)
+    control_sets = {name: available_controls(df, c) for name, c in regression.robustness_controls.items()}
+    with timer.stage('regression.ols') as r:
+        regression.run_regressions(df, controls=controls)
+    with timer.stage('regression.fe') as r:
+        regression.run_fe_regressions(df, controls=controls)
+    with timer.stage('regression.robustness') as r:
+        r['rows'] = len(regression.run_robustness(df, control_sets=control_sets))
+
+
+# 运行一个规模的基准测试，返回该规模的结果
+def run_benchmark(scale, track_memory=True, verbose=False, regenerate=False):
+    root, manifest = ensure_synthetic(scale, regenerate=regenerate)
+    print(f"\nBenchmark {scale}x ({manifest['firm_years']} firm-years):")
+
+    # 临时缓存目录：每次都从解析 Excel 开始，也不影响真实数据的缓存
+    cache_dir = tempfile.mkdtemp(prefix="csmar_bench_")
+    old_env = os.environ.get("CSMAR_CACHE_DIR")
+    os.environ["CSMAR_CACHE_DIR"] = cache_dir
+    timer = StageTimer(track_memory=track_memory, verbose=verbose)
+    start = time.perf_counter()
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            run_stages(root, timer)
+    finally:
+        if old_env is None:
+            os.environ.pop("CSMAR_CACHE_DIR", None)
+        else:
+            os.environ["CSMAR_CACHE_DIR"] = old_env
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    total = time.perf_counter() - start
+    print(f"  {'total':<22} {total:8.2f} s")
+    return {'firm_years': manifest['firm_years'], 'total_s': round(total, 4), 'stages': timer.stages}
+
+
+def environment_info(track_memory):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=repo_root,
+                                capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit': commit, 'python': platform.python_version(),
+            'pandas': pd.__version__, 'numpy': np.__version__, 'platform': platform.platform(),
+            'cpu_count': os.cpu_count(), 'track_memory': track_memory, 'cpu_scope': cpu_scope(),
+            'memory_scope': memory_scope() if track_memory else None}
+
+
+# 4. 与基准比较：返回每个 (规模, 阶段, 指标) 一行的表，regression 列标出退化
+def compare(current, baseline, tolerance=regression_tolerance):
+    rows = []
+    floors = {'wall_s': min_time_delta, 'peak_mb': min_memory_delta}
+    for scale, run in current['runs'].items():
+        base_run = baseline.get('runs', {}).get(scale)
+        if base_run is None:
+            continue
+        for stage, record in run['stages'].items():
+            base = base_run['stages'].get(stage)
+            if base is None:
+                continue
+            for metric, floor in floors.items():
+                if metric not in record or metric not in base:
+                    continue
+                old, new = base[metric], record[metric]
+                ratio = new / old if old > 0 else np.nan
+                rows.append({'scale': scale, 'stage': stage, 'metric': metric, 'baseline': old, 'current': new,
+                             'ratio': ratio, 'regression': new - old > floor and new > old * (1 + tolerance)})
+    return pd.DataFrame(rows, columns=['scale', 'stage', 'metric', 'baseline', 'current', 'ratio', 'regression'])
+
+
+def _load_json(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the data pipeline on synthetic CSMAR-shaped data.")
+    parser.add_argument('--scale', nargs='+', type=int, default=default_scales, help="multiples of the real firm-year count")
+    parser.add_argument('--output', default=results_path, help="where to write the results JSON")
+    parser.add_argument('--baseline', default=baseline_path, help="baseline results to compare against")
+    parser.add_argument('--save-baseline', action='store_true', help="store this run as the baseline")
+    parser.add_argument('--tolerance', type=float, default=regression_tolerance, help="allowed slowdown (0.2 = 20%%)")
+    parser.add_argument('--no-memory', action='store_true', help="do not sample memory")
+    parser.add_argument('--regenerate', action='store_true', help="regenerate the synthetic workbooks")
+    parser.add_argument('--verbose', action='store_true', help="show the scripts' own output")
+    args = parser.parse_args()
+
+    track_memory = not args.no_memory
+    results = {'meta': environment_info(track_memory), 'runs': {}}
+    for scale in args.scale:
+        results['runs'][str(scale)] = run_benchmark(scale, track_memory=track_memory, verbose=args.verbose,
+                                                    regenerate=args.regenerate)
+    _save_json(args.output, results)
+    print(f"\nResults saved to {args.output}")
+
+    baseline = _load_json(args.baseline)
+    if args.save_baseline:
+        merged = baseline or {'runs': {}}
+        merged['meta'] = results['meta']
+        merged['runs'].update(results['runs'])
+        _save_json(args.baseline, merged)
+        print(f"Baseline updated: {args.baseline}")
+        return 0
+    if baseline is None:
+        _save_json(args.baseline, results)
+        print(f"No baseline yet, this run saved as the baseline: {args.baseline}")
+        return 0
+    base_meta = baseline.get('meta', {})
+    if base_meta.get('track_memory') != track_memory:
+        print("Note: baseline and current run differ in memory tracking; timings are not directly comparable.")
+    for scope in ('cpu_scope', 'memory_scope'):
+        if base_meta.get(scope) != results['meta'][scope]:
+            print(f"Note: baseline {scope} is {base_meta.get(scope)!r}, this run is {results['meta'][scope]!r}; "
+                  f"the numbers are not directly comparable (use --save-baseline to refresh it).")
+
+    table = compare(results, baseline, tolerance=args.tolerance)
+    if table.empty:
+        print("Nothing to compare (no common scales / stages with the baseline).")
+        return 0
+    print("\nComparison with baseline:")
+    print(table.to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+    flagged = table[table['regression']]
+    if flagged.empty:
+        print("\nNo regressions.")
+        return 0
+    print(f"\n{len(flagged)} regression(s) beyond {args.tolerance:.0%}:")
+    for row in flagged.itertuples():
+        print(f"  {row.scale}x {row.stage} {row.metric}: {row.baseline:.3f} -> {row.current:.3f} ({row.ratio:.2f}x)")
+    return 1
+
+
+# Windows 下进程池需要 main 保护
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,198 @@
+import pandas as pd
+import numpy as np
+import os
+from dataclasses import dataclass
+from scipy import stats
+from forest import ForestParams, bin_features, run_forest_jobs, seed_chunks
+
+# 双重机器学习 (DML) 与因果森林
+# 论文第 5、6 章的核心方法 (见 论文大纲.md)：
+#   dml_plr()：部分线性模型 Y = theta*T + g(X) + e，T = m(X) + v。
+#       E[Y|X]、E[T|X] 用随机森林估计，K 折交叉拟合 (按企业分折，同一企业的各年份在同一折)，
+#       2K 个森林 (每折 Y、T 各一个) 在进程池中并行训练，特征矩阵放在共享内存中；
+#       theta = sum(T~ * Y~) / sum(T~^2)，标准误按企业聚类。
+#   causal_forest()：在 DML 的残差 (Y~, T~) 上训练诚实因果森林 (grf 做法)，得到每个企业-年度的
+#       条件处理效应 CATE (袋外预测)，树分批在进程池中并行生长。
+#   heterogeneity()：按 规模 (Size 四分位)、产权性质 (SOE)、行业门类、地区 分组汇总 CATE，
+#       并给出组内 DML 估计及标准误。
+# 树模型见 forest.py，只依赖 numpy。
+#
+# 用法：
+#   dml = dml_plr(df, y='TFP_OLS', treat='Treat_time')
+#   cf = causal_forest(df, dml)
+#   table = heterogeneity(df, cf, dml)
+
+# 估计 E[Y|X]、E[T|X] 时使用的协变量
+ml_controls = ['Size', 'Lev', 'TobinQ', 'Board', 'Indb', 'Top1', 'Age', 'GDP', 'SOE', 'Year', 'IndustryCode']
+# 因果森林的异质性变量 (Province 为企业所在省份，数据中没有这一列时跳过)
+het_vars = ['Size', 'SOE', 'IndustryCode', 'Province', 'Lev', 'Age', 'TobinQ']
+
+
+@dataclass
+class DMLResult:
+    y: str
+    treat: str
+    theta: float
+    se: float
+    n_obs: int
+    n_folds: int
+    n_clusters: int
+    rows: pd.Index            # 参与估计的行 (输入 df 的索引)
+    y_res: np.ndarray         # 交叉拟合残差 Y - E[Y|X]
+    t_res: np.ndarray         # 交叉拟合残差 T - E[T|X]
+
+    @property
+    def pvalue(self):
+        return 2 * stats.norm.sf(abs(self.theta / self.se))
+
+    def summary(self):
+        lo, hi = self.theta - 1.96 * self.se, self.theta + 1.96 * self.se
+        return (f"DML (partially linear, {self.n_folds}-fold cross-fitting): {self.y} on {self.treat}\n"
+                f"  theta = {self.theta:.4f}  (se = {self.se:.4f}, p = {self.pvalue:.4f}, 95% CI [{lo:.4f}, {hi:.4f}])\n"
+                f"  N = {self.n_obs}, clusters = {self.n_clusters}")
+
+
+@dataclass
+class CausalForestResult:
+    cate: pd.Series           # 每个企业-年度的条件处理效应 (袋外预测)，与输入 df 同索引
+    ate: float                # 森林加权的平均处理效应
+    n_trees: int
+    features: list
+
+    def summary(self):
+        c = self.cate.dropna()
+        return (f"Causal forest ({self.n_trees} trees, features: {', '.join(self.features)})\n"
+                f"  CATE mean = {c.mean():.4f}, sd = {c.std():.4f}, "
+                f"quartiles = [{c.quantile(.25):.4f}, {c.median():.4f}, {c.quantile(.75):.4f}]")
+
+
+# 协变量转成浮点矩阵：数值列直接使用，文本 / 类别列 (如 IndustryCode) 编成类别码，缺失保留为 NaN
+def encode_features(df, cols):
+    blocks = []
+    for col in cols:
+        s = df[col]
+        if pd.api.types.is_numeric_dtype(s.dtype) and not isinstance(s.dtype, pd.CategoricalDtype):
+            blocks.append(pd.to_numeric(s, errors='coerce').to_numpy(dtype='float64'))
+        else:
+            codes = pd.Categorical(s.astype(object).where(s.notna())).codes.astype('float64')
+            codes[codes < 0] = np.nan
+            blocks.append(codes)
+    return np.column_stack(blocks)
+
+
+# 按企业分 K 折：同一企业的所有年份在同一折，避免用同一企业的其他年份预测自己
+def group_folds(groups, n_folds, seed=0):
+    codes, uniques = pd.factorize(groups)
+    fold_of_group = np.random.default_rng(seed).permutation(len(uniques)) % n_folds
+    return fold_of_group[codes]
+
+
+# 聚类稳健的 DML 标准误：psi = (Y~ - theta*T~) * T~，V = sum_g (sum_i psi)^2 / (sum T~^2)^2
+def _dml_theta(y_res, t_res, clusters):
+    J = t_res @ t_res
+    theta = (t_res @ y_res) / J
+    psi = (y_res - theta * t_res) * t_res
+    G = clusters.max() + 1
+    s = np.bincount(clusters, weights=psi, minlength=G)
+    se = np.sqrt(s @ s * G / (G - 1)) / J
+    return theta, se
+
+
+def _present(df, cols):
+    missing = [c for c in cols if c not in df.columns]
+    if missing:
+        print(f"Note: columns not in data, skipped: {', '.join(missing)}")
+    return [c for c in cols if c in df.columns]
+
+
+def dml_plr(df, y='TFP_OLS', treat='Treat_time', controls=ml_controls, n_folds=5, n_trees=100,
+            cluster='Stkcd', min_leaf=5, max_workers=None, seed=0):
+    controls = _present(df, controls)
+    data = df[df[y].notna() & df[treat].notna() & df[cluster].notna()]
+    Y = data[y].to_numpy(dtype='float64')
+    T = data[treat].to_numpy(dtype='float64')
+    Xb = bin_features(encode_features(data, controls))
+    folds = group_folds(data[cluster], n_folds, seed)
+    all_rows = np.arange(len(data))
+
+    # 每折两个任务：E[Y|X]、E[T|X]，在其余各折上训练、在本折上预测
+    params = ForestParams(kind='regression', min_leaf=min_leaf)
+    jobs, slots = [], []
+    for k in range(n_folds):
+        train, test = all_rows[folds != k], all_rows[folds == k]
+        for target in ('Y', 'T'):
+            seeds = seed_chunks(n_trees, 1, seed=seed * 1000 + k * 2 + (target == 'T'))[0]
+            jobs.append((train, test, params, seeds, target))
+            slots.append((target, test))
+
+    print(f"DML: fitting {len(jobs)} nuisance forests ({n_trees} trees each, {len(controls)} controls)...")
+    results = run_forest_jobs({'X': Xb, 'Y': Y, 'T': T}, jobs, max_workers=max_workers)
+    fitted = {'Y': np.full(len(data), np.nan), 'T': np.full(len(data), np.nan)}
+    for (target, test), (num, den) in zip(slots, results):
+        fitted[target][test] = num / np.where(den > 0, den, np.nan)
+
+    y_res, t_res = Y - fitted['Y'], T - fitted['T']
+    ok = np.isfinite(y_res) & np.isfinite(t_res)
+    clusters = pd.factorize(data[cluster].to_numpy()[ok])[0]
+    theta, se = _dml_theta(y_res[ok], t_res[ok], clusters)
+    return DMLResult(y, treat, theta, se, int(ok.sum()), n_folds, int(clusters.max() + 1),
+                     data.index[ok], y_res[ok], t_res[ok])
+
+
+def causal_forest(df, dml, features=het_vars, n_trees=500, min_leaf=5, max_workers=None, seed=0):
+    features = _present(df, features)
+    data = df.loc[dml.rows]
+    Xb = bin_features(encode_features(data, features))
+    all_rows = np.arange(len(data))
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    params = ForestParams(kind='causal', min_leaf=min_leaf, honest=True, oob=True)
+    jobs = [(all_rows, all_rows, params, seeds, 'Y', 'T') for seeds in seed_chunks(n_trees, max_workers * 2, seed)]
+
+    print(f"Causal forest: growing {n_trees} honest trees on {len(data)} observations...")
+    results = run_forest_jobs({'X': Xb, 'Y': dml.y_res, 'T': dml.t_res}, jobs, max_workers=max_workers)
+    num = sum(r[0] for r in results)
+    den = sum(r[1] for r in results)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cate = np.where(den > 0, num / den, np.nan)
+    ate = np.nanmean(cate)
+    return CausalForestResult(pd.Series(cate, index=dml.rows).reindex(df.index), float(ate), n_trees, features)
+
+
+# 异质性分组：{名称: 每行所属组的 Series}
+def default_groups(df):
+    groups = {}
+    if 'Size' in df.columns:
+        groups['Size quartile'] = pd.qcut(df['Size'], 4, labels=['Q1 (small)', 'Q2', 'Q3', 'Q4 (large)'])
+    if 'SOE' in df.columns:
+        groups['SOE'] = df['SOE'].map({1: 'SOE', 0: 'non-SOE', 1.0: 'SOE', 0.0: 'non-SOE'})
+    if 'IndustryCode' in df.columns:
+        groups['Industry'] = df['IndustryCode'].astype(object).where(df['IndustryCode'].notna()).str[0]
+    if 'Province' in df.columns:
+        groups['Region'] = df['Province']
+    return groups
+
+
+# 分组汇总：组内平均 CATE，以及组内 DML 估计 (用同一套交叉拟合残差) 及其聚类标准误
+def heterogeneity(df, cf, dml, groups=None, cluster='Stkcd', min_obs=30):
+    if groups is None:
+        groups = default_groups(df)
+    rows = dml.rows
+    cate = cf.cate.loc[rows].to_numpy()
+    firms = df.loc[rows, cluster].to_numpy()
+    out = []
+    for dim, labels in groups.items():
+        labels = labels.loc[rows]
+        for level in labels.dropna().unique():
+            m = (labels == level).to_numpy()
+            if m.sum() < min_obs:
+                continue
+            clusters = pd.factorize(firms[m])[0]
+            theta, se = _dml_theta(dml.y_res[m], dml.t_res[m], clusters)
+            out.append({'dimension': dim, 'group': level, 'N': int(m.sum()),
+                        'CATE_mean': np.nanmean(cate[m]), 'DML_theta': theta, 'DML_se': se,
+                        'p': 2 * stats.norm.sf(abs(theta / se)) if se > 0 else np.nan})
+    # 没有组达到 min_obs 时返回有列名的空表
+    table = pd.DataFrame(out, columns=['dimension', 'group', 'N', 'CATE_mean', 'DML_theta', 'DML_se', 'p'])
+    return table.sort_values(['dimension', 'group'], kind='stable').reset_index(drop=True)
@@ -0,0 +1,304 @@
+import pandas as pd
+import os
+import json
+import time
+import hashlib
+from contextlib import contextmanager
+from csmar_zip import is_member, member_fingerprint, source_exists, source_stat
+
+# CSMAR Excel 读取缓存
+# 第一次读取某个 xlsx 时把结果转成列式文件 (Parquet) 存在 data/.cache 下，
+# 之后只要文件没变 (路径、大小、修改时间、内容哈希一致) 就直接读缓存，不再解析 Excel 的 XML。
+#
+# 用法：
+#   from csmar_cache import read_excel_cached
+#   df = read_excel_cached(pt_file)   # 与 pd.read_excel(pt_file) 返回相同的 DataFrame
+#   df = read_cached(pt_file, read_csmar_xlsx, columns=[...])   # 其他读取函数的结果同样可以缓存
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PYARROW = True
+except ImportError:
+    # 没装 pyarrow 时退回 pickle 格式，功能一样，只是文件大一些
+    HAS_PYARROW = False
+
+# 默认缓存目录：仓库根目录下的 data/.cache/excel
+# 设置环境变量 CSMAR_CACHE_DIR 可以把全部缓存 (Excel、目录索引) 改放到别处，子进程同样生效
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def cache_root():
+    return os.environ.get("CSMAR_CACHE_DIR") or os.path.join(repo_root, "data", ".cache")
+
+
+def default_cache_dir():
+    return os.path.join(cache_root(), "excel")
+
+
+# 缓存总大小上限 (字节)，超出后按最近使用时间淘汰最旧的条目
+max_cache_bytes = 2 * 1024 ** 3
+
+# CSMAR 表头下面通常有两行说明 (中文字段名、单位)，最多检查前几行
+header_scan_rows = 3
+
+index_name = "index.json"
+
+# 索引文件锁：进程池里的多个进程同时读表时，依次 读取-合并-写回 index.json；
+# 超过这个时间 (秒) 仍未释放的锁视为持有者已异常退出留下的，直接删除
+lock_timeout = 60
+
+
+# 辅助函数：计算文件内容哈希 (分块读取，避免一次把大文件读进内存)
+def file_hash(path, chunk_size=1024 * 1024):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# 源文件的内容指纹：zip 包里的成员直接用中央目录中的 CRC32 (见 csmar_zip.py)，不需要解压
+def source_hash(path):
+    return member_fingerprint(path) if is_member(path) else file_hash(path)
+
+
+def _load_index(cache_dir):
+    index_path = os.path.join(cache_dir, index_name)
+    if not os.path.exists(index_path):
+        return {}
+    try:
+        with open(index_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        # 索引损坏就当作空缓存重新建
+        return {}
+
+
+def _save_index(cache_dir, index):
+    index_path = os.path.join(cache_dir, index_name)
+    # 临时文件名带进程号，多个进程不会互相覆盖或移走对方的临时文件
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, index_path)
+
+
+# 跨进程的索引锁 (O_CREAT | O_EXCL 创建锁文件，Windows 和 Linux 都可用)
+@contextmanager
+def _index_lock(cache_dir):
+    lock_path = os.path.join(cache_dir, index_name + ".lock")
+    deadline = time.time() + lock_timeout
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > lock_timeout:
+                    os.remove(lock_path)
+                    continue
+            except OSError:
+                continue
+            if time.time() > deadline:
+                raise TimeoutError(f"could not lock {lock_path}")
+            time.sleep(0.01)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        try:
+            os.remove(lock_path)
+        except OSError:
+            pass
+
+
+# 在锁内重新读取索引、用 update(index) 修改后写回 (只改自己的条目，不覆盖其他进程刚写入的条目)
+def _update_index(cache_dir, update):
+    with _index_lock(cache_dir):
+        index = _load_index(cache_dir)
+        update(index)
+        _save_index(cache_dir, index)
+    return index
+
+
+def _entry_key(path, read_kwargs, reader_name="read_excel"):
+    # 缓存条目由 "绝对路径 + 读取函数 + 读取参数" 唯一确定 (pd.read_excel 的键保持原来的写法)
+    raw = os.path.abspath(path) + "|" + repr(sorted(read_kwargs.items()))
+    if reader_name != "read_excel":
+        raw += "|" + reader_name
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20]
+
+
+# 把 CSMAR 的混合列拆成 "数值列 + 表头文字"
+# pd.read_excel 读出来的列常常是：前两行是中文字段名/单位 (字符串)，下面全是数字。
+# Parquet 不能存这种混合类型，所以把前几行的字符串单独记下来，列本身按数值存储；
+# 读缓存时再把这些字符串放回去，保证和 pd.read_excel 的结果完全一致。
+def _to_columnar(df):
+    df = df.copy()
+    header_cells = {}
+    for col in df.columns:
+        s = df[col]
+        if s.dtype != object:
+            continue
+        is_str = s.map(lambda v: isinstance(v, str))
+        if not is_str.any() or is_str.all():
+            continue
+        str_pos = [i for i, flag in enumerate(is_str.values) if flag]
+        rest = s[~is_str].dropna()
+        if max(str_pos) < header_scan_rows and rest.map(lambda v: isinstance(v, (int, float))).all():
+            header_cells[str(col)] = {str(i): s.iloc[i] for i in str_pos}
+            df[col] = pd.to_numeric(s.where(~is_str), errors="coerce")
+        elif max(str_pos) < header_scan_rows and rest.map(lambda v: isinstance(v, pd.Timestamp)).all():
+            header_cells[str(col)] = {str(i): s.iloc[i] for i in str_pos}
+            df[col] = pd.to_datetime(s.where(~is_str))
+        else:
+            # 真正的混合列 (数据里夹着文字)，只能按字符串存，缺失值保持为空
+            df[col] = s.map(lambda v: v if pd.isna(v) else str(v)).astype(object)
+    return df, header_cells
+
+
+def _from_columnar(df, header_cells):
+    for col, cells in header_cells.items():
+        if col not in df.columns:
+            continue
+        s = df[col].astype(object)
+        for pos, value in cells.items():
+            s.iloc[int(pos)] = value
+        df[col] = s
+    return df
+
+
+# 先写到本进程的临时文件再改名，中断的运行或同一键上的并行写入不会留下写了一半的缓存文件
+def _write_entry(df, data_path):
+    tmp_path = f"{data_path}.{os.getpid()}.tmp"
+    try:
+        if HAS_PYARROW:
+            df.to_parquet(tmp_path, index=False)
+        else:
+            df.to_pickle(tmp_path)
+        os.replace(tmp_path, data_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _read_entry(data_path):
+    if HAS_PYARROW:
+        return pd.read_parquet(data_path)
+    return pd.read_pickle(data_path)
+
+
+# 按最近使用时间淘汰条目，直到缓存总大小不超过上限；同时清理源文件已经不存在的条目
+def evict(cache_dir=None, max_bytes=None, index=None):
+    cache_dir = cache_dir or default_cache_dir()
+    max_bytes = max_cache_bytes if max_bytes is None else max_bytes
+    if index is None:
+        if not os.path.isdir(cache_dir):
+            return {}
+        return _update_index(cache_dir, lambda idx: evict(cache_dir, max_bytes, index=idx))
+
+    for key in list(index.keys()):
+        entry = index[key]
+        data_path = os.path.join(cache_dir, entry["data_file"])
+        if not source_exists(entry["source"]) or not os.path.exists(data_path):
+            if os.path.exists(data_path):
+                os.remove(data_path)
+            del index[key]
+
+    total = sum(entry.get("cache_bytes", 0) for entry in index.values())
+    for key in sorted(index, key=lambda k: index[k].get("last_used", 0)):
+        if total <= max_bytes:
+            break
+        entry = index.pop(key)
+        data_path = os.path.join(cache_dir, entry["data_file"])
+        if os.path.exists(data_path):
+            os.remove(data_path)
+        total -= entry.get("cache_bytes", 0)
+    return index
+
+
+# 清空整个缓存
+def clear_cache(cache_dir=None):
+    cache_dir = cache_dir or default_cache_dir()
+    if not os.path.isdir(cache_dir):
+        return
+    for name in os.listdir(cache_dir):
+        os.remove(os.path.join(cache_dir, name))
+
+
+# 带缓存的 pd.read_excel
+# 判断缓存是否有效的顺序：
+#   1. 大小和修改时间都没变 -> 直接用缓存 (不重新算哈希，最快)
+#   2. 大小或修改时间变了，但内容哈希没变 (比如文件被复制/touch 过) -> 更新记录后用缓存
+#   3. 内容变了 -> 重新解析 Excel 并覆盖缓存
+def read_excel_cached(path, cache_dir=None, **read_kwargs):
+    return read_cached(path, pd.read_excel, cache_dir=cache_dir, **read_kwargs)
+
+
+# 带缓存的任意读取函数 reader(path, **read_kwargs)
+def read_cached(path, reader, cache_dir=None, **read_kwargs):
+    cache_dir = cache_dir or default_cache_dir()
+    os.makedirs(cache_dir, exist_ok=True)
+
+    path = os.path.abspath(path)
+    size, mtime = source_stat(path)
+    reader_name = "read_excel" if reader is pd.read_excel else f"{reader.__module__}.{reader.__qualname__}"
+    key = _entry_key(path, read_kwargs, reader_name)
+    index = _load_index(cache_dir)
+    entry = index.get(key)
+
+    content_hash = None
+    if entry is not None:
+        data_path = os.path.join(cache_dir, entry["data_file"])
+        fresh = os.path.exists(data_path)
+        if fresh and (entry["size"] != size or entry["mtime"] != mtime):
+            content_hash = source_hash(path)
+            fresh = content_hash == entry["hash"]
+        if fresh:
+            try:
+                df = _from_columnar(_read_entry(data_path), entry.get("header_cells", {}))
+            except Exception as e:
+                print(f"Warning: cache entry for {path} is unreadable ({e}), re-reading Excel.")
+            else:
+                def touch(idx):
+                    if key in idx:
+                        idx[key].update(size=size, mtime=mtime, last_used=time.time())
+                _update_index(cache_dir, touch)
+                return df
+
+    # 缓存未命中：解析 Excel 并写入缓存
+    df = reader(path, **read_kwargs)
+    if content_hash is None:
+        content_hash = source_hash(path)
+
+    data_file = key + (".parquet" if HAS_PYARROW else ".pkl")
+    data_path = os.path.join(cache_dir, data_file)
+    try:
+        columnar, header_cells = _to_columnar(df)
+        _write_entry(columnar, data_path)
+    except Exception as e:
+        # 写缓存失败不影响本次读取
+        print(f"Warning: could not cache {path}: {e}")
+        return df
+
+    entry = {
+        "source": path,
+        "reader": reader_name,
+        "read_kwargs": repr(sorted(read_kwargs.items())),
+        "size": size,
+        "mtime": mtime,
+        "hash": content_hash,
+        "data_file": data_file,
+        "header_cells": header_cells,
+        "cache_bytes": os.path.getsize(data_path),
+        "last_used": time.time(),
+    }
+
+    def add(idx):
+        idx[key] = entry
+        evict(cache_dir, index=idx)
+    _update_index(cache_dir, add)
+    return df
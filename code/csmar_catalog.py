@@ -0,0 +1,245 @@
+import os
+import re
+import json
+import hashlib
+import zipfile
+from csmar_cache import cache_root
+from csmar_zip import zip_members, member_path, read_member_text, split_member, is_member
+
+# CSMAR 数据目录索引
+# 只扫描一次数据根目录，按文件名 (如 FI_T1.xlsx、CRE_Gdpct.xlsx) 建立 "表名 -> 路径" 索引，
+# 同时解析同目录下的 [DES][xlsx].txt 字段说明。索引保存成 JSON，下次运行时只重新扫描
+# 修改时间变了的目录 (目录里新增/删除文件时，目录本身的 mtime 会变)。
+#
+# 用法：
+#   from csmar_catalog import load_catalog
+#   catalog = load_catalog(base_path)
+#   fi_t1_file = catalog.find("FI_T1.xlsx")              # O(1) 字典查找，找不到返回 None
+#   info_file = catalog.find("STK_LISTEDCOINFOANL.xlsx", hint="162619177")  # 同名文件有多份时用 hint 指定
+#   catalog.schema("FI_T1.xlsx")                          # {'F011201A': ('资产负债率', '...'), ...}
+#
+# CSMAR 下载的 zip 包也会被索引：包里的表登记为 "<zip 路径>::<成员名>" (见 csmar_zip.py)，可以直接读取。
+# 同一份下载既有 zip 又有解压出的文件夹 (xxx123.zip 和 xxx123/ 在同一目录) 时，只保留 zip 里的那份，
+# 解压出的副本可以删掉。
+
+# 需要建索引的数据文件类型
+table_exts = (".xlsx", ".xls", ".csv")
+
+# 同一张表既在 zip 包里、又有解压出的副本时，使用 zip 包里的 (设为 False 则使用解压出的文件)
+prefer_zip = True
+
+# 索引格式改变时加 1，旧索引整体重新扫描
+catalog_version = 2
+
+# 扫描时跳过的目录
+skip_dirs = {".git", ".cache", "__pycache__", ".trae"}
+
+# 字段说明文件名形如 FI_T1[DES][xlsx].txt
+des_pattern = re.compile(r"^(?P<stem>.+)\[DES\]\[(?P<fmt>\w+)\]\.txt$")
+# 字段说明的每一行形如 "F011201A [资产负债率] - 计算公式..."
+des_line_pattern = re.compile(r"^\s*(?P<code>\S+)\s*\[(?P<label>[^\]]*)\]\s*(?:-\s*(?P<desc>.*))?$")
+
+
+# 同名表有多份、又没有给出 hint 时抛出，避免悄悄选中其中一份
+class DuplicateTableError(LookupError):
+    pass
+
+
+# 解析 [DES][xlsx].txt：返回 {字段代码: (中文名, 说明)}
+def parse_des_file(path):
+    if is_member(path):
+        lines = read_member_text(path).splitlines()
+    else:
+        with open(path, "r", encoding="utf-8-sig", errors="replace") as f:
+            lines = f.read().splitlines()
+    schema = {}
+    for line in lines:
+        m = des_line_pattern.match(line.strip())
+        if m:
+            schema[m.group("code")] = (m.group("label"), (m.group("desc") or "").strip())
+    return schema
+
+
+# zip 包里的表和字段说明：成员登记为 "<zip 文件名>::<成员名>"
+def _scan_zip(path, files, schemas):
+    name = os.path.basename(path)
+    for member in zip_members(path):
+        base = member.rsplit("/", 1)[-1]
+        m = des_pattern.match(base)
+        if m:
+            schemas[m.group("stem")] = parse_des_file(member_path(path, member))
+        elif base.lower().endswith(table_exts) and not base.startswith("~$"):
+            files.append(member_path(name, member))
+
+
+# 扫描单个目录 (不递归)，返回该目录的文件列表、子目录列表和字段说明
+def _scan_dir(path):
+    files, subdirs, schemas, zips = [], [], {}, {}
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name not in skip_dirs:
+                    subdirs.append(entry.name)
+                continue
+            name = entry.name
+            if name.startswith("~$"):
+                # Excel 打开文件时生成的锁文件
+                continue
+            m = des_pattern.match(name)
+            if m:
+                schemas[m.group("stem")] = parse_des_file(entry.path)
+            elif name.lower().endswith(table_exts):
+                files.append(name)
+            elif name.lower().endswith(".zip"):
+                stat = entry.stat()
+                zips[name] = [stat.st_size, stat.st_mtime]
+                try:
+                    _scan_zip(entry.path, files, schemas)
+                except (OSError, zipfile.BadZipFile) as e:
+                    print(f"Warning: cannot read {entry.path}: {e}")
+    return {"files": sorted(files), "subdirs": sorted(subdirs), "schemas": schemas, "zips": zips}
+
+
+# zip 包的大小或修改时间变了 (原地覆盖下载时目录的 mtime 不一定变)
+def _zips_changed(folder, info):
+    for name, (size, mtime) in info.get("zips", {}).items():
+        try:
+            stat = os.stat(os.path.join(folder, name))
+        except OSError:
+            return True
+        if stat.st_size != size or stat.st_mtime != mtime:
+            return True
+    return False
+
+
+class Catalog:
+    def __init__(self, root, dirs):
+        self.root = os.path.abspath(root)
+        # dirs: {相对目录: {"mtime": ..., "files": [...], "subdirs": [...], "schemas": {...}}}
+        self.dirs = dirs
+        self._build_index()
+
+    def _build_index(self):
+        # 表名 -> [绝对路径, ...]；同时按不带扩展名的表名 (FI_T1) 建一份
+        self.tables = {}
+        self.schemas = {}
+        for rel, info in sorted(self.dirs.items()):
+            folder = os.path.join(self.root, rel) if rel else self.root
+            for name in info["files"]:
+                path = os.path.join(folder, name)
+                # zip 成员按成员的文件名登记
+                table = split_member(name)[1].rsplit("/", 1)[-1] if is_member(name) else name
+                stem = os.path.splitext(table)[0]
+                for key in (table, stem):
+                    self.tables.setdefault(key, []).append(path)
+                if stem in info["schemas"]:
+                    # JSON 读回来的是 list，统一成 tuple
+                    self.schemas[path] = {k: tuple(v) for k, v in info["schemas"][stem].items()}
+        for key, paths in self.tables.items():
+            self.tables[key] = _drop_extracted_copies(paths)
+
+    # 按表名查找文件路径
+    # hint: 路径中必须包含的片段 (如文件夹名或编号)，用来在多份同名文件中选定一份
+    def find(self, name, hint=None):
+        paths = self.tables.get(name, [])
+        if hint is not None:
+            paths = [p for p in paths if hint in p]
+        if not paths:
+            return None
+        if len(set(paths)) > 1:
+            raise DuplicateTableError(
+                f"{name} has {len(paths)} copies, pass hint= to choose one:\n  " + "\n  ".join(paths)
+            )
+        return paths[0]
+
+    # 返回表的所有副本 (不做选择)
+    def find_all(self, name):
+        return list(self.tables.get(name, []))
+
+    # 字段说明：{字段代码: (中文名, 说明)}；没有 DES 文件时返回空字典
+    def schema(self, name, hint=None):
+        path = name if os.path.isabs(name) else self.find(name, hint=hint)
+        return self.schemas.get(path, {})
+
+    # 同名文件出现多次的表：{文件名: [路径, ...]}
+    def duplicates(self):
+        return {
+            name: paths for name, paths in self.tables.items()
+            if len(paths) > 1 and os.path.splitext(name)[1]
+        }
+
+    def report_duplicates(self):
+        dups = self.duplicates()
+        for name, paths in sorted(dups.items()):
+            print(f"Warning: duplicate table {name}:")
+            for p in paths:
+                print(f"  {p}")
+        return dups
+
+
+# 同一份下载的 zip 成员和解压副本只保留一份：
+# 解压副本形如 <目录>/xxx123/FI_T1.xlsx，对应的成员为 <目录>/xxx123.zip::FI_T1.xlsx
+def _drop_extracted_copies(paths):
+    members = {p for p in paths if is_member(p)}
+    if not members or len(paths) == len(members):
+        return paths
+    pairs = {}
+    for p in members:
+        zip_path, member = split_member(p)
+        extracted = os.path.join(os.path.splitext(zip_path)[0], *member.split("/"))
+        if extracted in paths:
+            pairs[p] = extracted
+    drop = set(pairs.values()) if prefer_zip else set(pairs)
+    return [p for p in paths if p not in drop]
+
+
+def _catalog_path(root):
+    key = hashlib.sha1(os.path.abspath(root).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(cache_root(), f"catalog_{key}.json")
+
+
+# 加载 (或增量更新) 数据根目录的索引
+# 已保存的索引里每个目录都记录了 mtime；mtime 没变的目录直接复用上次的文件列表，
+# 只有新增或发生变化的目录才重新列举文件、重新解析字段说明。
+def load_catalog(root, cache_path=None, refresh=False):
+    root = os.path.abspath(root)
+    cache_path = cache_path or _catalog_path(root)
+
+    old_dirs = {}
+    if not refresh and os.path.exists(cache_path):
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+            if saved.get("root") == root and saved.get("version") == catalog_version:
+                old_dirs = saved.get("dirs", {})
+        except (OSError, ValueError):
+            old_dirs = {}
+
+    dirs = {}
+    rescanned = 0
+    stack = [""]
+    while stack:
+        rel = stack.pop()
+        folder = os.path.join(root, rel) if rel else root
+        try:
+            mtime = os.stat(folder).st_mtime
+        except OSError:
+            continue
+        old = old_dirs.get(rel)
+        if old is not None and old["mtime"] == mtime and not _zips_changed(folder, old):
+            info = old
+        else:
+            info = _scan_dir(folder)
+            info["mtime"] = mtime
+            rescanned += 1
+        dirs[rel] = info
+        stack.extend(os.path.join(rel, d) if rel else d for d in info["subdirs"])
+
+    if rescanned or set(dirs) != set(old_dirs):
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = cache_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"root": root, "version": catalog_version, "dirs": dirs}, f, ensure_ascii=False)
+        os.replace(tmp_path, cache_path)
+
+    return Catalog(root, dirs)
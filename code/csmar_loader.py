@@ -0,0 +1,138 @@
+import pandas as pd
+import numpy as np
+import os
+from dataclasses import dataclass, field
+from concurrent.futures import ProcessPoolExecutor
+from csmar_cache import read_cached
+from csmar_xlsx import read_csmar_xlsx
+
+# CSMAR 表读取引擎
+# 每张表都按同样的步骤处理：读取 (只读需要的列，按 filters 筛行，见 csmar_xlsx.py)
+# -> 去掉中文表头/单位行 -> 重命名 -> 解析年份
+# -> 统一证券代码 -> 排序去重。这些步骤由 TableSpec 声明 (见 table_specs.py)，
+# load_tables() 用进程池并行读取所有互相独立的表。
+#
+# 注意：Windows 下进程池使用 spawn 方式启动子进程，调用 load_tables 的脚本
+# 必须放在 if __name__ == "__main__": 之下。
+
+
+@dataclass
+class TableSpec:
+    name: str                     # 结果字典里的键，如 'growth'
+    file: str                     # 文件名，通过 catalog 查找，如 'FI_T8.xlsx'
+    columns: dict                 # 原列名 -> 新列名 (不含证券代码和日期列)
+    stkcd: str = 'Stkcd'          # 原始证券代码列
+    year: str = 'Accper'          # 原始日期列
+    year_format: str = 'date'     # 'date': 形如 2020-12-31 的日期；'year': 已经是年份
+    hint: str = None              # 同名文件有多份时用来选定一份的路径片段
+    dtypes: dict = field(default_factory=dict)  # 新列名 -> dtype，如 {'Lev': 'float64'}
+    derive: object = None         # 可选的派生变量函数 df -> df (必须是模块级函数，便于进程间传递)
+    keep: list = None             # 最终保留的列 (除 Stkcd、Year 外)，默认为 columns 的新列名
+    dedup: bool = True            # 同一 (Stkcd, Year) 保留最后一条
+    filters: dict = None          # 读取时的行过滤，如 {'Typrep': 'A', 'Accper': {'endswith': '12-31'}}
+
+
+# 辅助函数：统一证券代码为6位字符串 (向量化版本)
+# 与逐行的 standardize_stkcd 结果一致：纯数字补零到6位，其他原样保留
+def standardize_stkcd_vec(s):
+    s = s.astype(object).where(s.notna(), 'nan').astype(str).str.strip()
+    is_digit = s.str.isdigit()
+    return s.where(~is_digit, s.str.zfill(6))
+
+
+# 辅助函数：产权性质代码以 1 开头的是国企 (向量化版本)
+def is_soe_vec(s):
+    s = s.astype(object).where(s.notna(), 'nan').astype(str)
+    return s.str.startswith('1').astype('int64')
+
+
+# 解析年份列，无法解析的行返回 NaN
+def parse_year(s, year_format='date'):
+    if year_format == 'year':
+        return pd.to_numeric(s, errors='coerce')
+    return pd.to_datetime(s, errors='coerce').dt.year
+
+
+# 按 spec 清洗一张已经读入内存的原始表
+def clean_table(raw, spec):
+    # 去掉表头下面的中文字段名、单位行 (证券代码不是数字的行)
+    df = raw[pd.to_numeric(raw[spec.stkcd], errors='coerce').notna()]
+
+    missing = [c for c in spec.columns if c not in df.columns]
+    if missing:
+        print(f"Warning: {spec.file} has no column(s) {missing}, skipped.")
+    columns = {c: new for c, new in spec.columns.items() if c in df.columns}
+
+    df = df[[spec.stkcd, spec.year] + list(columns)].rename(
+        columns=dict(columns, **{spec.stkcd: 'Stkcd', spec.year: 'Year'})
+    )
+    df['Year'] = parse_year(df['Year'], spec.year_format)
+    df = df[df['Year'].notna()]
+    df['Year'] = df['Year'].astype('int64')
+    df['Stkcd'] = standardize_stkcd_vec(df['Stkcd'])
+
+    for col, dtype in spec.dtypes.items():
+        if col not in df.columns:
+            continue
+        if np.issubdtype(np.dtype(dtype), np.number):
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype(dtype)
+        else:
+            df[col] = df[col].astype(dtype)
+
+    if spec.derive is not None:
+        df = spec.derive(df)
+
+    if spec.dedup:
+        df = df.sort_values(['Stkcd', 'Year'], kind='stable').drop_duplicates(['Stkcd', 'Year'], keep='last')
+
+    keep = spec.keep if spec.keep is not None else list(columns.values())
+    keep = [c for c in keep if c in df.columns]
+    return df[['Stkcd', 'Year'] + keep].reset_index(drop=True)
+
+
+# spec 需要从文件中读取的列
+def spec_columns(spec):
+    return list(dict.fromkeys([spec.stkcd, spec.year] + list(spec.columns)))
+
+
+# 单张表的完整处理 (在子进程中执行)：只读取需要的列，结果按 (文件, 列, 过滤条件) 缓存
+def load_table(spec, path):
+    raw = read_cached(path, read_csmar_xlsx, columns=spec_columns(spec), filters=spec.filters, key=spec.stkcd)
+    return clean_table(raw, spec)
+
+
+# 一组表对应的源文件路径 (找不到的表跳过)，供流水线计算输入指纹
+def spec_files(specs, catalog):
+    paths = [catalog.find(spec.file, hint=spec.hint) for spec in specs]
+    return [p for p in paths if p is not None]
+
+
+# 并行读取一组表，返回 {spec.name: DataFrame}
+# 找不到文件的表返回空 DataFrame (和原脚本的处理方式一致)
+def load_tables(specs, catalog, max_workers=None):
+    results = {}
+    jobs = []
+    for spec in specs:
+        path = catalog.find(spec.file, hint=spec.hint)
+        if path is None:
+            print(f"Warning: {spec.file} not found!")
+            results[spec.name] = pd.DataFrame()
+        else:
+            jobs.append((spec, path))
+
+    if max_workers is None:
+        max_workers = min(len(jobs), os.cpu_count() or 1)
+
+    if max_workers <= 1 or len(jobs) <= 1:
+        for spec, path in jobs:
+            print(f"Loading {spec.file}...")
+            results[spec.name] = load_table(spec, path)
+    else:
+        print(f"Loading {len(jobs)} tables with {max_workers} processes...")
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = {spec.name: pool.submit(load_table, spec, path) for spec, path in jobs}
+            for name, future in futures.items():
+                results[name] = future.result()
+
+    # 保持和 specs 相同的顺序
+    return {spec.name: results[spec.name] for spec in specs}
@@ -0,0 +1,247 @@
+import pandas as pd
+import re
+import zipfile
+import posixpath
+from csmar_zip import open_source
+from xml.etree.ElementTree import iterparse, parse
+
+# 流式读取 CSMAR xlsx：只取需要的列，边读边过滤行
+# pd.read_excel 会把整张表 (几百列 x 所有报告期) 读进内存，再由调用方挑列、筛行。
+# 这里直接解析 xlsx 里的 sheet XML，逐行处理：
+#   - 列投影：按第一行 (字段代码) 找到需要的列，其他单元格直接跳过，不生成 Python 对象；
+#   - CSMAR 表头：字段代码行下面的 中文字段名行、单位行 ("没有单位") 在读取时识别并跳过；
+#   - 行过滤：如 Accper 以 12-31 结尾 (年报)、Typrep = A (合并报表)，不满足的行不保留。
+# path 也可以是 CSMAR zip 包里的 xlsx ("<zip 路径>::<成员名>"，见 csmar_zip.py)。
+# 峰值内存只和保留的列数、行数有关，与文件宽度无关。
+#
+# 用法：
+#   df = read_csmar_xlsx(path, columns=['Stkcd', 'Accper', 'B001101000'],
+#                        filters={'Typrep': 'A', 'Accper': {'endswith': '12-31'}})
+#
+# filters 的写法 (都是普通数据，便于作为缓存键)：
+#   'A'                      等于
+#   ['A', 'B']               属于其中之一
+#   {'endswith': '12-31'}    以...结尾 (另有 startswith)
+
+ns = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+rel_ns = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+
+unit_marker = '没有单位'
+
+# Excel 内置的日期格式编号
+builtin_date_formats = set(range(14, 23)) | {45, 46, 47}
+
+cell_ref = re.compile(r'([A-Z]+)')
+
+
+def _text(elem):
+    # 富文本单元格的文字分散在多个 <t> 中
+    return ''.join(t.text or '' for t in elem.iter(ns + 't'))
+
+
+def _shared_strings(zf):
+    if 'xl/sharedStrings.xml' not in zf.namelist():
+        return []
+    strings = []
+    with zf.open('xl/sharedStrings.xml') as f:
+        for event, elem in iterparse(f):
+            if elem.tag == ns + 'si':
+                strings.append(_text(elem))
+                elem.clear()
+    return strings
+
+
+# 哪些单元格样式是日期格式 (返回样式编号集合)
+def _date_styles(zf):
+    if 'xl/styles.xml' not in zf.namelist():
+        return set()
+    root = parse(zf.open('xl/styles.xml')).getroot()
+    custom = {}
+    numfmts = root.find(ns + 'numFmts')
+    if numfmts is not None:
+        for fmt in numfmts:
+            code = re.sub(r'"[^"]*"|\[[^\]]*\]', '', fmt.get('formatCode', '')).lower()
+            custom[int(fmt.get('numFmtId'))] = 'y' in code or 'd' in code
+    styles = set()
+    xfs = root.find(ns + 'cellXfs')
+    if xfs is not None:
+        for i, xf in enumerate(xfs):
+            fmt_id = int(xf.get('numFmtId', 0))
+            if fmt_id in builtin_date_formats or custom.get(fmt_id, False):
+                styles.add(str(i))
+    return styles
+
+
+# 第 sheet 个工作表在压缩包中的路径
+def _sheet_path(zf, sheet=0):
+    workbook = parse(zf.open('xl/workbook.xml')).getroot()
+    sheets = workbook.find(ns + 'sheets')
+    target_id = sheets[sheet].get(rel_ns + 'id')
+    rels = parse(zf.open('xl/_rels/workbook.xml.rels')).getroot()
+    for rel in rels:
+        if rel.get('Id') == target_id:
+            target = rel.get('Target')
+            if target.startswith('/'):
+                return target.lstrip('/')
+            return posixpath.normpath(posixpath.join('xl', target))
+    return 'xl/worksheets/sheet1.xml'
+
+
+# 单元格的值：字符串 / 数字 (整数写法的数字返回 int，与 openpyxl 一致) / 日期
+def _cell_value(c, strings, date_styles):
+    t = c.get('t')
+    if t == 'inlineStr':
+        return _text(c)
+    v = c.find(ns + 'v')
+    if v is None or v.text is None:
+        return None
+    text = v.text
+    if t == 's':
+        return strings[int(text)]
+    if t in ('str', 'e'):
+        return text
+    if t == 'b':
+        return text == '1'
+    if c.get('s') in date_styles:
+        return pd.Timestamp('1899-12-30') + pd.to_timedelta(float(text), unit='D')
+    if '.' in text or 'E' in text or 'e' in text:
+        return float(text)
+    return int(text)
+
+
+# 把声明式的过滤条件转成判断函数
+# 日期格式的单元格按 YYYY-MM-DD 文本比较
+def _as_text(v):
+    if isinstance(v, pd.Timestamp):
+        return v.strftime('%Y-%m-%d')
+    return v if isinstance(v, str) else None
+
+
+def _predicate(rule):
+    if isinstance(rule, dict):
+        (op, arg), = rule.items()
+        if op == 'endswith':
+            return lambda v: (_as_text(v) or '').endswith(arg)
+        if op == 'startswith':
+            return lambda v: (_as_text(v) or '').startswith(arg)
+        raise ValueError(f"unknown filter operator: {op}")
+    if isinstance(rule, (list, tuple, set)):
+        allowed = set(rule)
+        return lambda v: v in allowed
+    return lambda v: v == rule
+
+
+def _is_number_like(v):
+    if isinstance(v, (int, float)):
+        return True
+    return isinstance(v, str) and v.strip().replace('.', '', 1).isdigit()
+
+
+# 列字母 <-> 从 0 开始的列号 (A = 0, Z = 25, AA = 26)
+def _col_index(letters):
+    n = 0
+    for ch in letters:
+        n = n * 26 + ord(ch) - 64
+    return n - 1
+
+
+def _col_letters(index):
+    letters = ''
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+# 逐行产出 {列字母: 值}
+# 单元格可以省略 r 属性 (规范允许，部分写出程序如此)，这时按同一行上一个单元格的下一列计算
+# projection 为空集合时解析整行 (用于表头行)，之后调用方往里加入需要的列字母，其余单元格直接跳过
+def _iter_rows(f, strings, date_styles, projection):
+    row_tag, c_tag, data_tag = ns + 'row', ns + 'c', ns + 'sheetData'
+    sheet_data = None
+    for event, elem in iterparse(f, events=('start', 'end')):
+        if event == 'start':
+            if elem.tag == data_tag:
+                sheet_data = elem
+            continue
+        if elem.tag != row_tag:
+            continue
+        row = {}
+        col = -1
+        for c in elem.iter(c_tag):
+            m = cell_ref.match(c.get('r', ''))
+            if m:
+                letters = m.group(1)
+                col = _col_index(letters)
+            else:
+                col += 1
+                letters = _col_letters(col)
+            if not projection or letters in projection:
+                row[letters] = _cell_value(c, strings, date_styles)
+        # 处理完的行从树上删掉，内存不随行数增长
+        if sheet_data is not None:
+            sheet_data.remove(elem)
+        else:
+            elem.clear()
+        yield row
+
+
+def read_csmar_xlsx(path, columns=None, filters=None, key=None, sheet=0):
+    filters = filters or {}
+    with zipfile.ZipFile(open_source(path)) as zf:
+        strings = _shared_strings(zf)
+        date_styles = _date_styles(zf)
+        with zf.open(_sheet_path(zf, sheet)) as f:
+            projection = set()
+            rows = _iter_rows(f, strings, date_styles, projection)
+
+            # 第一行：字段代码 -> 列字母
+            header = next(rows, {})
+            letter_of = {}
+            for letters, name in header.items():
+                if name is not None:
+                    letter_of.setdefault(str(name), letters)
+            # 表里没有的列直接不出现在结果中 (由调用方检查)；过滤条件用到的列缺失时给出提示
+            names = list(letter_of) if columns is None else [c for c in columns if c in letter_of]
+            missing = [c for c in filters if c not in letter_of]
+            if missing:
+                print(f"Warning: {path} has no filter column(s) {missing}, filter ignored.")
+            read_names = names + [c for c in filters if c in letter_of and c not in names]
+            projection.update(letter_of[c] for c in read_names)
+            if not projection:
+                return pd.DataFrame(columns=names)
+
+            # 中文字段名行、单位行：看表头下面的两行
+            head = [r for _, r in zip(range(2), rows)]
+            skip = _label_rows(head, letter_of.get(key or (names[0] if names else None)))
+            checks = [(letter_of[c], _predicate(rule)) for c, rule in filters.items() if c in letter_of]
+
+            data = {c: [] for c in names}
+            letters = [letter_of[c] for c in names]
+
+            def keep(row):
+                if all(pred(row.get(col)) for col, pred in checks):
+                    for name, col in zip(names, letters):
+                        data[name].append(row.get(col))
+
+            for row in head[skip:]:
+                keep(row)
+            for row in rows:
+                keep(row)
+
+    return pd.DataFrame(data, columns=names)
+
+
+# 表头下面需要跳过的行数：
+#   第二行或第三行出现 "没有单位" -> 单位行，它和它上面的中文字段名行都跳过；
+#   否则，第二行的代码列不是数字 (如 "证券代码") -> 只有中文字段名行
+def _label_rows(head, key_letter):
+    for i, row in enumerate(head):
+        if any(v == unit_marker for v in row.values()):
+            return i + 1
+    if head and key_letter is not None:
+        v = head[0].get(key_letter)
+        if isinstance(v, str) and not _is_number_like(v):
+            return 1
+    return 0
@@ -0,0 +1,108 @@
+import os
+import io
+import zipfile
+
+# 直接读取 CSMAR 下载的 zip 包，不需要先解压
+# zip 包里的文件用 "<zip 路径>::<成员名>" 表示 (如 D:\...\yzx_data\226分城市国内生产总值163432395.zip::CRE_Gdpct.xlsx)，
+# 目录索引 (csmar_catalog.py)、读取缓存 (csmar_cache.py)、流水线输入指纹 (pipeline.py) 都把它当作普通路径使用：
+#   - source_stat / member_fingerprint：成员的 (大小, CRC32) 直接取自 zip 的中央目录，不需要解压就能判断内容是否变化；
+#   - open_source：xlsx 成员解压到内存 (只有压缩后的 xlsx 大小)，再由 csmar_xlsx.py 只流式解压需要的工作表，
+#     逐行读取需要的列；
+#   - 成员名没有 UTF-8 标记时按 GBK 解码 (CSMAR 的 zip 在中文 Windows 上打包)。
+#
+# 用法：
+#   for name in zip_members(zip_path): path = member_path(zip_path, name)
+#   df = read_csmar_xlsx(path, columns=[...])       # 与普通 xlsx 路径用法相同
+
+member_sep = '::'
+
+# 已解析的中央目录 (进程内缓存)
+_directories = {}
+max_directories = 64
+
+
+def is_member(path):
+    return member_sep in str(path)
+
+
+def member_path(zip_path, member):
+    return f"{zip_path}{member_sep}{member}"
+
+
+def split_member(path):
+    zip_path, _, member = str(path).partition(member_sep)
+    return zip_path, member
+
+
+def _decode_name(info):
+    if info.flag_bits & 0x800:
+        return info.filename
+    try:
+        return info.filename.encode('cp437').decode('gbk')
+    except (UnicodeEncodeError, UnicodeDecodeError):
+        return info.filename
+
+
+# zip 的中央目录：{成员名: ZipInfo}，按 (路径, 大小, 修改时间) 缓存，同一个 zip 只解析一次
+def _directory(zip_path):
+    stat = os.stat(zip_path)
+    key = (os.path.abspath(zip_path), stat.st_size, stat.st_mtime)
+    if key not in _directories:
+        if len(_directories) >= max_directories:
+            _directories.clear()
+        with zipfile.ZipFile(zip_path) as zf:
+            _directories[key] = {_decode_name(info): info for info in zf.infolist() if not info.is_dir()}
+    return _directories[key]
+
+
+def zip_members(zip_path):
+    return sorted(_directory(zip_path))
+
+
+def member_info(path):
+    zip_path, member = split_member(path)
+    info = _directory(zip_path).get(member)
+    if info is None:
+        raise FileNotFoundError(f"{member} not found in {zip_path}")
+    return info
+
+
+def source_exists(path):
+    if not is_member(path):
+        return os.path.exists(path)
+    try:
+        member_info(path)
+        return True
+    except (OSError, zipfile.BadZipFile):
+        return False
+
+
+# 判断内容是否变化用的 (大小, 修改时间)；zip 成员用 (解压后大小, CRC32)
+def source_stat(path):
+    if not is_member(path):
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime
+    info = member_info(path)
+    return info.file_size, info.CRC
+
+
+# 内容指纹：zip 成员直接用 CRC32 + 大小 (不解压)，普通文件由调用方计算内容哈希
+def member_fingerprint(path):
+    info = member_info(path)
+    return f"crc32:{info.CRC:08x}:{info.file_size}"
+
+
+# 给 zipfile / open() 用的数据源：普通文件返回路径本身，zip 成员返回内存中的字节流
+def open_source(path):
+    if not is_member(path):
+        return path
+    zip_path, member = split_member(path)
+    info = member_info(path)
+    with zipfile.ZipFile(zip_path) as zf:
+        return io.BytesIO(zf.read(info))
+
+
+# 文本成员 (如 [DES][xlsx].txt 字段说明)
+def read_member_text(path, encoding='utf-8-sig'):
+    data = open_source(path).getvalue()
+    return data.decode(encoding, errors='replace')
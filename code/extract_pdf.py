@@ -1,31 +1,37 @@
-import pdfplumber
-import os
+from pdf_extract import extract_pdfs
 
+# 提取 TFP 指标说明 PDF 的全文 (和其中的表格)，写成 Markdown 摘要
+# 提取本身由 pdf_extract.py 完成 (按页缓存，PDF 没变时不再重新解析)；批量提取全部文献用 python pdf_extract.py
 pdf_path = r"d:\SHLT\cqgs\cqbylw\企业全要素生产率（TFP）相关指标.pdf"
 output_path = r"d:\SHLT\cqgs\cqbylw\code\tfp_indicators_summary.md"
 
-try:
+
+def main():
     print(f"Extracting text from {pdf_path}...")
-    with pdfplumber.open(pdf_path) as pdf:
-        text_content = ""
-        for page in pdf.pages:
-            text_content += page.extract_text() + "\n"
-            
-    # Simple keyword extraction (simulated logic as we can't do complex NLP here)
-    # Ideally, we would parse tables if present
-    
+    doc, = extract_pdfs([pdf_path])
+    if doc.error:
+        print(f"Error processing PDF: {doc.error}")
+        # PDF 读取失败 (文件不存在、打不开、没装 pdfplumber) 时写一个占位文件，提示手动检查
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.write("# PDF 读取失败\n请手动检查 PDF 内容。")
+        return
+
     print("Summarizing content...")
-    summary = "# 企业全要素生产率 (TFP) 相关指标梳理\n\n"
-    summary += "## 1. 原文内容提取\n\n"
-    summary += text_content
-    
+    # 逐页写出，不在内存中拼接全文
     with open(output_path, "w", encoding="utf-8") as f:
-        f.write(summary)
-        
+        f.write("# 企业全要素生产率 (TFP) 相关指标梳理\n\n")
+        f.write("## 1. 原文内容提取\n\n")
+        for text in doc.pages():
+            f.write(text + "\n")
+        tables = doc.tables()
+        if tables:
+            f.write("\n## 2. 表格\n")
+            for table in tables:
+                f.write(f"\n第 {table.attrs['page']} 页\n\n")
+                f.write(table.to_csv(index=False, sep='|'))
     print(f"Summary saved to {output_path}")
 
-except Exception as e:
-    print(f"Error processing PDF: {e}")
-    # Fallback: Create a placeholder if PDF reading fails (due to library missing)
-    with open(output_path, "w", encoding="utf-8") as f:
-        f.write("# PDF 读取失败\n请手动检查 PDF 内容。")
+
+# Windows 下进程池需要 main 保护
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+import numpy as np
+import os
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+# 随机森林 / 诚实因果森林的树模型 (只依赖 numpy)
+# 为了在全样本 (约 2.5 万企业-年度) 上跑几百棵树，树的生长做了以下处理：
+#   - 特征先离散化成最多 64 个分位数箱 (uint8)，缺失值单独一箱 (箱 0)，分裂点只在箱之间找；
+#   - 按层生长：同一层所有节点的所有特征的 分箱累加和 用一次 np.bincount 算出，
+#     不按节点写 Python 循环，每棵树只需 (树深) 次向量化运算；
+#   - 因果树按 grf (Athey, Tibshirani & Wager 2019) 的做法：节点内先算处理效应，
+#     再对伪结果 rho 做方差最大化分裂；诚实估计 (honest) 时子样本一半用于分裂、一半用于估计叶子值；
+#   - 多棵树 / 多个交叉拟合的折分批交给进程池，特征矩阵和目标变量放在共享内存里，子进程只读不复制。
+#
+# 一个任务 = (训练行, 预测行, 树的种子列表)，返回每个预测行的 (分子累加, 分母累加)：
+#   回归树：分子 = 各树叶子均值之和，分母 = 树数，预测 = 分子 / 分母；
+#   因果树：分子 = 各树叶子内 sum(w*y)/n 之和，分母 = 叶子内 sum(w*w)/n 之和，tau = 分子 / 分母
+#           (即 grf 的森林权重估计量)。
+
+n_bins = 64
+
+
+@dataclass
+class ForestParams:
+    kind: str = 'regression'      # 'regression' 或 'causal'
+    min_leaf: int = 5
+    max_depth: int = 20
+    mtry: int = None              # 每个节点随机抽取的候选特征数，None 表示 min(p, sqrt(p) + 20)
+    sample_fraction: float = 0.5  # 每棵树不放回抽样的比例
+    honest: bool = False          # 诚实估计：子样本一半分裂、一半估计叶子值
+    oob: bool = False             # 只对没有被该树抽中的行做预测 (袋外预测)
+
+
+# 特征离散化：每列最多 63 个分位数箱 (1..63)，缺失值为 0
+def bin_features(X):
+    n, p = X.shape
+    Xb = np.zeros((n, p), dtype=np.uint8)
+    for j in range(p):
+        col = X[:, j]
+        ok = ~np.isnan(col)
+        values = np.unique(col[ok])
+        if len(values) <= n_bins - 1:
+            cuts = (values[:-1] + values[1:]) / 2
+        else:
+            cuts = np.unique(np.quantile(col[ok], np.linspace(0, 1, n_bins - 1)[1:-1]))
+        Xb[ok, j] = np.searchsorted(cuts, col[ok], side='right') + 1
+    return Xb
+
+
+# 因果树节点内的伪结果 (grf)：rho = (w - w_bar) * ((y - y_bar) - (w - w_bar) * tau_node) / var(w)
+def _causal_pseudo(y, w, loc, A):
+    cnt = np.bincount(loc, minlength=A).astype('float64')
+    cnt[cnt == 0] = 1
+    wc = w - (np.bincount(loc, weights=w, minlength=A) / cnt)[loc]
+    yc = y - (np.bincount(loc, weights=y, minlength=A) / cnt)[loc]
+    sww = np.bincount(loc, weights=wc * wc, minlength=A)
+    swy = np.bincount(loc, weights=wc * yc, minlength=A)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        tau = np.where(sww > 0, swy / sww, 0.0)
+        var_w = sww / cnt
+        rho = wc * (yc - wc * tau[loc]) / var_w[loc]
+    return np.where(np.isfinite(rho), rho, 0.0)
+
+
+# 按层生长一棵树；rows 为用于分裂的行。返回 (feature, threshold, left, right)，feature = -1 为叶子
+# 分裂规则：第 feature 个特征的箱号 <= threshold 进入左子节点
+def grow_tree(Xb, rows, y, w, params, rng):
+    p = Xb.shape[1]
+    B = n_bins
+    mtry = params.mtry or min(p, int(np.ceil(np.sqrt(p))) + 20)
+    capacity = 2 * (len(rows) // max(params.min_leaf, 1)) + 3
+    feature = np.full(capacity, -1, dtype=np.int64)
+    threshold = np.zeros(capacity, dtype=np.int64)
+    left = np.full(capacity, -1, dtype=np.int64)
+    right = np.full(capacity, -1, dtype=np.int64)
+    n_nodes = 1
+
+    Xr = Xb[rows]
+    yr = y[rows]
+    wr = w[rows] if w is not None else None
+    node = np.zeros(len(rows), dtype=np.int64)
+    idx = np.arange(len(rows))
+    open_nodes = np.array([0])
+    feat_offsets = np.arange(p) * B
+
+    for depth in range(params.max_depth):
+        if not len(open_nodes) or not len(idx):
+            break
+        A = len(open_nodes)
+        loc_map = np.full(n_nodes, -1, dtype=np.int64)
+        loc_map[open_nodes] = np.arange(A)
+        loc = loc_map[node[idx]]
+        target = yr[idx] if params.kind == 'regression' else _causal_pseudo(yr[idx], wr[idx], loc, A)
+
+        # 所有 (节点, 特征, 箱) 的累加和与计数
+        keys = (loc[:, None] * (p * B) + feat_offsets) + Xr[idx]
+        size = A * p * B
+        sums = np.bincount(keys.ravel(), weights=np.repeat(target, p), minlength=size).reshape(A, p, B)
+        cnts = np.bincount(keys.ravel(), minlength=size).reshape(A, p, B)
+        sL = np.cumsum(sums, axis=2)[:, :, :-1]
+        nL = np.cumsum(cnts, axis=2)[:, :, :-1]
+        S = sums[:, 0, :].sum(axis=1)[:, None, None]
+        N = cnts[:, 0, :].sum(axis=1)[:, None, None]
+        sR, nR = S - sL, N - nL
+        valid = (nL >= params.min_leaf) & (nR >= params.min_leaf)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            gain = np.where(valid, sL ** 2 / nL + sR ** 2 / nR - S ** 2 / N, -np.inf)
+
+        # 每个节点随机抽 mtry 个候选特征
+        if mtry < p:
+            chosen = np.argsort(rng.random((A, p)), axis=1)[:, :mtry]
+            mask = np.zeros((A, p), dtype=bool)
+            np.put_along_axis(mask, chosen, True, axis=1)
+            gain[~mask] = -np.inf
+
+        flat = gain.reshape(A, -1)
+        best = np.argmax(flat, axis=1)
+        best_gain = flat[np.arange(A), best]
+        split = np.isfinite(best_gain) & (best_gain > 1e-12 * np.maximum(np.abs(S[:, 0, 0]), 1.0))
+        if not split.any():
+            break
+
+        # 新建子节点
+        split_loc = np.flatnonzero(split)
+        parents = open_nodes[split_loc]
+        children = n_nodes + np.arange(2 * len(parents))
+        feature[parents] = best[split_loc] // (B - 1)
+        threshold[parents] = best[split_loc] % (B - 1)
+        left[parents] = children[0::2]
+        right[parents] = children[1::2]
+        n_nodes += 2 * len(parents)
+
+        # 分裂节点中的行下移一层，未分裂节点中的行不再参与
+        moving = split[loc]
+        idx, loc = idx[moving], loc[moving]
+        nd = open_nodes[loc]
+        go_left = Xr[idx, feature[nd]] <= threshold[nd]
+        node[idx] = np.where(go_left, left[nd], right[nd])
+
+        # 不足 2*min_leaf 行的子节点不可能再分裂，直接作为叶子，不进入下一层的计算
+        sizes = np.bincount(node[idx] - children[0], minlength=len(children))
+        open_nodes = children[sizes >= 2 * params.min_leaf]
+        idx = idx[sizes[node[idx] - children[0]] >= 2 * params.min_leaf]
+
+    return feature[:n_nodes], threshold[:n_nodes], left[:n_nodes], right[:n_nodes]
+
+
+# 把若干行沿树走到叶子，返回叶子节点编号
+def apply_tree(tree, Xb, rows):
+    feature, threshold, left, right = tree
+    node = np.zeros(len(rows), dtype=np.int64)
+    pending = np.arange(len(rows))
+    while len(pending):
+        nd = node[pending]
+        internal = feature[nd] >= 0
+        pending, nd = pending[internal], nd[internal]
+        if not len(pending):
+            break
+        go_left = Xb[rows[pending], feature[nd]] <= threshold[nd]
+        node[pending] = np.where(go_left, left[nd], right[nd])
+    return node
+
+
+# 子进程里的共享数组 {名称: ndarray}
+_arrays = {}
+_blocks = []
+
+
+# 把数组放进共享内存，返回 (共享内存块列表，供子进程挂载的描述)
+def share_arrays(arrays):
+    blocks, meta = [], {}
+    for name, a in arrays.items():
+        if a is None:
+            meta[name] = None
+            continue
+        a = np.ascontiguousarray(a)
+        shm = shared_memory.SharedMemory(create=True, size=max(a.nbytes, 1))
+        np.ndarray(a.shape, dtype=a.dtype, buffer=shm.buf)[...] = a
+        blocks.append(shm)
+        meta[name] = (shm.name, a.shape, a.dtype.str)
+    return blocks, meta
+
+
+# 进程池初始化：挂载共享内存 (只读使用)
+def _attach(meta):
+    for name, desc in meta.items():
+        if desc is None:
+            _arrays[name] = None
+            continue
+        shm_name, shape, dtype = desc
+        shm = shared_memory.SharedMemory(name=shm_name)
+        _blocks.append(shm)
+        _arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+
+
+# 一个任务：用 train_rows 训练 len(seeds) 棵树，对 predict_rows 累加预测
+# 数组从共享内存中按名称取：'X' 为分箱后的特征，y_key / w_key 为目标变量 (w_key 只用于因果树)
+def forest_job(train_rows, predict_rows, params, seeds, y_key, w_key=None):
+    Xb, y = _arrays['X'], _arrays[y_key]
+    w = _arrays[w_key] if w_key else None
+    num = np.zeros(len(predict_rows))
+    den = np.zeros(len(predict_rows))
+    n_sub = max(int(params.sample_fraction * len(train_rows)), 2 * params.min_leaf)
+
+    for seed in seeds:
+        rng = np.random.default_rng(seed)
+        sub = rng.choice(train_rows, size=min(n_sub, len(train_rows)), replace=False)
+        if params.honest:
+            half = len(sub) // 2
+            grow_rows, est_rows = sub[:half], sub[half:]
+        else:
+            grow_rows = est_rows = sub
+        tree = grow_tree(Xb, grow_rows, y, w, params, rng)
+
+        # 叶子值由估计样本计算
+        n_nodes = len(tree[0])
+        leaf = apply_tree(tree, Xb, est_rows)
+        cnt = np.bincount(leaf, minlength=n_nodes).astype('float64')
+        has = cnt > 0
+        if params.kind == 'regression':
+            a = np.bincount(leaf, weights=y[est_rows], minlength=n_nodes)
+            b = has.astype('float64')
+        else:
+            a = np.bincount(leaf, weights=w[est_rows] * y[est_rows], minlength=n_nodes)
+            b = np.bincount(leaf, weights=w[est_rows] ** 2, minlength=n_nodes)
+            b[has] /= cnt[has]
+        a[has] /= cnt[has]
+
+        pred_leaf = apply_tree(tree, Xb, predict_rows)
+        use = has[pred_leaf]
+        if params.oob:
+            inbag = np.zeros(len(Xb), dtype=bool)
+            inbag[sub] = True
+            use &= ~inbag[predict_rows]
+        num[use] += a[pred_leaf[use]]
+        den[use] += b[pred_leaf[use]]
+    return num, den
+
+
+def _run_job(job):
+    return forest_job(*job)
+
+
+# 运行一组森林任务；arrays 必须包含 'X' (分箱特征)，max_workers <= 1 时在当前进程中串行运行
+def run_forest_jobs(arrays, jobs, max_workers=None):
+    if max_workers is None:
+        max_workers = min(len(jobs), os.cpu_count() or 1)
+    if max_workers <= 1:
+        _arrays.update(arrays)
+        try:
+            return [_run_job(job) for job in jobs]
+        finally:
+            _arrays.clear()
+
+    blocks, meta = share_arrays(arrays)
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_attach, initargs=(meta,)) as pool:
+            return list(pool.map(_run_job, jobs))
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+
+# 把 n_trees 棵树的种子平均分成 n_chunks 份
+def seed_chunks(n_trees, n_chunks, seed=0):
+    seeds = np.random.SeedSequence(seed).generate_state(n_trees)
+    return [list(chunk) for chunk in np.array_split(seeds, max(min(n_chunks, n_trees), 1)) if len(chunk)]
@@ -0,0 +1,344 @@
+import pandas as pd
+import os
+import sys
+import json
+import time
+import cProfile
+import threading
+import contextlib
+import glob
+from dataclasses import dataclass, field, asdict
+
+# 分步骤的运行记录 (读取、合并、变量构造、估计)
+# 每一步记录：墙钟时间、CPU 时间、常驻内存峰值 (后台线程采样 RSS)、输入 / 输出行数，
+# CPU 时间和内存包括子进程 (进程池读表、分组估计 LP、因果森林)：
+#   - CPU：os.times() 的 children_user / children_system，只计入已经结束并被回收的子进程
+#     (进程池在步骤内关闭时正好如此)；Windows 上没有这两项，只有本进程 (报告中的 cpu_scope)；
+#   - 内存：本进程与全部子进程的 RSS 之和 (Linux 读 /proc，其他平台需要 psutil)，共享页按进程重复计算，
+#     是上限估计；不能统计子进程时只有本进程 (报告中的 memory_scope)。
+# 合并步骤的键匹配率 (左表有多少行在右表中找到)，变量构造步骤每个变量的缺失比例。
+# 一次运行结束后写出 JSON 报告，并打印汇总；整列缺失 (如目前的 GDP) 或匹配率过低的合并会列在 warnings 中。
+# 需要定位热点时，指定的步骤用 cProfile 运行并保存 .prof 文件 (用 snakeviz / pstats 查看)。
+#
+# 用法：
+#   import instrument
+#   instrument.start_run('clean', report_path='.../run_report_clean.json')
+#   with instrument.step('merge', kind='merge', rows_in=len(left)) as s:
+#       s.match('balance+debt', left, right)          # 记录键匹配率
+#       df = s.output(pd.merge(left, right, ...))     # 记录输出行数
+#   with instrument.step('variables') as s:
+#       s.null_shares(df, ['Size', 'Lev', 'GDP'])
+#   instrument.finish_run()                           # 写报告、打印汇总
+#
+# 没有调用 start_run 时 step() 照常执行，只是不保存记录。
+# 环境变量 PIPELINE_PROFILE=tfp.industry,clean.load (或 all) 对这些步骤开启 cProfile。
+
+# 合并时匹配率低于这个值记为 warning
+low_match_rate = 0.5
+
+
+# 当前进程的常驻内存 (字节)；Linux 读 /proc，Windows 调 GetProcessMemoryInfo，其他平台返回 None
+def current_rss():
+    if os.path.exists('/proc/self/statm'):
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    if sys.platform == 'win32':
+        import ctypes
+        from ctypes import wintypes
+
+        class Counters(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                        ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                        ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+        counters = Counters()
+        counters.cb = ctypes.sizeof(counters)
+        ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(),
+                                                 ctypes.byref(counters), counters.cb)
+        return counters.WorkingSetSize
+    return None
+
+
+try:
+    import psutil
+    HAS_PSUTIL = True
+except ImportError:
+    HAS_PSUTIL = False
+
+
+def _statm_rss(pid):
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+# Linux：pid 的全部后代进程 (/proc/<pid>/task/*/children)
+def _proc_descendants(pid):
+    out, todo = [], [pid]
+    while todo:
+        parent = todo.pop()
+        for path in glob.glob(f'/proc/{parent}/task/*/children'):
+            try:
+                with open(path) as f:
+                    children = [int(c) for c in f.read().split()]
+            except (OSError, ValueError):
+                continue
+            out.extend(children)
+            todo.extend(children)
+    return out
+
+
+# 统计内存时能否包括子进程
+def memory_scope():
+    if HAS_PSUTIL or os.path.exists(f'/proc/self/task/{os.getpid()}/children'):
+        return 'process tree'
+    return 'parent only'
+
+
+def cpu_scope():
+    return 'parent only' if sys.platform == 'win32' else 'process + finished child processes'
+
+
+# 本进程及全部子进程的常驻内存之和 (字节)；不能统计子进程时同 current_rss()
+def tree_rss():
+    if HAS_PSUTIL:
+        total = 0
+        proc = psutil.Process()
+        for p in [proc] + proc.children(recursive=True):
+            try:
+                total += p.memory_info().rss
+            except psutil.Error:
+                pass
+        return total
+    rss = current_rss()
+    if rss is None or memory_scope() == 'parent only':
+        return rss
+    return rss + sum(_statm_rss(pid) for pid in _proc_descendants(os.getpid()))
+
+
+# (本进程 CPU 秒, 已结束子进程 CPU 秒)
+def cpu_times():
+    t = os.times()
+    return t.user + t.system, t.children_user + t.children_system
+
+
+# 后台线程采样 RSS (默认包括子进程，见 tree_rss)，记录区间内的最大值 (不像 tracemalloc 那样拖慢每次内存分配)
+class PeakSampler:
+    def __init__(self, interval=0.005, children=True):
+        self.interval = interval
+        self._rss = tree_rss if children else current_rss
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.peak = self._rss() or 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self._rss() or 0)
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._rss() or 0)
+
+
+# 键匹配率：left 的行中，键在 right 中出现的比例
+def key_match_rate(left, right, on=('Stkcd', 'Year')):
+    on = list(on)
+    if len(left) == 0:
+        return None
+    if len(right) == 0 or any(c not in right.columns for c in on):
+        return 0.0
+    left_keys = pd.MultiIndex.from_frame(left[on])
+    right_keys = pd.MultiIndex.from_frame(right[on])
+    return float(left_keys.isin(right_keys).mean())
+
+
+@dataclass
+class Step:
+    name: str
+    kind: str = 'transform'          # load / merge / transform / estimate
+    depth: int = 0                   # 嵌套层数 (步骤里面还可以有步骤)
+    rows_in: int = None
+    rows_out: int = None
+    wall_s: float = None
+    cpu_s: float = None              # 本进程 + 子进程 (见 cpu_scope)
+    cpu_children_s: float = None     # 其中子进程的部分
+    peak_rss_mb: float = None
+    matches: dict = field(default_factory=dict)   # 名称 -> {left_rows, right_rows, left_match, right_match}
+    nulls: dict = field(default_factory=dict)     # 变量 -> 缺失比例
+    details: dict = field(default_factory=dict)
+    profile: str = None              # cProfile 输出文件
+    error: str = None
+
+    # 记录输出行数并原样返回
+    def output(self, df):
+        self.rows_out = len(df)
+        return df
+
+    def match(self, name, left, right, on=('Stkcd', 'Year')):
+        self.matches[name] = {
+            'left_rows': len(left), 'right_rows': len(right),
+            'left_match': key_match_rate(left, right, on),
+            'right_match': key_match_rate(right, left, on),
+        }
+        return self.matches[name]
+
+    # 各变量的缺失比例 (cols 中数据里没有的列记为 1.0)
+    def null_shares(self, df, cols=None):
+        cols = list(df.columns) if cols is None else list(cols)
+        for col in cols:
+            if col in df.columns:
+                self.nulls[col] = float(df[col].isna().mean()) if len(df) else None
+            else:
+                self.nulls[col] = 1.0
+        return self.nulls
+
+
+class Run:
+    def __init__(self, name, report_path=None, profile=None, profile_dir=None, sample_memory=True):
+        self.name = name
+        self.report_path = report_path
+        if profile is None:
+            profile = os.environ.get('PIPELINE_PROFILE', '')
+        if isinstance(profile, str):
+            profile = [p.strip() for p in profile.split(',') if p.strip()]
+        self.profile = set(profile)
+        self.profile_dir = profile_dir or (os.path.dirname(report_path) if report_path else os.getcwd())
+        self.sample_memory = sample_memory and current_rss() is not None
+        self.steps = []
+        self.started = time.strftime('%Y-%m-%dT%H:%M:%S')
+        self._start = time.perf_counter()
+        self._depth = 0
+
+    def _profiled(self, name):
+        return 'all' in self.profile or name in self.profile or f"{self.name}.{name}" in self.profile
+
+    @contextlib.contextmanager
+    def step(self, name, kind='transform', rows_in=None):
+        record = Step(name, kind, depth=self._depth, rows_in=rows_in)
+        self.steps.append(record)
+        profiler = cProfile.Profile() if self._profiled(name) else None
+        sampler = PeakSampler() if self.sample_memory else contextlib.nullcontext()
+        self._depth += 1
+        wall, (cpu, cpu_children) = time.perf_counter(), cpu_times()
+        try:
+            with sampler:
+                if profiler is not None:
+                    profiler.enable()
+                try:
+                    yield record
+                finally:
+                    if profiler is not None:
+                        profiler.disable()
+        except BaseException as e:
+            record.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self._depth -= 1
+            record.wall_s = round(time.perf_counter() - wall, 4)
+            own, children = cpu_times()
+            record.cpu_children_s = round(children - cpu_children, 4)
+            record.cpu_s = round(own - cpu + record.cpu_children_s, 4)
+            if self.sample_memory:
+                record.peak_rss_mb = round(sampler.peak / 1024 ** 2, 1)
+            if profiler is not None:
+                os.makedirs(self.profile_dir, exist_ok=True)
+                record.profile = os.path.join(self.profile_dir, f"profile_{self.name}_{name}.prof".replace(' ', '_'))
+                profiler.dump_stats(record.profile)
+
+    # 需要注意的问题：整列缺失的变量、匹配率过低的合并、出错的步骤
+    def warnings(self):
+        out = []
+        for s in self.steps:
+            for col, share in s.nulls.items():
+                if share == 1.0:
+                    out.append(f"{s.name}: {col} is entirely missing")
+            for name, m in s.matches.items():
+                if m['left_match'] is not None and m['left_match'] < low_match_rate:
+                    out.append(f"{s.name}: {name} matched only {m['left_match']:.1%} of {m['left_rows']} rows")
+            if s.error:
+                out.append(f"{s.name}: failed with {s.error}")
+        return out
+
+    def report(self):
+        return {
+            'run': self.name,
+            'started': self.started,
+            'total_wall_s': round(time.perf_counter() - self._start, 4),
+            'cpu_scope': cpu_scope(),
+            'memory_scope': memory_scope() if self.sample_memory else None,
+            'steps': [asdict(s) for s in self.steps],
+            'warnings': self.warnings(),
+        }
+
+    def summary(self):
+        lines = [f"Run report: {self.name} (cpu: {cpu_scope()}"
+                 + (f", memory: {memory_scope()})" if self.sample_memory else ")")]
+        for s in self.steps:
+            rows = ''
+            if s.rows_in is not None or s.rows_out is not None:
+                rows = f"  rows {'' if s.rows_in is None else s.rows_in}->{'' if s.rows_out is None else s.rows_out}"
+            mem = f"  peak {s.peak_rss_mb:.0f} MB" if s.peak_rss_mb is not None else ''
+            lines.append(f"  {'  ' * s.depth}{s.name:<{30 - 2 * s.depth}} {s.wall_s:8.2f} s  cpu {s.cpu_s:7.2f} s{mem}{rows}")
+            for name, m in s.matches.items():
+                if m['left_match'] is not None:
+                    lines.append(f"  {'  ' * s.depth}    match {name}: {m['left_match']:.1%} of {m['left_rows']} rows")
+        for w in self.warnings():
+            lines.append(f"  Warning: {w}")
+        return "\n".join(lines)
+
+    def save(self, path=None):
+        path = path or self.report_path
+        if not path:
+            return None
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=1, default=str)
+        return path
+
+
+# 当前运行 (没有 start_run 时为 None，step() 的记录不保存)
+_active = None
+
+
+def start_run(name, report_path=None, profile=None, profile_dir=None):
+    global _active
+    _active = Run(name, report_path=report_path, profile=profile, profile_dir=profile_dir)
+    return _active
+
+
+def current_run():
+    return _active
+
+
+# 结束当前运行：打印汇总、写报告，返回 Run
+def finish_run(path=None, quiet=False):
+    global _active
+    run, _active = _active, None
+    if run is None:
+        return None
+    if not quiet:
+        print(run.summary())
+    saved = run.save(path)
+    if saved and not quiet:
+        print(f"Run report saved to {saved}")
+    return run
+
+
+@contextlib.contextmanager
+def step(name, kind='transform', rows_in=None):
+    if _active is None:
+        yield Step(name, kind, rows_in=rows_in)
+    else:
+        with _active.step(name, kind=kind, rows_in=rows_in) as record:
+            yield record
@@ -0,0 +1,298 @@
+import pandas as pd
+import numpy as np
+import os
+import re
+import json
+import hashlib
+import unicodedata
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from csmar_cache import cache_root
+from pdf_extract import extract_pdfs, load_hash_index, save_hash_index, pdf_digest
+
+# 年报 / MD&A 文本的数字化、数据要素关键词词频 (企业-年度)
+# 全部关键词编译成一个多模式匹配自动机 (Aho-Corasick)：每份文档只从头到尾扫描一遍，
+# 所有关键词的出现次数同时得到，耗时只和文本长度有关，与关键词个数无关。
+#   - PDF 年报的文本来自 pdf_extract.py 的按页缓存 (已提取过的不再解析 PDF)；MD&A 等 .txt 文件直接读取；
+#   - 文本先做 NFKC 规范化 (PDF 里常见的 "⽣""⼤" 等部首字符转成普通汉字)、去掉空白 (换行会把词切断)、英文转大写；
+#   - 扫描结果 (每个关键词的次数) 按 文档哈希 x 词典哈希 缓存：增删关键词只需重新扫描，不需要重新提取文本；
+#     有页提取失败的 PDF 不写入缓存 (那些页下次会重新提取，再重新扫描)；
+#   - 文档按文件名中的 6 位证券代码和 4 位年份对应到 (Stkcd, Year)，同一企业-年度的多份文档词频相加。
+# 输出每个企业-年度各类关键词的次数 KW_<类别>、总次数 KW_Total、文本长度 TextLength 和 DigitalText = ln(1 + KW_Total)。
+#
+# 用法：
+#   features = keyword_features(report_files(report_path))          # DataFrame: Stkcd, Year, KW_AI, ..., DigitalText
+#   features = keyword_features(paths, dictionary=load_dictionary('keywords.json'))   # 自定义词典 {类别: [关键词]}
+
+try:
+    import ahocorasick  # pyahocorasick，装了就用 C 实现的自动机
+    HAS_PYAHOCORASICK = True
+except ImportError:
+    HAS_PYAHOCORASICK = False
+
+# 默认词典：数字技术 (吴非等 2021 的五类) + 数据要素 (采集、处理、应用，见 tfp_indicators_summary.md)
+# 一个关键词可以属于多个类别
+default_dictionary = {
+    'AI': ['人工智能', '商业智能', '图像理解', '投资决策辅助系统', '智能数据分析', '智能机器人', '机器学习', '深度学习',
+           '语义搜索', '生物识别技术', '人脸识别', '语音识别', '身份验证', '自动驾驶', '自然语言处理', '计算机视觉',
+           '知识图谱', '大模型', '神经网络'],
+    'BigData': ['大数据', '数据挖掘', '文本挖掘', '数据可视化', '异构数据', '征信', '增强现实', '混合现实', '虚拟现实'],
+    'Cloud': ['云计算', '流计算', '图计算', '内存计算', '多方安全计算', '类脑计算', '绿色计算', '认知计算', '融合架构',
+              '亿级并发', 'EB级存储', '物联网', '信息物理系统', '边缘计算', '云平台', '云服务', '算力'],
+    'Blockchain': ['区块链', '数字货币', '分布式计算', '差分隐私技术', '智能金融合约', '分布式账本', '联盟链'],
+    'DigitalApp': ['移动互联网', '工业互联网', '移动互联', '互联网医疗', '电子商务', '移动支付', '第三方支付', 'NFC支付',
+                   '智能能源', 'B2B', 'B2C', 'C2B', 'C2C', 'O2O', '网联', '智能穿戴', '智慧农业', '智能交通', '智能医疗',
+                   '智能客服', '智能家居', '智能投顾', '智能文旅', '智能环保', '智能电网', '智能营销', '数字营销', '无人零售',
+                   '互联网金融', '数字金融', 'FINTECH', '金融科技', '量化金融', '开放银行', '智能制造', '智能工厂',
+                   '数字化转型', '数字化车间', '工业软件', '数字孪生'],
+    'DataCollect': ['数据采集', '数据收集', '数据获取', '传感器', '物联网', '大数据', '数据资源', '数据资产', '数据要素',
+                    '数据标注', '数据库'],
+    'DataProcess': ['数据处理', '数据治理', '数据清洗', '数据中台', '数据仓库', '数据平台', '数据中心', '数据存储',
+                    '数据安全', '云计算', '人工智能', '边缘计算', '算力'],
+    'DataApply': ['智能决策', '数据驱动', '数据分析', '数据应用', '数据服务', '数据交易', '数据共享', '数据开放', '数据赋能',
+                  '数据产品', '数据价值', '数据运营'],
+}
+
+# 扫描结果缓存格式改变时加 1
+scan_version = 1
+
+whitespace = re.compile(r'\s+')
+stkcd_pattern = re.compile(r'(?<!\d)(\d{6})(?!\d)')
+year_pattern = re.compile(r'(?<!\d)((?:19|20)\d{2})(?!\d)')
+
+
+def normalize_text(text):
+    return whitespace.sub('', unicodedata.normalize('NFKC', text or '')).upper()
+
+
+# 从 JSON 文件读取词典 {类别: [关键词, ...]}
+def load_dictionary(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return {str(k): list(v) for k, v in json.load(f).items()}
+
+
+# 词典 -> (关键词列表, 类别列表, 关键词 x 类别 的 0/1 矩阵)
+def compile_dictionary(dictionary):
+    categories = list(dictionary)
+    keywords = list(dict.fromkeys(normalize_text(w) for words in dictionary.values() for w in words if normalize_text(w)))
+    position = {w: i for i, w in enumerate(keywords)}
+    membership = np.zeros((len(keywords), len(categories)), dtype='int64')
+    for j, cat in enumerate(categories):
+        for w in dictionary[cat]:
+            if normalize_text(w):
+                membership[position[normalize_text(w)], j] = 1
+    return keywords, categories, membership
+
+
+def dictionary_hash(keywords):
+    return hashlib.sha1(json.dumps([scan_version] + list(keywords), ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
+
+
+# 多模式匹配自动机：goto 表 (每个状态一个 {字符: 下一状态})、失败指针、每个状态结束的关键词编号
+class KeywordAutomaton:
+    def __init__(self, keywords):
+        self.keywords = list(keywords)
+        if HAS_PYAHOCORASICK:
+            self._auto = ahocorasick.Automaton()
+            for i, w in enumerate(self.keywords):
+                self._auto.add_word(w, i)
+            if self.keywords:
+                self._auto.make_automaton()
+            return
+        self._auto = None
+        goto, fail, out = [{}], [0], [[]]
+        for i, w in enumerate(self.keywords):
+            node = 0
+            for ch in w:
+                nxt = goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[node][ch] = nxt
+                    goto.append({})
+                    fail.append(0)
+                    out.append([])
+                node = nxt
+            out[node].append(i)
+        # 按层 (BFS) 计算失败指针：最长的、同时也是某个关键词前缀的真后缀
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in goto[node].items():
+                queue.append(nxt)
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0) if goto[f].get(ch, 0) != nxt else 0
+                out[nxt] = out[nxt] + out[fail[nxt]]
+        self.goto, self.fail, self.out = goto, fail, out
+        self.alphabet = set(goto[0]) | {ch for w in self.keywords for ch in w}
+
+    # 一遍扫描，返回每个关键词的出现次数 (可重叠，如 "大数据平台" 同时计 大数据、数据平台)
+    def count(self, text):
+        counts = np.zeros(len(self.keywords), dtype='int64')
+        if not self.keywords:
+            return counts
+        if self._auto is not None:
+            for _, i in self._auto.iter(text):
+                counts[i] += 1
+            return counts
+        goto, fail, out, alphabet = self.goto, self.fail, self.out, self.alphabet
+        hits = []
+        node = 0
+        for ch in text:
+            if ch not in alphabet:
+                node = 0
+                continue
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                hits.extend(out[node])
+        if hits:
+            np.add.at(counts, hits, 1)
+        return counts
+
+
+# 文件名中的证券代码和年份，如 "000002_2023_万科A_2023年年度报告.pdf"、"600000-浦发银行-2022年报.txt"
+# 有多个年份时优先取后面紧跟 "年" 的那个 (报告年度)
+def document_key(path):
+    name = os.path.basename(path)
+    code = stkcd_pattern.search(name)
+    years = list(year_pattern.finditer(name))
+    if code is None or not years:
+        return None
+    report_years = [m for m in years if name[m.end():m.end() + 1] == '年']
+    year = (report_years or years)[-1].group(1)
+    return code.group(1), int(year)
+
+
+# 目录下的年报 / MD&A 文档 (PDF、txt)
+def report_files(root):
+    out = []
+    for folder, _, files in os.walk(root):
+        for name in files:
+            if name.lower().endswith(('.pdf', '.txt')) and not name.startswith('~$'):
+                out.append(os.path.join(folder, name))
+    return sorted(out)
+
+
+# 子进程：每个进程只编译一次自动机
+_worker_automaton = None
+
+
+def _init_worker(keywords):
+    global _worker_automaton
+    _worker_automaton = KeywordAutomaton(keywords)
+
+
+# 扫描一份文档：PDF 逐页从提取缓存读出，txt 直接读；返回 (各关键词次数, 文本长度)
+def _scan(source):
+    kind, item = source
+    counts = np.zeros(len(_worker_automaton.keywords), dtype='int64')
+    length = 0
+    pages = item.pages() if kind == 'pdf' else [_read_text(item)]
+    for page in pages:
+        # 逐页扫描：关键词不跨页 (页眉页脚会把跨页的词隔开)
+        text = normalize_text(page)
+        length += len(text)
+        counts += _worker_automaton.count(text)
+    return counts.tolist(), length
+
+
+def _read_text(path):
+    for encoding in ('utf-8-sig', 'gb18030'):
+        try:
+            with open(path, 'r', encoding=encoding) as f:
+                return f.read()
+        except UnicodeDecodeError:
+            continue
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        return f.read()
+
+
+def _cache_path(dict_hash):
+    return os.path.join(cache_root(), 'keywords', f"scan_{dict_hash}.json")
+
+
+# 扫描一组文档，返回 {文档哈希: [各关键词次数..., 文本长度]}；已缓存的 (同一词典) 不再扫描
+def scan_documents(paths, keywords, max_workers=None, verbose=True):
+    dict_hash = dictionary_hash(keywords)
+    cache_path = _cache_path(dict_hash)
+    cached = {}
+    if os.path.exists(cache_path):
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+
+    index = load_hash_index()
+    digests = {p: pdf_digest(p, index) for p in paths}
+    save_hash_index(index)
+    todo = [p for p in paths if digests[p] not in cached]
+    pdfs = [p for p in todo if p.lower().endswith('.pdf')]
+    # PDF 只提取文本 (已提取过的直接用缓存)
+    docs = {doc.path: doc for doc in extract_pdfs(pdfs, tables=False, max_workers=max_workers, verbose=verbose)} if pdfs else {}
+    sources, names, partial = [], [], set()
+    for p in todo:
+        if p in docs:
+            if docs[p].error:
+                continue
+            # 有页提取失败时 (下次运行 pdf_extract 会重试这些页) 本次照常计数，但不写入缓存，下次重新扫描
+            failed = docs[p].failed_pages()
+            if failed:
+                print(f"Warning: {len(failed)} pages of {p} could not be extracted, keyword counts not cached")
+                partial.add(p)
+            sources.append(('pdf', docs[p]))
+        else:
+            sources.append(('txt', p))
+        names.append(p)
+    if verbose:
+        print(f"Keyword scan: {len(sources)} documents to scan, {len(paths) - len(todo)} cached "
+              f"({len(keywords)} keywords)")
+
+    fresh = {}
+    if sources:
+        if max_workers is None:
+            max_workers = min(len(sources), os.cpu_count() or 1)
+        if max_workers <= 1:
+            _init_worker(keywords)
+            results = [_scan(s) for s in sources]
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(keywords,)) as pool:
+                results = list(pool.map(_scan, sources, chunksize=max(1, len(sources) // (max_workers * 4))))
+        for p, (counts, length) in zip(names, results):
+            fresh[digests[p]] = counts + [length]
+            if p not in partial:
+                cached[digests[p]] = fresh[digests[p]]
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(cache_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(cached, f)
+        os.replace(cache_path + '.tmp', cache_path)
+    counts = {**cached, **fresh}
+    return {digests[p]: counts[digests[p]] for p in paths if digests[p] in counts}, digests
+
+
+# 企业-年度关键词特征：Stkcd, Year, KW_<类别>..., KW_Total, TextLength, DigitalText
+def keyword_features(paths, dictionary=None, max_workers=None, verbose=True):
+    keywords, categories, membership = compile_dictionary(dictionary or default_dictionary)
+    columns = ['Stkcd', 'Year'] + [f"KW_{c}" for c in categories] + ['KW_Total', 'TextLength', 'DigitalText']
+    keyed = {p: document_key(p) for p in paths}
+    unkeyed = [p for p, k in keyed.items() if k is None]
+    if unkeyed and verbose:
+        print(f"Warning: {len(unkeyed)} documents have no stock code / year in the file name and are skipped, "
+              f"e.g. {os.path.basename(unkeyed[0])}")
+    paths = [p for p in paths if keyed[p] is not None]
+    if not paths:
+        return pd.DataFrame(columns=columns)
+
+    scanned, digests = scan_documents(paths, keywords, max_workers=max_workers, verbose=verbose)
+    rows = [p for p in paths if digests[p] in scanned]
+    matrix = np.array([scanned[digests[p]] for p in rows], dtype='int64').reshape(len(rows), len(keywords) + 1)
+    counts, lengths = matrix[:, :-1], matrix[:, -1]
+    df = pd.DataFrame(counts @ membership, columns=[f"KW_{c}" for c in categories])
+    df.insert(0, 'Stkcd', [keyed[p][0] for p in rows])
+    df.insert(1, 'Year', np.array([keyed[p][1] for p in rows], dtype='int64'))
+    df['KW_Total'] = counts.sum(axis=1)
+    df['TextLength'] = lengths
+    # 同一企业-年度的多份文档 (年报、MD&A) 相加
+    df = df.groupby(['Stkcd', 'Year'], as_index=False, sort=True).sum()
+    df['DigitalText'] = np.log1p(df['KW_Total'].astype('float64'))
+    return df[columns]
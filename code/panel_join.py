@@ -0,0 +1,145 @@
+import pandas as pd
+import numpy as np
+
+# 面板多表连接
+# 原来的做法是对 (Stkcd, Year) 连续做 7 次 pd.merge(how='left')，每次都要重新哈希字符串键、
+# 复制整张不断变宽的表。这里先把主表的 (Stkcd, Year) 编码成一个整数面板键：
+#   key = 企业编号 (Categorical codes) * 年份个数 + (Year - 最小年份)
+# 然后用一个稠密的 "面板键 -> 主表行号" 数组，把每张表的每一列一次性对齐到主表上。
+# 数值列默认存成 float32 / 可空整数，字符串列存成 category，以降低内存占用。
+#
+# 用法：
+#   from panel_join import join_panel
+#   df_final = join_panel(balance_sheet, [income_statement, growth, equity, ...])
+
+keys = ['Stkcd', 'Year']
+
+
+class PanelIndex:
+    def __init__(self, base):
+        if base[keys].duplicated().any():
+            raise ValueError("base table has duplicate (Stkcd, Year) rows, deduplicate it before joining")
+
+        firm = pd.Categorical(base['Stkcd'])
+        self.firms = firm.categories
+        year = base['Year'].to_numpy(dtype='int64')
+        self.year_min = int(year.min()) if len(year) else 0
+        self.n_years = int(year.max()) - self.year_min + 1 if len(year) else 1
+        self.firm_codes = firm.codes.astype('int32')
+        self.years = year.astype('int16')
+        self.n_rows = len(base)
+
+        # 稠密查找表：面板键 -> 主表行号 (不存在为 -1)
+        self.lookup = np.full(len(self.firms) * self.n_years, -1, dtype='int32')
+        self.lookup[self._key(self.firm_codes, year)] = np.arange(self.n_rows, dtype='int32')
+
+    def _key(self, firm_codes, years):
+        return firm_codes.astype('int64') * self.n_years + (years - self.year_min)
+
+    # 返回 other 中每一行对应的主表行号 (对不上的为 -1)
+    def positions(self, other):
+        codes = pd.Categorical(other['Stkcd'], categories=self.firms).codes.astype('int64')
+        years = other['Year'].to_numpy(dtype='int64')
+        valid = (codes >= 0) & (years >= self.year_min) & (years < self.year_min + self.n_years)
+        pos = np.full(len(other), -1, dtype='int32')
+        pos[valid] = self.lookup[self._key(codes[valid], years[valid])]
+        return pos
+
+
+# 选择占用内存更小、又不损失必要精度的类型
+#   - 取值都是整数的列 -> 能容纳取值范围的最小可空整数 (Int8/Int16/Int32/Int64)
+#   - 其他数值列 -> float32 (约 7 位有效数字，对取对数、比率变量足够)
+#   - 字符串列 -> category
+def compact_dtype(values, exact=False):
+    s = pd.Series(values)
+    if pd.api.types.is_bool_dtype(s):
+        return 'boolean'
+    if pd.api.types.is_numeric_dtype(s):
+        if exact:
+            return 'float64'
+        finite = s[np.isfinite(s.astype('float64'))]
+        if len(finite) and (finite == np.round(finite)).all():
+            lo, hi = finite.min(), finite.max()
+            for dtype in ('Int8', 'Int16', 'Int32', 'Int64'):
+                info = np.iinfo(dtype.lower())
+                if lo >= info.min and hi <= info.max:
+                    return dtype
+        return 'float32'
+    return 'category'
+
+
+# 把 other 的列按行号对齐到长度为 n_rows 的新数组上，主表中没有匹配的位置为缺失
+def _align(values, pos, n_rows, dtype):
+    matched = pos >= 0
+    src = pd.Series(values).iloc[matched]
+    dst = pos[matched]
+    if dtype in ('float32', 'float64'):
+        out = np.full(n_rows, np.nan, dtype=dtype)
+        out[dst] = src.to_numpy(dtype=dtype, na_value=np.nan)
+        return out
+    if dtype == 'category':
+        cat = pd.Categorical(src)
+        codes = np.full(n_rows, -1, dtype=cat.codes.dtype)
+        codes[dst] = cat.codes
+        return pd.Categorical.from_codes(codes, categories=cat.categories)
+    if dtype == 'object':
+        out = np.full(n_rows, np.nan, dtype=object)
+        out[dst] = src.to_numpy(dtype=object)
+        return out
+    # 可空整数 / 布尔：数据数组 + 缺失掩码
+    mask = np.ones(n_rows, dtype='bool')
+    mask[dst] = src.isna().to_numpy()
+    filled = src.fillna(0).to_numpy()
+    if dtype == 'boolean':
+        data = np.zeros(n_rows, dtype='bool')
+        data[dst] = filled.astype('bool')
+        return pd.arrays.BooleanArray(data, mask)
+    data = np.zeros(n_rows, dtype=dtype.lower())
+    data[dst] = filled.astype(dtype.lower())
+    return pd.arrays.IntegerArray(data, mask)
+
+
+# 以 base 为主表，把 others 中的所有表一次性左连接到 (Stkcd, Year) 上
+# compact=False 时数值列保持 float64、文本列保持 object (与 pd.merge 的结果一致)；
+# exact 中列出的数值列即使 compact=True 也保持 float64
+# 与 pd.merge 不同的两点 (都会打印提示)：
+#   - 同名的非键列出现在多张表中时，先出现的保留原名，后面的加表序号后缀 (如 others 中第 3 张表的 ROA -> ROA_3)；
+#   - 其他表中 (Stkcd, Year) 重复时不复制主表的行，按最后一行取值 (与清洗脚本 drop_duplicates(keep='last') 一致)
+def join_panel(base, others, compact=True, exact=(), verbose=True):
+    index = PanelIndex(base)
+    n = index.n_rows
+
+    columns = {
+        'Stkcd': pd.Categorical.from_codes(index.firm_codes, categories=index.firms),
+        'Year': index.years,
+    }
+    sources = [(base, np.arange(n, dtype='int32'), '')]
+    for i, df in enumerate(others):
+        if df is None or df.empty:
+            continue
+        if verbose:
+            print(f"Merging dataframe {i+1}...")
+        pos = index.positions(df)
+        matched = pos[pos >= 0]
+        n_dup = len(matched) - len(np.unique(matched))
+        if n_dup:
+            print(f"Warning: dataframe {i+1} has {n_dup} duplicate (Stkcd, Year) rows, keeping the last one")
+        sources.append((df, pos, f"_{i+1}"))
+
+    for df, pos, suffix in sources:
+        for col in df.columns:
+            if col in keys:
+                continue
+            values = df[col]
+            if col in columns:
+                print(f"Warning: column {col} appears in more than one table, renamed to {col}{suffix}")
+                col = f"{col}{suffix}"
+            if compact:
+                dtype = compact_dtype(values, exact=col in exact)
+            elif pd.api.types.is_numeric_dtype(values):
+                dtype = 'float64'
+            else:
+                dtype = 'object'
+            columns[col] = _align(values, pos, n, dtype)
+
+    return pd.DataFrame(columns)
@@ -0,0 +1,153 @@
+import pandas as pd
+import os
+import json
+import time
+import shutil
+
+# 流水线输出 (final_data、tfp_result) 的列式存储
+# CSV 读回来时每一列都要重新推断类型 (补零的 Stkcd 变回整数、category 变回字符串)，而且回归只用十几列也得全部解析。
+# 这里把面板按 Year 分区，每个年份一个 Arrow IPC 文件 (不压缩，可以直接内存映射)，目录下的 _schema.json 记录：
+#   各列的 pandas 类型 (category 的类别、可空整数、float32……)、每个分区的文件和行数。
+# 读取时：
+#   - 年份条件 (如 Year >= 2016) 先在 schema 的分区列表上筛，不符合的年份文件根本不打开；
+#   - 只取需要的列 (列投影)，其他列不转换成 pandas；
+#   - 文件用 pa.memory_map 打开，由操作系统按需换页，不先整体读进内存；
+#   - 按 schema 恢复类型，各列类型和写入时一致 (行按年份分区的顺序排列)。
+# 没装 pyarrow 时每个分区存成 pickle (类型同样保留，只是不能内存映射)。CSV 只作为导出格式 (给 Excel / Stata 看)。
+#
+# 用法：
+#   write_panel(df, os.path.join(data_dir, 'final_data'), csv_path=os.path.join(data_dir, 'final_data.csv'))
+#   df = read_panel(os.path.join(data_dir, 'final_data'), columns=['Stkcd', 'Year', 'ROA'], min_year=2016)
+#   read_schema(path)['columns']     # 列名 -> 类型
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+schema_name = "_schema.json"
+schema_version = 1
+
+
+# pandas 类型 -> 可以写进 JSON、读回时用来恢复的描述
+def dtype_spec(s):
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        return {'dtype': 'category', 'categories': s.cat.categories.tolist(), 'ordered': bool(s.cat.ordered)}
+    return {'dtype': str(s.dtype)}
+
+
+def restore_dtype(s, spec):
+    if spec['dtype'] == 'category':
+        return s.astype(pd.CategoricalDtype(spec['categories'], ordered=spec['ordered']))
+    if str(s.dtype) != spec['dtype']:
+        return s.astype(spec['dtype'])
+    return s
+
+
+def _write_part(df, path, fmt):
+    if fmt == 'arrow':
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        with pa.OSFile(path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+    else:
+        df.to_pickle(path)
+
+
+def _read_part(path, fmt, columns):
+    if fmt == 'arrow':
+        with pa.memory_map(path, 'r') as source:
+            table = pa.ipc.open_file(source).read_all()
+            return table.select(columns).to_pandas()
+    return pd.read_pickle(path)[columns]
+
+
+# 写出按 partition_by 分区的数据集；先写到临时目录再整体替换，写到一半中断不会留下残缺的数据集
+def write_panel(df, path, partition_by='Year', csv_path=None):
+    fmt = 'arrow' if HAS_PYARROW else 'pickle'
+    ext = '.arrow' if fmt == 'arrow' else '.pkl'
+    df = df.reset_index(drop=True)
+    keys = pd.to_numeric(df[partition_by], errors='coerce')
+    if keys.isna().any():
+        print(f"Warning: {int(keys.isna().sum())} rows with missing {partition_by} are not written.")
+    tmp_path = path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    partitions = {}
+    for key, part in df[keys.notna()].groupby(keys[keys.notna()].astype('int64'), sort=True):
+        name = f"{partition_by}={key}{ext}"
+        _write_part(part, os.path.join(tmp_path, name), fmt)
+        partitions[str(key)] = {'file': name, 'rows': len(part)}
+
+    schema = {
+        'version': schema_version,
+        'format': fmt,
+        'partition_by': partition_by,
+        'columns': {c: dtype_spec(df[c]) for c in df.columns},
+        'partitions': partitions,
+        'rows': sum(p['rows'] for p in partitions.values()),
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    with open(os.path.join(tmp_path, schema_name), 'w', encoding='utf-8') as f:
+        json.dump(schema, f, ensure_ascii=False, indent=1)
+
+    if os.path.exists(path):
+        old_path = path + '.old'
+        shutil.rmtree(old_path, ignore_errors=True)
+        os.replace(path, old_path)
+        os.replace(tmp_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+    else:
+        os.replace(tmp_path, path)
+
+    if csv_path:
+        export_csv(df, csv_path)
+    return schema
+
+
+def read_schema(path):
+    with open(os.path.join(path, schema_name), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+# 读取数据集：columns 为 None 时取全部列；数据集中没有的列给出提示后不出现在结果中 (strict=True 时报错)；
+# min_year / max_year (含) 只打开对应年份的分区
+def read_panel(path, columns=None, min_year=None, max_year=None, strict=False):
+    schema = read_schema(path)
+    if schema['format'] == 'arrow' and not HAS_PYARROW:
+        raise ImportError(f"{path} is stored as Arrow files; install pyarrow to read it")
+    specs = schema['columns']
+    if columns is not None:
+        missing = [c for c in dict.fromkeys(columns) if c not in specs]
+        if missing and strict:
+            raise KeyError(f"columns not in {path}: {missing}")
+        if missing:
+            print(f"Warning: columns not in {path}: {missing}")
+    columns = list(specs) if columns is None else [c for c in dict.fromkeys(columns) if c in specs]
+    partition_by = schema['partition_by']
+    read_columns = columns if partition_by in columns else columns + [partition_by]
+
+    parts = []
+    for key, info in sorted(schema['partitions'].items(), key=lambda kv: int(kv[0])):
+        if (min_year is not None and int(key) < min_year) or (max_year is not None and int(key) > max_year):
+            continue
+        parts.append(_read_part(os.path.join(path, info['file']), schema['format'], read_columns))
+    if parts:
+        df = pd.concat(parts, ignore_index=True)
+    else:
+        df = pd.DataFrame({c: pd.Series([], dtype='object') for c in read_columns})
+    df = pd.DataFrame({c: restore_dtype(df[c], specs[c]) for c in columns})
+    return df
+
+
+# CSV 导出 (utf-8-sig，Excel 直接打开不乱码)
+def export_csv(df, csv_path):
+    try:
+        df.to_csv(csv_path, index=False, encoding='utf-8-sig')
+        print(f"Exported CSV copy to {csv_path}")
+    except PermissionError:
+        print(f"Permission denied: {csv_path}")
+        print("Please close the file if it is open in Excel or another program.")
@@ -0,0 +1,186 @@
+import pandas as pd
+import numpy as np
+
+# 企业-年度面板的组内变换：滞后、超前、差分、增长率、滚动统计、首次处理年份和事件时间
+# groupby('Stkcd').shift() 按行移动，年份有缺口时 (如 2015, 2017) 会把 2015 年的值当成 2017 年的 "上一年"；
+# groupby().apply / rolling 每个企业调用一次 Python 函数，几千家企业就很慢。
+# 这里和 panel_join.py 一样把 (Stkcd, Year) 编码成整数面板键：
+#   key = 企业编号 * 年份个数 + (Year - 最小年份)
+# 按键做一次计数排序 (bincount + cumsum，线性时间)，offsets[key] 就是排序后第一个 >= key 的行的位置。之后：
+#   - 滞后 / 超前 k 年：目标键 = key - k，该键上有观测 (且没有跨出本企业的年份范围) 才取值，年份缺口自动得到缺失；
+#   - 滚动统计 (最近 window 个自然年)：窗口 [key - window + 1, key] 在排序后是连续的一段，
+#     用累加和 cumsum[offsets[key + 1]] - cumsum[offsets[起点]] 一次算出所有行的和、个数 (方差再按偏移累加离差平方)；
+#   - 首次处理年份：排序后每个企业第一条 Treat_time == 1 的年份，再按企业编号广播到每一行。
+# 全部是数组的偏移运算，复杂度与面板行数 (加上 企业数 x 年份数) 成线性。结果与输入 df 同索引、同顺序。
+#
+# 用法：
+#   panel = PanelLayout(df)                             # 只排序一次，可以反复使用
+#   df['lnK_lag1'] = panel.lag('lnK')
+#   df['Grow_TA'] = panel.growth('TotalAssets')
+#   df['ROA_mean3'] = panel.rolling('ROA', 3, stat='mean', min_periods=2)
+#   df['FirstTreatYear'] = panel.first_year('Treat_time')
+#   df['EventTime'] = panel.event_time('Treat_time', window=(-4, 4))    # 两端分别并入 -4 / 4
+#   dummies = event_dummies(df['EventTime'], -4, 4, ref=-1)              # Event_m4 ... Event_p4 (不含 -1)
+
+rolling_stats = ('sum', 'mean', 'count', 'var', 'std')
+
+
+class PanelLayout:
+    def __init__(self, df, firm='Stkcd', year='Year'):
+        # 传列名时从 df 取值 (之后新加的列也可以)；传 Series / 数组时须与 df 行顺序一致
+        self.df = df
+        self.index = df.index
+        self.n_rows = len(df)
+        firm = pd.Categorical(df[firm])
+        self.firms = firm.categories
+        codes = firm.codes.astype('int64')
+        years = pd.to_numeric(df[year], errors='coerce').to_numpy(dtype='float64')
+        # 企业或年份缺失的行不参与任何变换 (结果为缺失)
+        self.valid = (codes >= 0) & np.isfinite(years)
+        yv = years[self.valid].astype('int64')
+        self.year_min = int(yv.min()) if len(yv) else 0
+        self.n_years = int(yv.max()) - self.year_min + 1 if len(yv) else 1
+
+        self.rows = np.flatnonzero(self.valid)
+        self.firm_codes = codes
+        self.year_offset = np.full(self.n_rows, -1, dtype='int64')
+        self.year_offset[self.rows] = yv - self.year_min
+        self.keys = np.full(self.n_rows, -1, dtype='int64')
+        self.keys[self.rows] = codes[self.rows] * self.n_years + self.year_offset[self.rows]
+
+        counts = np.bincount(self.keys[self.rows], minlength=len(self.firms) * self.n_years)
+        if len(counts) and counts.max() > 1:
+            raise ValueError("panel has duplicate (Stkcd, Year) rows, deduplicate it before building lags")
+        self.present = counts.astype(bool)
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+        # 计数排序：order[排序后位置] = 原始行号
+        self.order = np.empty(len(self.rows), dtype='int64')
+        self.order[self.offsets[self.keys[self.rows]]] = self.rows
+
+    def _values(self, col):
+        if isinstance(col, str):
+            col = self.df[col]
+        return pd.to_numeric(pd.Series(np.asarray(col)), errors='coerce').to_numpy(dtype='float64')
+
+    def _series(self, values, name=None):
+        return pd.Series(values, index=self.index, name=name)
+
+    # 同一企业 k 年前 (k < 0 为 k 年后) 那条观测的行号，没有时为 -1
+    def shift_positions(self, k=1):
+        pos = np.full(self.n_rows, -1, dtype='int64')
+        target = self.year_offset[self.rows] - k
+        inside = (target >= 0) & (target < self.n_years)
+        rows = self.rows[inside]
+        keys = self.keys[rows] - k
+        found = self.present[keys]
+        pos[rows[found]] = self.order[self.offsets[keys[found]]]
+        return pos
+
+    def _take(self, values, pos):
+        out = np.full(self.n_rows, np.nan)
+        has = pos >= 0
+        out[has] = values[pos[has]]
+        return out
+
+    def lag(self, values, k=1):
+        return self._series(self._take(self._values(values), self.shift_positions(k)))
+
+    def lead(self, values, k=1):
+        return self.lag(values, -k)
+
+    def diff(self, values, k=1):
+        v = self._values(values)
+        return self._series(v - self._take(v, self.shift_positions(k)))
+
+    # 增长率 x_t / x_{t-k} - 1；上一期为 0 或缺失时为缺失
+    def growth(self, values, k=1):
+        v = self._values(values)
+        prev = self._take(v, self.shift_positions(k))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            out = np.where(prev != 0, v / prev - 1, np.nan)
+        return self._series(out)
+
+    # 最近 window 个自然年 (含当年) 的组内统计；缺失值不计入，非缺失值个数少于 min_periods 时为缺失
+    def rolling(self, values, window, stat='mean', min_periods=1):
+        if stat not in rolling_stats:
+            raise ValueError(f"unknown rolling stat {stat!r}, expected one of {rolling_stats}")
+        v = self._values(values)[self.order]
+        ok = np.isfinite(v)
+        x = np.where(ok, v, 0.0)
+        cs = np.concatenate([[0.0], np.cumsum(x)])
+        cn = np.concatenate([[0], np.cumsum(ok)])
+
+        keys = self.keys[self.order]
+        start = self.offsets[keys - np.minimum(window - 1, self.year_offset[self.order])]
+        end = self.offsets[keys + 1]
+        n = (cn[end] - cn[start]).astype('float64')
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = (cs[end] - cs[start]) / n
+            if stat == 'sum':
+                out = cs[end] - cs[start]
+            elif stat == 'mean':
+                out = mean
+            elif stat == 'count':
+                out = n
+            else:
+                # 方差用第二遍的离差平方和 (不用 平方和 - 和的平方，避免相减损失精度)；
+                # 窗口内最多 window 行，按偏移 j 逐个加上排序后位置 end - 1 - j 的那一行
+                ss = np.zeros(len(v))
+                pos = np.arange(len(v))
+                for j in range(window):
+                    src = pos - j
+                    use = (src >= start) & ok[np.maximum(src, 0)]
+                    ss[use] += (v[src[use]] - mean[use]) ** 2
+                out = ss / (n - 1)
+                out = np.sqrt(out) if stat == 'std' else out
+        if stat != 'count':
+            out = np.where(n >= max(min_periods, 2 if stat in ('var', 'std') else 1), out, np.nan)
+        result = np.full(self.n_rows, np.nan)
+        result[self.order] = out
+        return self._series(result)
+
+    # 每个企业第一次 values == value 的年份 (广播到该企业的每一行)，从未出现为缺失
+    def first_year(self, values, value=1):
+        hit = np.zeros(self.n_rows, dtype=bool)
+        hit[self.rows] = self._values(values)[self.rows] == value
+        sorted_hits = self.order[hit[self.order]]
+        firms = self.firm_codes[sorted_hits]
+        first = np.ones(len(firms), dtype=bool)
+        first[1:] = firms[1:] != firms[:-1]
+        by_firm = np.full(len(self.firms), np.nan)
+        by_firm[firms[first]] = self.year_offset[sorted_hits[first]] + self.year_min
+        out = np.full(self.n_rows, np.nan)
+        out[self.rows] = by_firm[self.firm_codes[self.rows]]
+        return self._series(out)
+
+    # 相对首次处理年份的事件时间 (Year - 首次处理年份)；window=(lo, hi) 时两端以外的并入端点，从未处理为缺失
+    def event_time(self, values, value=1, window=None):
+        first = self.first_year(values, value).to_numpy()
+        rel = np.full(self.n_rows, np.nan)
+        rel[self.rows] = self.year_offset[self.rows] + self.year_min - first[self.rows]
+        if window is not None:
+            rel = np.clip(rel, window[0], window[1])
+        return self._series(rel).astype('Int64')
+
+
+# 事件时间虚拟变量：Event_m4 (-4)、Event_p0 (0) ……，ref 期 (默认 -1) 作为基准不生成，从未处理的行全为 0
+def event_dummies(event, lo, hi, ref=-1, prefix='Event'):
+    rel = pd.Series(event).astype('Float64')
+    out = {}
+    for t in range(lo, hi + 1):
+        if t == ref:
+            continue
+        name = f"{prefix}_{'m' if t < 0 else 'p'}{abs(t)}"
+        out[name] = (rel == t).fillna(False).astype('int8')
+    return pd.DataFrame(out, index=rel.index)
+
+
+# 一次加上多列的滞后：add_lags(df, ['lnK', 'lnM'], lags=(1,)) -> lnK_lag1, lnM_lag1
+def add_lags(df, columns, lags=(1,), leads=(), layout=None):
+    layout = layout or PanelLayout(df)
+    for col in columns:
+        for k in lags:
+            df[f"{col}_lag{k}"] = layout.lag(col, k)
+        for k in leads:
+            df[f"{col}_lead{k}"] = layout.lead(col, k)
+    return df
@@ -0,0 +1,296 @@
+import pandas as pd
+import os
+import json
+import glob
+import argparse
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from csmar_cache import cache_root, file_hash
+
+try:
+    import pdfplumber
+    HAS_PDFPLUMBER = True
+except ImportError:
+    HAS_PDFPLUMBER = False
+
+# PDF 文本与表格提取 (文献、年报等)
+# 按页缓存：每个 PDF 以内容哈希为目录，每页一个 JSON (文本 + 表格)，写在 data/.cache/pdf/<哈希>/ 下。
+#   - 文件没变 (哈希相同) 的页直接跳过，重新跑整个文献库时只处理新增或修改过的 PDF；
+#   - 所有待提取的页按块 (pages_per_task 页) 分给进程池，子进程提取完直接写缓存文件，主进程不保存文本；
+#   - extract_text() 对扫描页 / 空白页返回 None，记为空字符串；单页出错记录在该页的 error 中，不影响其他页，
+#     出错的页不算已缓存，下次运行重新提取；只提取了文本的页 (tables=False，如 keyword_index.py) 在需要表格时也要重新提取；
+#     全部页都提取完后在 meta.json 中记下是否含表格，之后不用再逐页检查；
+#   - 文件不存在、打不开或没装 pdfplumber 时，Document.error 记录原因 (调用方据此给出提示)。
+# 读取结果时逐页从缓存读出 (Document.pages())，全文用 join 拼接，表格转成 DataFrame (第一行作为表头)。
+#
+# 用法：
+#   docs = extract_pdfs(pdf_files(base_path))                  # 并行提取，返回 [Document]
+#   text = docs[0].text()
+#   for table in docs[0].tables(): print(table.attrs['page'], table.shape)
+#   python pdf_extract.py D:\SHLT\cqgs\cqbylw                  # 提取目录下全部 PDF
+
+# CSMAR 下载包里的版权声明，不需要提取
+skip_names = {'版权声明.pdf'}
+
+# 每个进程任务处理的页数 (打开一次 PDF 处理多页)
+pages_per_task = 16
+
+# 缓存格式改变时加 1，旧缓存不再使用
+cache_version = 1
+
+
+def pdf_cache_dir():
+    return os.path.join(cache_root(), 'pdf')
+
+
+# 目录下 (含子目录) 的全部 PDF
+def pdf_files(root):
+    paths = glob.glob(os.path.join(root, '**', '*.pdf'), recursive=True)
+    return sorted(p for p in paths if os.path.basename(p) not in skip_names and not os.path.basename(p).startswith('~$'))
+
+
+# 文件哈希：大小和修改时间没变时沿用上次的结果 (与 pipeline.py 的输入指纹相同的做法)
+def _hash_index_path():
+    return os.path.join(pdf_cache_dir(), 'files.json')
+
+
+def load_hash_index():
+    try:
+        with open(_hash_index_path(), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_hash_index(index):
+    os.makedirs(pdf_cache_dir(), exist_ok=True)
+    tmp_path = _hash_index_path() + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, _hash_index_path())
+
+
+def pdf_digest(path, index):
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    known = index.get(path)
+    if known and known[0] == stat.st_size and known[1] == stat.st_mtime:
+        return known[2]
+    digest = file_hash(path)
+    index[path] = [stat.st_size, stat.st_mtime, digest]
+    return digest
+
+
+def _page_path(doc_dir, page_no):
+    return os.path.join(doc_dir, f"page_{page_no:05d}.json")
+
+
+# 该页已成功提取 (缓存文件存在且没有 error)；tables=True 时还要求提取了表格
+def _page_done(page_path, tables=False):
+    try:
+        with open(page_path, 'r', encoding='utf-8') as f:
+            record = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return record.get('error') is None and (not tables or record.get('with_tables', False))
+
+
+# 表格：pdfplumber 返回的行列表 -> DataFrame，第一行作为表头 (空表头、重复表头加序号)
+def table_frame(rows):
+    rows = [[('' if v is None else str(v)) for v in row] for row in rows if row]
+    if not rows:
+        return pd.DataFrame()
+    width = max(len(r) for r in rows)
+    rows = [r + [''] * (width - len(r)) for r in rows]
+    header, seen = [], {}
+    for i, name in enumerate(rows[0]):
+        name = name.strip() or f"col{i + 1}"
+        seen[name] = seen.get(name, 0) + 1
+        header.append(name if seen[name] == 1 else f"{name}_{seen[name]}")
+    return pd.DataFrame(rows[1:], columns=header)
+
+
+# 子进程：提取一个 PDF 的一段页，每页写一个缓存文件，返回 (成功页数, 出错页数)
+def _extract_pages(path, doc_dir, page_numbers, tables=True):
+    done, failed = 0, 0
+    with pdfplumber.open(path) as pdf:
+        for page_no in page_numbers:
+            record = {'page': page_no, 'text': '', 'tables': [], 'with_tables': tables, 'error': None}
+            try:
+                page = pdf.pages[page_no - 1]
+                record['text'] = page.extract_text() or ''
+                if tables:
+                    record['tables'] = [t for t in (page.extract_tables() or []) if t]
+                # 释放该页解析出的对象，长文档的内存不随页数增长
+                page.close()
+                done += 1
+            except Exception as e:
+                record['error'] = f"{type(e).__name__}: {e}"
+                failed += 1
+            out_path = _page_path(doc_dir, page_no)
+            with open(out_path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(record, f, ensure_ascii=False)
+            os.replace(out_path + '.tmp', out_path)
+    return done, failed
+
+
+@dataclass
+class Document:
+    path: str
+    digest: str
+    n_pages: int
+    cache_dir: str
+    error: str = None
+    with_tables: bool = None  # 全部页都已提取时是否含表格 (meta.json 的 tables)，还有页没提取完为 None
+
+    def _records(self):
+        for page_no in range(1, self.n_pages + 1):
+            page_path = _page_path(self.cache_dir, page_no)
+            if not os.path.exists(page_path):
+                continue
+            with open(page_path, 'r', encoding='utf-8') as f:
+                yield json.load(f)
+
+    # 逐页文本 (不一次性读入全部页)
+    def pages(self):
+        for record in self._records():
+            yield record['text']
+
+    def text(self, sep='\n'):
+        return sep.join(self.pages())
+
+    # 全部表格，每个 DataFrame 的 attrs['page'] 为所在页码
+    def tables(self):
+        out = []
+        for record in self._records():
+            for rows in record['tables']:
+                df = table_frame(rows)
+                df.attrs['page'] = record['page']
+                out.append(df)
+        return out
+
+    def failed_pages(self):
+        return [r['page'] for r in self._records() if r['error']]
+
+
+# 打开 PDF 读取页数，记录在文档目录的 meta.json 中 (之后不再打开)
+def _document(path, digest):
+    doc_dir = os.path.join(pdf_cache_dir(), digest)
+    meta_path = os.path.join(doc_dir, 'meta.json')
+    if os.path.exists(meta_path):
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') == cache_version:
+            return Document(path, digest, meta['n_pages'], doc_dir, with_tables=meta.get('tables'))
+    if not HAS_PDFPLUMBER:
+        return Document(path, digest, 0, doc_dir, error="pdfplumber is not installed (pip install pdfplumber)")
+    os.makedirs(doc_dir, exist_ok=True)
+    try:
+        with pdfplumber.open(path) as pdf:
+            n_pages = len(pdf.pages)
+    except Exception as e:
+        return Document(path, digest, 0, doc_dir, error=f"{type(e).__name__}: {e}")
+    doc = Document(path, digest, n_pages, doc_dir)
+    _save_meta(doc)
+    return doc
+
+
+def _save_meta(doc):
+    meta_path = os.path.join(doc.cache_dir, 'meta.json')
+    meta = {'version': cache_version, 'source': os.path.abspath(doc.path), 'n_pages': doc.n_pages, 'tables': doc.with_tables}
+    with open(meta_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(meta_path + '.tmp', meta_path)
+
+
+# 还需要提取的页；全部页都已提取 (且满足 tables 要求) 时记进 meta.json
+def _pages_todo(doc, tables):
+    if doc.with_tables or (doc.with_tables is not None and not tables):
+        return []
+    todo = [n for n in range(1, doc.n_pages + 1) if not _page_done(_page_path(doc.cache_dir, n), tables)]
+    if not todo:
+        doc.with_tables = tables
+        _save_meta(doc)
+    return todo
+
+
+# 文件不存在或读不了时返回带 error 的 Document (没有页)
+def _open_document(path, index):
+    try:
+        digest = pdf_digest(path, index)
+    except OSError as e:
+        return Document(path, None, 0, None, error=f"{type(e).__name__}: {e}")
+    return _document(path, digest)
+
+
+# 并行提取一组 PDF，返回与 paths 同顺序的 [Document]；已缓存的页不再提取
+def extract_pdfs(paths, tables=True, max_workers=None, verbose=True):
+    index = load_hash_index()
+    docs = [_open_document(p, index) for p in paths]
+    save_hash_index(index)
+
+    jobs, job_docs = [], []
+    for doc in docs:
+        todo = [] if doc.error else _pages_todo(doc, tables)
+        # 页数已缓存，但还有页要提取时仍需要 pdfplumber
+        if todo and not HAS_PDFPLUMBER:
+            doc.error = "pdfplumber is not installed (pip install pdfplumber)"
+        if doc.error:
+            print(f"Warning: cannot open {doc.path}: {doc.error}")
+            continue
+        for start in range(0, len(todo), pages_per_task):
+            jobs.append((doc.path, doc.cache_dir, todo[start:start + pages_per_task], tables))
+            job_docs.append(doc)
+    if verbose:
+        cached = sum(d.n_pages for d in docs) - sum(len(j[2]) for j in jobs)
+        print(f"{len(docs)} PDFs: {sum(len(j[2]) for j in jobs)} pages to extract, {cached} pages cached")
+    if not jobs:
+        return docs
+
+    if max_workers is None:
+        max_workers = min(len(jobs), os.cpu_count() or 1)
+    failed = 0
+
+    # 整段提取失败 (如 PDF 在子进程中打不开) 时记在文档的 error 上
+    def job_failed(doc, e):
+        doc.error = f"{type(e).__name__}: {e}"
+        print(f"Warning: extraction failed for {doc.path}: {doc.error}")
+
+    if max_workers <= 1:
+        for job, doc in zip(jobs, job_docs):
+            try:
+                failed += _extract_pages(*job)[1]
+            except Exception as e:
+                job_failed(doc, e)
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = {pool.submit(_extract_pages, *job): doc for job, doc in zip(jobs, job_docs)}
+            for future in as_completed(futures):
+                try:
+                    failed += future.result()[1]
+                except Exception as e:
+                    job_failed(futures[future], e)
+    if failed and verbose:
+        print(f"Warning: {failed} pages could not be extracted (see Document.failed_pages())")
+    # 提取完整的文档记进 meta.json
+    for doc in {id(d): d for d in job_docs}.values():
+        if not doc.error:
+            _pages_todo(doc, tables)
+    return docs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract text and tables from all PDFs under a folder (cached per page).")
+    parser.add_argument('root', nargs='?', default=r"D:\SHLT\cqgs\cqbylw", help="folder to scan for PDFs")
+    parser.add_argument('--no-tables', action='store_true', help="extract text only")
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    docs = extract_pdfs(pdf_files(args.root), tables=not args.no_tables, max_workers=args.workers)
+    for doc in docs:
+        print(f"  {os.path.basename(doc.path)}: {doc.n_pages} pages -> {doc.cache_dir}")
+
+
+# Windows 下进程池需要 main 保护
+if __name__ == "__main__":
+    main()
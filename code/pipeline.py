@@ -0,0 +1,211 @@
+import pandas as pd
+import os
+import json
+import hashlib
+import ast
+import inspect
+import time
+from csmar_cache import repo_root, source_hash
+from csmar_zip import source_exists, source_stat
+import instrument
+
+# 增量流水线
+# 把 数据清洗 -> TFP 计算 -> 回归 声明成带依赖关系的阶段 (stage)。每个阶段的指纹由
+#   输入文件内容哈希 + 阶段参数 + 阶段代码 (函数所在模块及其依赖模块的源码) + 上游阶段指纹
+# 共同决定；指纹没变的阶段直接复用上次保存的结果，不再重新计算。
+# 同一次运行中，上游阶段的 DataFrame 直接在内存里传给下游，不再经过 CSV。
+# 每个实际运行的阶段都会在 state_dir 下写一份运行报告 report_<阶段名>.json (见 instrument.py)。
+#
+# 用法 (完整示例见 run_pipeline.py)：
+#   pipe = Pipeline()
+#   pipe.add('clean', clean_stage, files=[...])
+#   pipe.add('tfp', tfp_stage, files=[...])
+#   pipe.add('regression', regression_stage, deps=['clean', 'tfp'], params={'min_year': 2016})
+#   results = pipe.run()
+
+default_state_dir = os.path.join(repo_root, "data", ".cache", "pipeline")
+
+
+# 源文件 import 的同目录模块 (import x / from x import y)；importlib.import_module 加载的脚本需要写进 stage.code
+def _local_imports(path):
+    with open(path, "rb") as f:
+        tree = ast.parse(f.read(), filename=path)
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.add(node.module.split(".")[0])
+    folder = os.path.dirname(os.path.abspath(path))
+    return [p for p in (os.path.join(folder, f"{name}.py") for name in sorted(names)) if os.path.exists(p)]
+
+
+# roots 及其递归依赖的全部本地源文件 (按路径排序，去重)
+def local_sources(roots):
+    seen, todo = set(), [os.path.abspath(p) for p in roots]
+    while todo:
+        path = todo.pop()
+        if path in seen:
+            continue
+        seen.add(path)
+        todo.extend(_local_imports(path))
+    return sorted(seen)
+
+
+class Stage:
+    def __init__(self, name, func, deps=(), files=(), params=None, export=None, code=()):
+        self.name = name
+        self.func = func            # func(*上游结果, **params) -> 结果
+        self.deps = list(deps)      # 上游阶段名，结果按顺序作为位置参数传入
+        self.files = files if callable(files) else list(files)  # 输入文件路径 (或返回路径列表的函数，运行时再解析)
+        self.params = dict(params or {})
+        self.export = export        # 可选：func(result) 把结果另外导出 (如写 CSV)
+        self.code = list(code)      # 除 func 所在模块外，还会影响结果的模块 (模块对象或文件路径)
+
+    def input_files(self):
+        files = self.files() if callable(self.files) else self.files
+        return sorted(os.path.abspath(f) for f in files if f)
+
+
+class Pipeline:
+    def __init__(self, state_dir=None):
+        self.state_dir = state_dir or default_state_dir
+        self.stages = {}
+        os.makedirs(self.state_dir, exist_ok=True)
+        self.state_path = os.path.join(self.state_dir, "state.json")
+        self.state = self._load_state()
+
+    def add(self, name, func, deps=(), files=(), params=None, export=None, code=()):
+        for dep in deps:
+            if dep not in self.stages:
+                raise ValueError(f"stage {name} depends on unknown stage {dep}")
+        self.stages[name] = Stage(name, func, deps, files, params, export, code)
+        return self
+
+    def _load_state(self):
+        if os.path.exists(self.state_path):
+            try:
+                with open(self.state_path, "r", encoding="utf-8") as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                pass
+        return {"stages": {}, "files": {}}
+
+    def _save_state(self):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.state_path)
+
+    # 文件指纹：大小和修改时间没变时沿用上次算出的内容哈希 (zip 包里的成员用 CRC32，见 csmar_zip.py)
+    def _file_fingerprint(self, path):
+        if not source_exists(path):
+            return None
+        size, mtime = source_stat(path)
+        known = self.state["files"].get(path)
+        if known and known[0] == size and known[1] == mtime:
+            return known[2]
+        digest = source_hash(path)
+        self.state["files"][path] = [size, mtime, digest]
+        return digest
+
+    # 阶段代码指纹：func 所在模块、stage.code 中各模块，以及它们 (递归) import 的本目录模块的源文件内容
+    # (如 csmar_xlsx、csmar_zip 改了，清洗和 TFP 阶段都会重新运行)
+    def _code_fingerprint(self, stage):
+        h = hashlib.sha1(stage.func.__qualname__.encode("utf-8"))
+        roots = [item if isinstance(item, str) else inspect.getsourcefile(item) for item in [stage.func] + stage.code]
+        for path in local_sources(roots):
+            h.update(os.path.basename(path).encode("utf-8"))
+            with open(path, "rb") as f:
+                h.update(f.read())
+        return h.hexdigest()
+
+    def _fingerprint(self, stage, dep_fingerprints):
+        payload = {
+            "files": {f: self._file_fingerprint(f) for f in stage.input_files()},
+            "params": repr(sorted(stage.params.items())),
+            "code": self._code_fingerprint(stage),
+            "deps": [dep_fingerprints[d] for d in stage.deps],
+        }
+        raw = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _result_path(self, name):
+        return os.path.join(self.state_dir, f"{name}.pkl")
+
+    # 计算 targets (默认全部阶段) 及其上游阶段的执行顺序
+    def _order(self, targets):
+        order, seen = [], set()
+
+        def visit(name):
+            if name in seen:
+                return
+            seen.add(name)
+            for dep in self.stages[name].deps:
+                visit(dep)
+            order.append(name)
+
+        for name in targets:
+            visit(name)
+        return order
+
+    # 运行流水线，返回 {阶段名: 结果}
+    # force: 需要强制重新运行的阶段名列表 (或 True 表示全部)
+    def run(self, targets=None, force=()):
+        targets = list(targets or self.stages)
+        order = self._order(targets)
+
+        fingerprints = {}
+        for name in order:
+            stage = self.stages[name]
+            fingerprints[name] = self._fingerprint(stage, fingerprints)
+
+        # 需要重新运行的阶段：指纹变了、没有保存的结果、被强制，或上游需要重新运行
+        dirty = set()
+        for name in order:
+            stage = self.stages[name]
+            saved = self.state["stages"].get(name, {})
+            if (force is True or name in force
+                    or saved.get("fingerprint") != fingerprints[name]
+                    or not os.path.exists(self._result_path(name))
+                    or any(d in dirty for d in stage.deps)):
+                dirty.add(name)
+
+        results = {}
+
+        # 只在确实需要时才从磁盘加载未变阶段的结果
+        def get(name):
+            if name not in results:
+                print(f"[pipeline] {name}: up to date, loading cached result")
+                results[name] = pd.read_pickle(self._result_path(name))
+            return results[name]
+
+        for name in order:
+            if name not in dirty:
+                continue
+            stage = self.stages[name]
+            inputs = [get(dep) for dep in stage.deps]
+            print(f"[pipeline] {name}: running")
+            start = time.time()
+            instrument.start_run(name, report_path=os.path.join(self.state_dir, f"report_{name}.json"))
+            try:
+                result = stage.func(*inputs, **stage.params)
+            finally:
+                instrument.finish_run()
+            elapsed = time.time() - start
+            results[name] = result
+            pd.to_pickle(result, self._result_path(name))
+            if stage.export is not None:
+                stage.export(result)
+            self.state["stages"][name] = {
+                "fingerprint": fingerprints[name],
+                "finished": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "seconds": round(elapsed, 3),
+            }
+            self._save_state()
+            print(f"[pipeline] {name}: done in {elapsed:.1f}s")
+
+        for name in targets:
+            get(name)
+        self._save_state()
+        return {name: results[name] for name in targets}
@@ -0,0 +1,276 @@
+import pandas as pd
+import numpy as np
+import os
+import re
+import json
+import hashlib
+from csmar_cache import cache_root, read_cached
+from csmar_zip import source_stat
+from csmar_xlsx import read_csmar_xlsx
+
+# 地区名称解析索引 (城市 / 省份 GDP 合并用)
+# 企业注册地 (省份、城市名称或注册地址) 和 GDP 表里的地区名称写法经常不一致：
+#   "深圳市" / "深圳"、"广西壮族自治区" / "广西"、"恩施土家族苗族自治州" / "恩施州"、多余空格……
+# 这里用 GDP 表中的 行政区划代码 (如 440300) 作为地区的规范代码：
+#   1. 从两张 GDP 表生成每个地区的各种写法 (全称、去掉 省/市/自治区/自治州 等后缀的简称……) -> 代码；
+#   2. 原始地名 / 地址只对 "不重复的取值" 解析一次 (地址按最长前缀匹配 省份 + 城市)，
+#      解析结果和写法表一起保存在缓存目录的 region_index_*.json，下次运行直接复用；
+#   3. 每个企业-年度拿到 城市代码、省份代码 后，按 (代码, 年份) 整数键一次性查出 GDP_City / GDP_Prov。
+# 找不到城市的 (县级市、"省直辖县级行政区划" 等) 退回到省份；仍然解析不了的地名单独列出。
+#
+# 用法：
+#   index = load_region_index(city_gdp_file, prov_gdp_file)
+#   loc = index.locate(province=df['Province'], city=df['City'], address=df['RegisterAddress'])
+#   gdp_city = gdp_lookup(loc['CityCode'], df['Year'], city_gdp)
+
+# 生成规则改变时加 1，已保存的索引会重建
+index_version = 2
+
+# 不是具体地区的占位名称
+placeholder_names = {'中国', '全国', '省直辖县级行政区划', '自治区直辖县级行政区划'}
+
+# 更名 / 撤并的城市：旧名 -> 现名
+renamed_cities = {'襄樊': '襄阳', '思茅': '普洱', '莱芜': '济南', '巢湖': '合肥'}
+
+# 自治区 / 自治州名称中的民族 (用于生成 "恩施"、"恩施州" 这样的简称)
+ethnic_groups = ['土家', '苗', '侗', '布依', '朝鲜', '藏', '羌', '彝', '白', '哈尼', '傣', '壮', '回', '蒙古', '哈萨克',
+                 '柯尔克孜', '景颇', '傈僳', '纳西', '黎', '维吾尔', '撒拉', '保安', '东乡', '畲', '瑶', '仡佬', '水',
+                 '满', '达斡尔', '鄂温克', '锡伯', '仫佬', '毛南', '怒', '独龙', '普米', '拉祜', '佤', '布朗', '阿昌',
+                 '德昂', '基诺', '京', '门巴', '珞巴', '塔吉克', '乌孜别克', '裕固', '赫哲', '鄂伦春', '土']
+ethnic_pattern = re.compile(r'^(.{2,}?)(?:(?:' + '|'.join(sorted(ethnic_groups, key=len, reverse=True))
+                            + r')族?)+自治(?:区|州|县|旗)$')
+admin_suffixes = ('特别行政区', '自治区', '自治州', '地区', '省', '市', '盟')
+
+whitespace = re.compile(r'[\s　]+')
+
+
+def normalize(name):
+    if name is None or (isinstance(name, float) and np.isnan(name)):
+        return ''
+    return whitespace.sub('', str(name))
+
+
+# 一个地名的各种写法 (都已去掉空白)
+def name_variants(name, level):
+    full = normalize(name)
+    variants = {full}
+    m = ethnic_pattern.match(full)
+    if m:
+        core = m.group(1)
+        if full.endswith('自治州'):
+            variants.add(core + '州')
+    else:
+        core = full
+        for suffix in admin_suffixes:
+            if core.endswith(suffix) and len(core) - len(suffix) >= 2:
+                core = core[:-len(suffix)]
+                break
+    variants.add(core)
+    if level == 'city':
+        variants.add(core + '市')
+    else:
+        variants.add(core + '省')
+    return {v for v in variants if len(v) >= 2}
+
+
+def _province_of(code):
+    return code[:2] + '0000'
+
+
+class RegionIndex:
+    def __init__(self, regions, aliases, resolved=None, fingerprint=None, path=None):
+        self.path = path
+        self.regions = regions            # 代码 -> {'name', 'level'}
+        self.aliases = aliases            # {'province': {写法: 代码}, 'city': {写法: 代码}}
+        self.resolved = resolved or {}    # 原始取值 (省份|城市|地址) -> [省份代码, 城市代码]
+        self.fingerprint = fingerprint
+        self._lengths = {level: sorted({len(a) for a in names}, reverse=True) for level, names in aliases.items()}
+
+    # 从 GDP 表建立索引 (city_gdp: Ctnm, Ctnm_id, Prvcnm；prov_gdp: Prvcnm, Prvcnm_id)
+    @classmethod
+    def build(cls, city_gdp, prov_gdp, fingerprint=None):
+        regions = {}
+        for name, code in prov_gdp[['Prvcnm', 'Prvcnm_id']].drop_duplicates().itertuples(index=False):
+            if normalize(name) not in placeholder_names and pd.notna(code):
+                regions[str(code)] = {'name': normalize(name), 'level': 'province'}
+        for name, code, prov in city_gdp[['Ctnm', 'Ctnm_id', 'Prvcnm']].drop_duplicates().itertuples(index=False):
+            if normalize(name) in placeholder_names or pd.isna(code):
+                continue
+            code = str(code)
+            if code == _province_of(code):
+                # 直辖市在城市表里的代码就是省级代码
+                regions.setdefault(code, {'name': normalize(name), 'level': 'province'})
+                regions[code]['municipality'] = True
+                continue
+            regions[code] = {'name': normalize(name), 'level': 'city'}
+            if _province_of(code) not in regions and pd.notna(prov):
+                regions[_province_of(code)] = {'name': normalize(prov), 'level': 'province'}
+
+        # 写法 -> 代码；同一层级内对应多个代码的写法有歧义，不使用
+        aliases = {'province': {}, 'city': {}}
+        ambiguous = {'province': set(), 'city': set()}
+        for code, info in regions.items():
+            levels = [info['level']] + (['city'] if info.get('municipality') else [])
+            for level in levels:
+                for v in name_variants(info['name'], level):
+                    if aliases[level].get(v, code) != code:
+                        ambiguous[level].add(v)
+                    aliases[level][v] = code
+        for level in aliases:
+            for v in ambiguous[level]:
+                del aliases[level][v]
+        for old, new in renamed_cities.items():
+            code = aliases['city'].get(new)
+            if code is not None:
+                for v in name_variants(old, 'city'):
+                    aliases['city'].setdefault(v, code)
+        return cls(regions, aliases, fingerprint=fingerprint)
+
+    def name(self, code):
+        return self.regions[code]['name'] if code in self.regions else None
+
+    # 地址开头的最长匹配：返回 (代码, 匹配长度)
+    def _prefix(self, text, level, province=None):
+        names = self.aliases[level]
+        for n in self._lengths[level]:
+            code = names.get(text[:n])
+            if code is not None and (province is None or _province_of(code) == province):
+                return code, n
+        return None, 0
+
+    # 从地址中解析 省份、城市 (如 "广东省深圳市南山区..."、"深圳市南山区..."、"上海市松江区...")
+    def parse_address(self, text):
+        text = normalize(text)
+        if text.startswith('中国'):
+            text = text[2:]
+        province, n = self._prefix(text, 'province')
+        rest = text[n:]
+        city, _ = self._prefix(rest, 'city', province)
+        if city is None and province is None:
+            city, _ = self._prefix(text, 'city')
+        if city is None and province is not None and self.regions[province].get('municipality'):
+            city = province
+        return province, city
+
+    # 单个 (省份, 城市, 地址) 组合的解析
+    def _resolve_one(self, province, city, address):
+        prov_code = self.aliases['province'].get(normalize(province)) if province else None
+        city_code = None
+        if city:
+            city_code = self.aliases['city'].get(normalize(city))
+            if city_code is not None and prov_code is not None and _province_of(city_code) != prov_code:
+                city_code = None
+        if address and (prov_code is None or city_code is None):
+            a_prov, a_city = self.parse_address(address)
+            prov_code = prov_code or a_prov
+            if city_code is None and a_city is not None and (prov_code is None or _province_of(a_city) == prov_code):
+                city_code = a_city
+        if prov_code is None and city_code is not None:
+            prov_code = _province_of(city_code)
+        return [prov_code, city_code]
+
+    # 向量化解析：只对不重复的 (省份, 城市, 地址) 组合解析一次 (并记入 resolved，保存后下次复用)
+    # 返回与输入同索引的 DataFrame：ProvinceCode, CityCode, Province, City；用到的原始取值在 .attrs['keys']
+    def locate(self, province=None, city=None, address=None, index=None):
+        parts = [s for s in (province, city, address) if s is not None]
+        index = parts[0].index if parts else index
+        cols = [pd.Series(s, index=index).astype(object).where(pd.notna(s), '').astype(str).map(normalize)
+                if s is not None else pd.Series('', index=index) for s in (province, city, address)]
+        keys = cols[0] + '|' + cols[1] + '|' + cols[2]
+        codes, uniques = pd.factorize(keys)
+
+        table = []
+        for key in uniques:
+            hit = self.resolved.get(key)
+            if hit is None:
+                hit = self._resolve_one(*key.split('|', 2))
+                self.resolved[key] = hit
+            table.append(hit)
+        table = np.array(table, dtype=object).reshape(-1, 2)
+        prov_codes = pd.Series(table[codes, 0] if len(table) else [], index=index, dtype=object)
+        city_codes = pd.Series(table[codes, 1] if len(table) else [], index=index, dtype=object)
+        names = {code: info['name'] for code, info in self.regions.items()}
+        loc = pd.DataFrame({'ProvinceCode': prov_codes, 'CityCode': city_codes,
+                            'Province': prov_codes.map(names), 'City': city_codes.map(names)})
+        loc.attrs['keys'] = list(uniques)
+        return loc
+
+    # 解析不了的原始取值 ("省份|城市|地址")，keys 默认为保存过的全部取值
+    def unresolved(self, keys=None, level='province'):
+        col = 0 if level == 'province' else 1
+        keys = self.resolved if keys is None else keys
+        return sorted(k for k in keys if k.strip('|') and self.resolved.get(k, [None, None])[col] is None)
+
+    def save(self, path=None):
+        path = path or self.path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = {'version': index_version, 'fingerprint': self.fingerprint, 'regions': self.regions,
+                'aliases': self.aliases, 'resolved': self.resolved}
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != index_version:
+            return None
+        return cls(data['regions'], data['aliases'], data.get('resolved'), data.get('fingerprint'), path)
+
+
+# 读取 GDP 表 (年份为数值的行)
+def read_gdp_table(path, columns, year_col='Sgnyea'):
+    df = read_cached(path, read_csmar_xlsx, columns=columns, key=year_col)
+    df = df[pd.to_numeric(df[year_col], errors='coerce').notna()].copy()
+    df['Year'] = pd.to_numeric(df[year_col]).astype('int64')
+    return df
+
+
+def _fingerprint(paths):
+    parts = []
+    for path in paths:
+        size, mtime = source_stat(path)
+        parts.append([os.path.abspath(path), size, mtime])
+    return json.dumps(parts, ensure_ascii=False)
+
+
+# 每组 GDP 文件一个索引文件 (基准测试的合成数据不会覆盖真实数据的索引)
+def default_index_path(paths=()):
+    digest = hashlib.sha1('|'.join(os.path.abspath(p) for p in paths).encode('utf-8')).hexdigest()[:10]
+    return os.path.join(cache_root(), f'region_index_{digest}.json')
+
+
+# 加载 (或重建) 地区索引：GDP 表没变时直接用保存的写法表和解析结果
+def load_region_index(city_gdp_file, prov_gdp_file, city_gdp=None, prov_gdp=None, path=None):
+    path = path or default_index_path([city_gdp_file, prov_gdp_file])
+    fingerprint = _fingerprint([city_gdp_file, prov_gdp_file])
+    if os.path.exists(path):
+        try:
+            index = RegionIndex.load(path)
+        except (OSError, ValueError, KeyError):
+            index = None
+        if index is not None and index.fingerprint == fingerprint:
+            return index
+    if city_gdp is None:
+        city_gdp = read_gdp_table(city_gdp_file, ['Sgnyea', 'Ctnm', 'Ctnm_id', 'Prvcnm', 'Gdpct01'])
+    if prov_gdp is None:
+        prov_gdp = read_gdp_table(prov_gdp_file, ['Sgnyea', 'Prvcnm_id', 'Prvcnm', 'Gdp0101'])
+    index = RegionIndex.build(city_gdp, prov_gdp, fingerprint=fingerprint)
+    index.path = path
+    index.save()
+    return index
+
+
+# 按 (地区代码, 年份) 查 GDP，codes 中缺失的返回 NaN
+def gdp_lookup(codes, years, gdp, code_col, value_col):
+    table = gdp.assign(_code=gdp[code_col].astype(str))
+    table = table.dropna(subset=[value_col]).drop_duplicates(['_code', 'Year'], keep='last')
+    series = pd.to_numeric(table[value_col], errors='coerce').to_numpy(dtype='float64')
+    lookup = pd.MultiIndex.from_arrays([table['_code'].to_numpy(), table['Year'].to_numpy(dtype='int64')])
+    keys = pd.MultiIndex.from_arrays([pd.Series(codes).astype(object).where(pd.notna(codes), '').to_numpy(),
+                                      pd.Series(years).to_numpy(dtype='int64')])
+    pos = lookup.get_indexer(keys)
+    out = np.where(pos >= 0, series[pos], np.nan)
+    return out
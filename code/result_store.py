@@ -0,0 +1,260 @@
+import numpy as np
+import os
+import json
+import time
+import zlib
+import hashlib
+from csmar_cache import repo_root
+
+# 结果版本库：按内容寻址、分块压缩、跨版本去重
+# 每次保存 (snapshot) 把一组输出文件 (final_data 数据集、tfp_result、实证结果报告.md ……) 切成块：
+#   - 按内容切块 (content-defined chunking)：块边界由滑动窗口 (48 字节) 的哈希决定，而不是固定偏移，
+#     文件中间插入或删除几行只影响附近的块，其余块和上一版完全相同；
+#     窗口哈希用 numpy 的前缀和一次算出 (uint64 溢出即取模)，不逐字节循环；
+#   - 每块以 SHA-256 命名、zlib 压缩后存在 objects/ 下，已存在的块不再写入 (跨版本、跨文件去重)；
+#   - 版本清单 versions/<版本号>.json 记录：各文件的块列表、大小和哈希，说明，
+#     以及产生这些结果的输入 (流水线 state.json 中各输入文件的内容哈希、各阶段指纹) 和参数。
+# 几百个实验版本之间大部分块是共用的，新增一个版本只写入真正变化的块；checkout 按清单把块解压拼回文件。
+#
+# 用法：
+#   store = ResultStore()
+#   version = store.snapshot(data_dir, ['final_data', 'tfp_result.csv'], message='baseline', params={...})
+#   store.versions()                         # [{'id', 'created', 'message', 'bytes', 'stored_bytes'}, ...]
+#   store.checkout(version, dest_dir)        # 恢复该版本的全部文件
+#   python archive_old_results.py --list     # 命令行见 archive_old_results.py
+
+default_store_dir = os.path.join(repo_root, "data", "results_store")
+
+# 块大小：平均约 64 KB (边界条件 hash & mask == 0)，最小 16 KB，最大 256 KB
+chunk_mask = (1 << 16) - 1
+min_chunk = 16 * 1024
+max_chunk = 256 * 1024
+window = 48
+# 计算边界时每段处理的字节数
+scan_block = 4 * 1024 * 1024
+hash_base = np.uint64(0x100000001B3)
+
+compress_level = 6
+
+
+# 每个位置结尾的 window 字节滑动哈希：H[i] = sum_k b[i-k] * base^k (mod 2^64)
+# 用前缀和 P[i] = sum_{j<i} b[j] * base^-j 得到 H[i] = (P[i+1] - P[i+1-window]) * base^i，全部是向量运算
+def _window_hashes(data):
+    b = np.frombuffer(data, dtype=np.uint8).astype(np.uint64)
+    n = len(b)
+    inv = np.uint64(pow(int(hash_base), -1, 2 ** 64))
+    with np.errstate(over='ignore'):
+        powers = np.empty(n, dtype=np.uint64)
+        inv_powers = np.empty(n, dtype=np.uint64)
+        powers[0] = inv_powers[0] = 1
+        if n > 1:
+            powers[1:] = hash_base
+            inv_powers[1:] = inv
+            powers = np.cumprod(powers, dtype=np.uint64)
+            inv_powers = np.cumprod(inv_powers, dtype=np.uint64)
+        prefix = np.concatenate([[np.uint64(0)], np.cumsum(b * inv_powers, dtype=np.uint64)])
+        start = np.maximum(np.arange(1, n + 1) - window, 0)
+        hashes = (prefix[1:] - prefix[start]) * powers
+    # 高位混合得更均匀，用高 16 位判断边界
+    return hashes >> np.uint64(40)
+
+
+# 块边界 (每块的结束位置)
+def chunk_boundaries(data):
+    n = len(data)
+    if n <= min_chunk:
+        return [n] if n else []
+    # 分段计算窗口哈希 (每段向前多取 window - 1 字节)，大文件的临时数组不超过 scan_block 个元素
+    candidates = []
+    for seg in range(0, n, scan_block):
+        lo = max(seg - window + 1, 0)
+        hashes = _window_hashes(data[lo:seg + scan_block])[seg - lo:]
+        candidates.append(np.flatnonzero((hashes & np.uint64(chunk_mask)) == 0) + seg + 1)
+    candidates = np.concatenate(candidates)
+    ends, last = [], 0
+    for pos in candidates:
+        if pos - last < min_chunk:
+            continue
+        while pos - last > max_chunk:
+            last += max_chunk
+            ends.append(last)
+        if pos - last >= min_chunk:
+            ends.append(int(pos))
+            last = int(pos)
+    while n - last > max_chunk:
+        last += max_chunk
+        ends.append(last)
+    if last < n:
+        ends.append(n)
+    return ends
+
+
+def _sha(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class ResultStore:
+    def __init__(self, store_dir=None):
+        self.store_dir = store_dir or default_store_dir
+        self.objects_dir = os.path.join(self.store_dir, "objects")
+        self.versions_dir = os.path.join(self.store_dir, "versions")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.versions_dir, exist_ok=True)
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest[2:])
+
+    # 写入一个块 (已存在则跳过)，返回 (哈希, 新写入的压缩字节数)
+    def _put(self, chunk):
+        digest = _sha(chunk)
+        path = self._object_path(digest)
+        if os.path.exists(path):
+            return digest, 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        packed = zlib.compress(chunk, compress_level)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(packed)
+        os.replace(tmp_path, path)
+        return digest, len(packed)
+
+    def _get(self, digest):
+        with open(self._object_path(digest), 'rb') as f:
+            return zlib.decompress(f.read())
+
+    def _put_file(self, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        chunks, written, start = [], 0, 0
+        for end in chunk_boundaries(data):
+            digest, n = self._put(data[start:end])
+            chunks.append(digest)
+            written += n
+            start = end
+        return {'size': len(data), 'sha256': _sha(data), 'chunks': chunks}, written
+
+    # 保存一个版本：paths 为相对 base_dir 的文件或目录 (目录递归保存)，不存在的跳过
+    # inputs / params 为产生这些结果的输入和参数 (默认读取流水线 state.json)
+    def snapshot(self, base_dir, paths, message='', inputs=None, params=None, state_path=None):
+        files = {}
+        for rel in paths:
+            full = os.path.join(base_dir, rel)
+            if os.path.isdir(full):
+                for folder, _, names in os.walk(full):
+                    for name in sorted(names):
+                        path = os.path.join(folder, name)
+                        files[os.path.relpath(path, base_dir).replace(os.sep, '/')] = path
+            elif os.path.exists(full):
+                files[rel.replace(os.sep, '/')] = full
+            else:
+                print(f"{rel} not found, skipping.")
+        if not files:
+            print("Nothing to archive.")
+            return None
+
+        if inputs is None:
+            inputs = pipeline_inputs(state_path)
+        entries, written = {}, 0
+        for rel, path in sorted(files.items()):
+            entries[rel], n = self._put_file(path)
+            written += n
+
+        manifest = {
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'message': message,
+            'inputs': inputs,
+            'params': params or {},
+            'files': entries,
+            'bytes': sum(e['size'] for e in entries.values()),
+            'stored_bytes': written,
+        }
+        raw = json.dumps(manifest, sort_keys=True, ensure_ascii=False, default=str)
+        version = time.strftime('%Y%m%d-%H%M%S-') + hashlib.sha1(raw.encode('utf-8')).hexdigest()[:8]
+        manifest['id'] = version
+        with open(os.path.join(self.versions_dir, f"{version}.json"), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1, default=str)
+        print(f"Saved version {version}: {len(entries)} files, {manifest['bytes'] / 1024 ** 2:.1f} MB, "
+              f"{written / 1024 ** 2:.2f} MB new data")
+        return version
+
+    def manifest(self, version):
+        path = os.path.join(self.versions_dir, f"{version}.json")
+        if not os.path.exists(path):
+            # 允许只写版本号的开头 (日期) 或结尾 (哈希部分)
+            matches = [v for v in self.version_ids() if v.startswith(version) or v.endswith(version)]
+            if len(matches) != 1:
+                raise KeyError(f"unknown or ambiguous version: {version}")
+            path = os.path.join(self.versions_dir, f"{matches[0]}.json")
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def version_ids(self):
+        return sorted(name[:-5] for name in os.listdir(self.versions_dir) if name.endswith('.json'))
+
+    # 全部版本 (按时间)，不含文件清单
+    def versions(self):
+        out = []
+        for version in self.version_ids():
+            m = self.manifest(version)
+            out.append({k: m.get(k) for k in ('id', 'created', 'message', 'bytes', 'stored_bytes')})
+        return out
+
+    # 恢复一个版本的文件到 dest_dir；内容已相同的文件 (大小和哈希一致) 不重写
+    def checkout(self, version, dest_dir, files=None):
+        m = self.manifest(version)
+        restored = 0
+        for rel, entry in m['files'].items():
+            if files is not None and not any(rel == f or rel.startswith(f.rstrip('/') + '/') for f in files):
+                continue
+            path = os.path.join(dest_dir, *rel.split('/'))
+            if os.path.exists(path) and os.path.getsize(path) == entry['size']:
+                with open(path, 'rb') as f:
+                    if _sha(f.read()) == entry['sha256']:
+                        continue
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                for digest in entry['chunks']:
+                    f.write(self._get(digest))
+            os.replace(tmp_path, path)
+            restored += 1
+        print(f"Checked out {m['id']} to {dest_dir}: {restored} files written, "
+              f"{len(m['files']) - restored} already up to date")
+        return m
+
+    # 没有任何版本引用的块 (删除版本清单后用 gc 回收空间)
+    def gc(self):
+        used = set()
+        for version in self.version_ids():
+            for entry in self.manifest(version)['files'].values():
+                used.update(entry['chunks'])
+        removed = 0
+        for prefix in os.listdir(self.objects_dir):
+            folder = os.path.join(self.objects_dir, prefix)
+            for name in os.listdir(folder):
+                if prefix + name not in used and not name.endswith('.tmp'):
+                    os.remove(os.path.join(folder, name))
+                    removed += 1
+        print(f"Removed {removed} unreferenced chunks")
+        return removed
+
+    # 仓库实际占用的磁盘空间 (字节)
+    def disk_usage(self):
+        total = 0
+        for folder, _, names in os.walk(self.store_dir):
+            total += sum(os.path.getsize(os.path.join(folder, n)) for n in names)
+        return total
+
+
+# 流水线记录的输入：各输入文件的内容哈希和各阶段指纹 (见 pipeline.py)
+def pipeline_inputs(state_path=None):
+    from pipeline import default_state_dir
+    state_path = state_path or os.path.join(default_state_dir, "state.json")
+    if not os.path.exists(state_path):
+        return {}
+    with open(state_path, 'r', encoding='utf-8') as f:
+        state = json.load(f)
+    return {
+        'files': {path: info[2] for path, info in state.get('files', {}).items()},
+        'stages': {name: info.get('fingerprint') for name, info in state.get('stages', {}).items()},
+    }
@@ -0,0 +1,77 @@
+import importlib
+import argparse
+import csmar_loader
+import table_specs
+import panel_join
+import region_index
+import keyword_index
+import panel_transform
+import tfp_lp
+import tfp_grouped
+import hdfe
+import causal_ml
+import forest
+from pipeline import Pipeline
+
+# 一键运行 数据清洗 -> TFP 计算 -> 回归 / 因果分析 (DML、因果森林)，只重新运行输入或参数发生变化的阶段
+#   python run_pipeline.py                    # 运行全部阶段 (没变的阶段直接复用上次结果)
+#   python run_pipeline.py regression         # 只运行回归 (及其需要更新的上游阶段)
+#   python run_pipeline.py --force tfp        # 强制重新计算 TFP
+#
+# 只改回归公式/样本区间时 (下面的 regression_params)，不会重新解析 Excel，也不会重新估计 TFP。
+
+# 脚本文件名以数字开头，不能直接 import
+cleaning = importlib.import_module("01_data_cleaning")
+tfp = importlib.import_module("02_calculate_tfp")
+regression = importlib.import_module("03_regression")
+causal = importlib.import_module("04_causal_analysis")
+
+# 回归阶段参数
+regression_params = {
+    'min_year': regression.min_year,
+    'controls': regression.controls,
+    'absorb': regression.fe_absorb,
+    'cluster': regression.fe_cluster,
+}
+
+
+def build_pipeline():
+    pipe = Pipeline()
+    pipe.add('clean', cleaning.build_final_data,
+             files=lambda: cleaning.source_files(cleaning.base_path),
+             params={'base_path': cleaning.base_path},
+             code=[csmar_loader, table_specs, panel_join, region_index, keyword_index, panel_transform],
+             export=lambda df: cleaning.save_final_data(df, cleaning.output_path, cleaning.csv_path))
+    pipe.add('tfp', tfp.build_tfp,
+             files=lambda: tfp.source_files(tfp.base_path),
+             params={'base_path': tfp.base_path},
+             code=[csmar_loader, table_specs, tfp_lp, tfp_grouped],
+             export=lambda df: tfp.save_tfp(df, tfp.output_path, tfp.csv_path))
+    pipe.add('regression', regression.regression_stage,
+             deps=['clean', 'tfp'],
+             params=regression_params,
+             code=[hdfe])
+    pipe.add('causal', causal.causal_stage,
+             deps=['clean', 'tfp'],
+             params={'min_year': regression_params['min_year']},
+             code=[causal_ml, forest, regression])
+    return pipe
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the thesis data pipeline incrementally.")
+    parser.add_argument('targets', nargs='*', help="stages to run (default: all)")
+    parser.add_argument('--force', nargs='*', default=(),
+                        help="stages to re-run even if unchanged (bare --force: all stages)")
+    args = parser.parse_args()
+    # 只写 --force 不带阶段名时强制重新运行全部阶段
+    force = True if args.force == [] else args.force
+
+    pipe = build_pipeline()
+    pipe.run(targets=args.targets or None, force=force)
+    print("\nPipeline completed.")
+
+
+# Windows 下进程池需要 main 保护
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+import pandas as pd
+import numpy as np
+from dataclasses import dataclass, field
+from scipy import linalg, stats
+
+# 批量回归 (稳健性检验表)
+# 稳健性检验要跑几十上百个模型：不同的被解释变量、控制变量组合、子样本。
+# 逐个调用 ols(formula) 时，每次都要重新解析公式、生成虚拟变量、分解同一个控制变量矩阵。这里改为：
+#   1. 所有用到的变量 (含 C(x) 展开的虚拟变量) 只构造一次，得到一个大的设计矩阵；
+#   2. 样本相同 (子样本 + 缺失值剔除后行相同) 的模型共用一次 X'X、X'y 的计算；
+#   3. 同一组控制变量下的多个被解释变量共用一次 Cholesky 分解；控制变量组合互相嵌套时
+#      (小组是大组的前几项，如 base = Size + Lev，full = Size + Lev + Top1 + ...)，
+#      小模型直接取大模型 Cholesky 因子的左上角块；
+#   4. 结果汇总成一张长表 (每行一个模型的一个系数)。
+# 系数、HC1 标准误与 statsmodels 的 ols(...).fit(cov_type='HC1') 相同。
+#
+# 用法：
+#   grid = SpecGrid(deps=['TFP_OLS', 'ROA'],
+#                   control_sets={'base': ['Size', 'Lev'], 'full': ['Size', 'Lev', 'Top1', 'C(Year)']},
+#                   samples={'all': None, 'SOE': lambda d: d['SOE'] == 1})
+#   table = run_grid(df, grid)
+
+
+@dataclass
+class SpecGrid:
+    deps: list                                    # 被解释变量
+    control_sets: dict                            # 名称 -> 控制变量列表 (或 "a + b + C(c)" 公式字符串)
+    samples: dict = field(default_factory=lambda: {'all': None})   # 名称 -> None / 布尔 Series / 函数(df)
+    key: str = 'Treat_time'                       # 核心解释变量，每个模型都包含
+
+    def size(self):
+        return len(self.deps) * len(self.control_sets) * len(self.samples)
+
+
+# "Size + Lev + C(Year)" -> ['Size', 'Lev', 'C(Year)']
+def parse_terms(controls):
+    if isinstance(controls, str):
+        return [t.strip() for t in controls.split('+') if t.strip()]
+    return list(controls)
+
+
+# 构造设计矩阵：每个变量 (项) 对应的列只生成一次
+# 返回 (n x P 的 float64 数组，列名列表，{项: 列下标列表})
+def build_design(df, terms):
+    blocks, names, columns = [np.ones((len(df), 1))], ['Intercept'], {}
+    for term in terms:
+        if term in columns:
+            continue
+        if term.startswith('C(') and term.endswith(')'):
+            var = term[2:-1]
+            dummies = pd.get_dummies(df[var], prefix=var, drop_first=True, dtype='float64')
+            block = dummies.to_numpy(copy=True)
+            block[df[var].isna().to_numpy()] = np.nan
+            cols = [f"C({var})[T.{c[len(var) + 1:]}]" for c in dummies.columns]
+        else:
+            block = pd.to_numeric(df[term], errors='coerce').to_numpy(dtype='float64')[:, None]
+            cols = [term]
+        columns[term] = list(range(len(names), len(names) + len(cols)))
+        blocks.append(block)
+        names += cols
+    return np.hstack(blocks), names, columns
+
+
+# 对称正定矩阵的 Cholesky 分解；存在完全共线时返回 None (改用伪逆，与 statsmodels 的 pinv 做法一致)
+def _cholesky(gram):
+    try:
+        return linalg.cholesky(gram, lower=False)
+    except linalg.LinAlgError:
+        return None
+
+
+def _solve(chol, gram, rhs):
+    if chol is not None:
+        return linalg.cho_solve((chol, False), rhs), linalg.cho_solve((chol, False), np.eye(len(gram)))
+    inv = np.linalg.pinv(gram)
+    return inv @ rhs, inv
+
+
+# 标准误：HC1 / nonrobust / cluster (一维)；p 为设计矩阵的秩
+def _vcov(X, resid, inv, cov_type, groups, p):
+    n = len(X)
+    if cov_type == 'nonrobust':
+        return inv * (resid @ resid) / (n - p)
+    if cov_type == 'cluster':
+        G = groups.max() + 1
+        scores = X * resid[:, None]
+        S = np.column_stack([np.bincount(groups, weights=scores[:, j], minlength=G) for j in range(p)])
+        return inv @ (S.T @ S) @ inv * G / (G - 1) * (n - 1) / (n - p)
+    scores = X * resid[:, None]
+    return inv @ (scores.T @ scores) @ inv * n / (n - p)
+
+
+# 运行整张网格，返回长表：dep, controls, sample, term, coef, se, t, p, nobs, r2
+# terms='key' 只输出核心解释变量，'all' 输出全部系数
+def run_grid(df, grid, cov_type='HC1', cluster=None, terms='key'):
+    missing = [d for d in grid.deps if d not in df.columns]
+    for d in missing:
+        print(f"Warning: {d} not found, skipped in the robustness grid")
+    deps = [d for d in grid.deps if d not in missing]
+    columns_out = ['dep', 'controls', 'sample', 'term', 'coef', 'se', 't', 'p', 'nobs', 'r2']
+    if not deps:
+        return pd.DataFrame(columns=columns_out)
+    control_sets = {name: parse_terms(c) for name, c in grid.control_sets.items()}
+    all_terms = [grid.key] + [t for c in control_sets.values() for t in c]
+    X_all, names, columns = build_design(df, all_terms)
+    finite = ~np.isnan(X_all)
+    Y_all = np.column_stack([pd.to_numeric(df[d], errors='coerce').to_numpy(dtype='float64') for d in deps])
+    groups_all = pd.factorize(df[cluster])[0] if cluster else None
+
+    rows = []
+    for sample_name, sample in grid.samples.items():
+        if sample is None:
+            in_sample = np.ones(len(df), dtype=bool)
+        else:
+            in_sample = np.asarray(sample(df) if callable(sample) else sample, dtype=bool)
+        if cluster:
+            in_sample &= groups_all >= 0
+
+        # 大的控制变量组先算，嵌套在其中的小组可以直接复用它的分解
+        gram_cache, chol_cache = {}, {}
+        for cs_name, cs_terms in sorted(control_sets.items(), key=lambda kv: -len(kv[1])):
+            # 列：截距 + 核心变量 + 控制变量 (按项出现的顺序)
+            idx = columns[grid.key] + [j for t in dict.fromkeys(cs_terms) if t != grid.key for j in columns[t]]
+            idx = [0] + idx
+            x_ok = in_sample & finite[:, idx].all(axis=1)
+
+            # 按有效行分组：缺失值位置相同的被解释变量共用同一个样本
+            by_rows = {}
+            for d, dep in enumerate(deps):
+                mask = x_ok & ~np.isnan(Y_all[:, d])
+                by_rows.setdefault(mask.tobytes(), (mask, []))[1].append(d)
+
+            for key, (mask, dep_idx) in by_rows.items():
+                n = int(mask.sum())
+                if n <= len(idx):
+                    print(f"Warning: {sample_name}/{cs_name}: only {n} observations, skipped")
+                    continue
+                # X'X 对同一行集合只算一次 (用全部列，之后按需取子块)
+                if key not in gram_cache:
+                    Xm = X_all[mask]
+                    Xm = np.where(np.isnan(Xm), 0.0, Xm)
+                    gram_cache[key] = (Xm, Xm.T @ Xm)
+                Xm_full, gram_full = gram_cache[key]
+                X = Xm_full[:, idx]
+                gram = gram_full[np.ix_(idx, idx)]
+
+                # 嵌套的控制变量组：前面算过的更大的分解，其左上角块就是当前的分解
+                chol = None
+                for (prev_key, prev_idx), prev_chol in chol_cache.items():
+                    if prev_key == key and prev_chol is not None and prev_idx[:len(idx)] == tuple(idx):
+                        chol = prev_chol[:len(idx), :len(idx)]
+                        break
+                else:
+                    chol = _cholesky(gram)
+                    chol_cache[(key, tuple(idx))] = chol
+
+                Y = Y_all[mask][:, dep_idx]
+                beta, inv = _solve(chol, gram, X.T @ Y)
+                rank = len(idx) if chol is not None else np.linalg.matrix_rank(gram)
+                resid = Y - X @ beta
+                groups = pd.factorize(groups_all[mask])[0] if cluster else None
+                keep = range(len(idx)) if terms == 'all' else [idx.index(j) for j in columns[grid.key]]
+
+                for c, d in enumerate(dep_idx):
+                    vcov = _vcov(X, resid[:, c], inv, cov_type, groups, rank)
+                    y_c = Y[:, c] - Y[:, c].mean()
+                    r2 = 1 - (resid[:, c] @ resid[:, c]) / (y_c @ y_c)
+                    t_df = groups.max() if cluster else n - rank
+                    for j in keep:
+                        se = np.sqrt(vcov[j, j]) if vcov[j, j] > 0 else np.nan
+                        t = beta[j, c] / se
+                        rows.append({'dep': deps[d], 'controls': cs_name, 'sample': sample_name,
+                                     'term': names[idx[j]], 'coef': beta[j, c], 'se': se, 't': t,
+                                     'p': 2 * stats.t.sf(abs(t), t_df), 'nobs': n, 'r2': r2})
+
+    table = pd.DataFrame(rows, columns=columns_out)
+    # 按网格中声明的顺序排列
+    order = {'sample': list(grid.samples), 'dep': list(grid.deps), 'controls': list(control_sets)}
+    for col, levels in order.items():
+        table[col] = pd.Categorical(table[col], categories=levels)
+    table = table.sort_values(['sample', 'dep', 'controls'], kind='stable').reset_index(drop=True)
+    for col in order:
+        table[col] = table[col].astype(str)
+    return table
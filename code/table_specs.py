@@ -0,0 +1,119 @@
+import pandas as pd
+import numpy as np
+from csmar_loader import TableSpec, is_soe_vec
+
+# 数据表声明
+# 每个 TableSpec 说明一张 CSMAR 表：文件名、证券代码/日期列、要保留并重命名的列、类型，
+# 以及需要的派生变量。读取和清洗统一由 csmar_loader.load_tables() 完成。
+
+
+# 派生变量：产权性质 (EquityNatureID 以 1 开头为国企)
+def derive_soe(df):
+    df['SOE'] = is_soe_vec(df['SOE_ID'])
+    return df
+
+
+# 派生变量：企业年龄 Age = ln(1 + 统计年度 - 成立年份)，成立日期晚于统计年度的记为缺失
+def derive_age(df):
+    establish_year = pd.to_datetime(df['EstablishDate'], errors='coerce').dt.year
+    age = df['Year'] - establish_year
+    age = age.where(age >= 0)
+    # 使用 np.log1p 处理 float 类型，避免 float.log 错误
+    df['Age'] = np.log1p(age.astype('float64'))
+    return df
+
+
+# 派生变量：数字化转型虚拟变量 (DigitalScore > 0 记为 1)
+def derive_treat_time(df):
+    df['Treat_time'] = np.where(df['DigitalScore'] > 0, 1, 0)
+    return df
+
+
+# 01_data_cleaning.py 使用的表
+# 注意：control_data_new 下有两份 STK_LISTEDCOINFOANL.xlsx，162619177 这份才有 IndustryCode；
+# 其余 hint='control_data_new' 的表对应原脚本只在 control_path 中查找的文件。
+CLEANING_SPECS = [
+    # (1) 财务报表 (TotalAssets) - 上市公司主要财务指标
+    TableSpec('balance_sheet', 'PT_LCMAINFIN.xlsx', hint='control_data_new',
+              stkcd='Symbol', year='EndDate',
+              columns={'TotalAssets': 'TotalAssets'},
+              dtypes={'TotalAssets': 'float64'}),
+    # 偿债能力 (Lev - 资产负债率)
+    TableSpec('debt', 'FI_T1.xlsx', hint='control_data_new',
+              columns={'F011201A': 'Lev'},
+              dtypes={'Lev': 'float64'}),
+    # (2) 利润表 (ROA)
+    TableSpec('income_statement', 'AF_Actual.xlsx', hint='control_data_new',
+              year='Ddate',
+              columns={'ROA': 'ROA'},
+              dtypes={'ROA': 'float64'}),
+    # (3) 发展能力 (Grow - 营业利润增长率B)
+    TableSpec('growth', 'FI_T8.xlsx', hint='control_data_new',
+              columns={'ShortName': 'ShortName', 'F081202B': 'Grow'},
+              dtypes={'Grow': 'float64'}),
+    # (5) 股权性质 (SOE, Top1)
+    TableSpec('equity', 'EN_EquityNatureAll.xlsx',
+              stkcd='Symbol', year='EndDate',
+              columns={'LargestHolderRate': 'Top1', 'EquityNatureID': 'SOE_ID', 'RegisterAddress': 'RegisterAddress'},
+              dtypes={'Top1': 'float64'},
+              derive=derive_soe, keep=['Top1', 'SOE', 'RegisterAddress']),
+    # (6) 治理结构 (Board, Indb, Duality, Staff)
+    TableSpec('governance', 'BDT_ManaGovAbil.xlsx',
+              stkcd='Symbol', year='Enddate',
+              columns={'Boardsize': 'Board', 'IndDirectorRatio': 'Indb',
+                       'IsCocurP': 'Duality', 'StaffNumber': 'Staff'},
+              dtypes={'Board': 'float64', 'Indb': 'float64', 'Duality': 'float64', 'Staff': 'float64'}),
+    # (7) 基本信息 (Age, IndustryCode)
+    TableSpec('base_info', 'STK_LISTEDCOINFOANL.xlsx', hint='162619177',
+              stkcd='Symbol', year='EndDate',
+              columns={'EstablishDate': 'EstablishDate', 'IndustryCode': 'IndustryCode'},
+              derive=derive_age, keep=['Age', 'IndustryCode']),
+    # (8) 数字化转型 (Treat_time, DigitalScore) - SgnYear 本身就是年份
+    TableSpec('digital', 'DM_ListedCoDigTrsDegreeY.xlsx',
+              stkcd='Symbol', year='SgnYear', year_format='year',
+              columns={'DigitalTechApplication': 'DigitalScore'},
+              dtypes={'DigitalScore': 'float64'},
+              derive=derive_treat_time, keep=['Treat_time', 'DigitalScore']),
+    # 注册地 (省份、城市名称)，用于合并 GDP；没有这张表时用股权性质文件中的注册地址解析 (见 region_index.py)
+    TableSpec('location', 'DM_ListedCoInfoAnlY.xlsx',
+              stkcd='Symbol', year='EndDate',
+              columns={'PROVINCE': 'Province', 'CITY': 'City'}),
+    # (9) 托宾Q (TobinQ)
+    TableSpec('tobin_q', 'FI_T10.xlsx',
+              columns={'F100901A': 'TobinQ'},
+              dtypes={'TobinQ': 'float64'}),
+]
+
+# 财务报表只取年报 (会计期间 12-31) 的合并报表 (Typrep = A)，在读取时过滤
+annual_consolidated = {'Typrep': 'A', 'Accper': {'endswith': '12-31'}}
+
+# 02_calculate_tfp.py 使用的表 (Y, M, K, L)
+TFP_SPECS = [
+    # (1) 产出 Y: 营业收入 (B001101000)
+    TableSpec('income', 'FS_Comins.xlsx',
+              columns={'B001101000': 'Y_Revenue'},
+              filters=annual_consolidated),
+    # (2) 中间投入 M: 购买商品支付现金 (C001014000)
+    TableSpec('cash', 'FS_Comscfd.xlsx',
+              columns={'C001014000': 'M_Input'},
+              filters=annual_consolidated),
+    # (3) 资本 K: 固定资产净额 (A001212000)
+    TableSpec('balance', 'FS_Combas.xlsx',
+              columns={'A001212000': 'K_Capital'},
+              filters=annual_consolidated),
+    # (4) 劳动 L: 员工人数 (Y0601b)，来源：治理综合信息文件
+    TableSpec('staff', 'CG_Ybasic.xlsx',
+              year='Reptdt',
+              columns={'Y0601b': 'L_Labor'}),
+]
+
+# 02_calculate_tfp.py 分行业估计用的行业代码 (证监会行业，如 C39)
+# 优先取基本信息年度表，缺失的企业-年度再用管理层治理能力表补
+INDUSTRY_SPECS = [
+    TableSpec('industry', 'STK_LISTEDCOINFOANL.xlsx', hint='162619177',
+              stkcd='Symbol', year='EndDate',
+              columns={'IndustryCode': 'IndustryCode'}),
+    TableSpec('industry_gov', 'BDT_ManaGovAbil.xlsx',
+              stkcd='Symbol', year='Enddate',
+              columns={'IndustryCode': 'IndustryCode'}),
+]
@@ -0,0 +1,123 @@
+import pandas as pd
+import numpy as np
+import os
+from concurrent.futures import ProcessPoolExecutor
+from tfp_lp import estimate_lp
+
+# 分行业估计生产函数
+# 文献做法是按证监会行业 (IndustryCode，如 C39) 分别估计生产函数，而不是全样本一次回归。
+#   - assign_groups()：给每个企业-年度分配估计组 (行业，或 行业 x 时期)；
+#     样本太少的行业退回到门类代码 (C39 -> C)，门类仍太少的并入全样本组 ALL。
+#   - estimate_ols_grouped()：所有组的 OLS 一次算完 —— 用 bincount 按组累加 X'X、X'y，
+#     再对 (组数 x 4 x 4) 的矩阵批量求解，耗时和一次全样本回归差不多。
+#   - estimate_lp_grouped()：各组的 LP 估计分批交给进程池并行计算。
+#
+# 用法：
+#   df['TFP_Group'] = assign_groups(df)
+#   tfp_ols, coef_ols = estimate_ols_grouped(df)
+#   tfp_lp, coef_lp = estimate_lp_grouped(df)
+
+# 每组最少的企业-年度观测数，少于这个数就退回上一级分组
+min_group_obs = 100
+
+pooled_group = 'ALL'
+
+
+# 企业的行业代码在各年份间基本不变：缺失的年份用同一企业其他年份的代码补齐
+def fill_industry(df, industry_col='IndustryCode', firm='Stkcd', year='Year'):
+    ordered = df.sort_values([firm, year])
+    # groupby 自带的 ffill / bfill 一次处理所有企业 (不逐个企业调用 Python 函数)
+    filled = ordered.groupby(firm, sort=False)[industry_col].ffill()
+    filled = filled.groupby(ordered[firm], sort=False).bfill()
+    return filled.reindex(df.index)
+
+
+# 给每行分配估计组
+# period: 时期长度 (年)，如 5 表示按 行业 x 五年 分组；None 表示只按行业分组
+def assign_groups(df, industry_col='IndustryCode', min_obs=min_group_obs, period=None, year='Year'):
+    code = df[industry_col].astype(object).where(df[industry_col].notna(), pooled_group).astype(str).str.strip()
+    code = code.where(code != '', pooled_group)
+    sector = code.str[0].where(code != pooled_group, pooled_group)
+
+    if period:
+        tag = '|' + ((df[year].astype('int64') // period) * period).astype(str)
+    else:
+        tag = pd.Series('', index=df.index)
+
+    # 行业 -> 门类 -> 全样本，逐级检查样本量
+    group = code + tag
+    sizes = group.map(group.value_counts())
+    group = group.where(sizes >= min_obs, sector + tag)
+    sizes = group.map(group.value_counts())
+    group = group.where(sizes >= min_obs, pooled_group + tag)
+    if period:
+        # 时期组合并后仍然太少的，最终并入不分时期的全样本组
+        sizes = group.map(group.value_counts())
+        group = group.where(sizes >= min_obs, pooled_group)
+    return group
+
+
+# 批量 OLS：lnY = a + b_l*lnL + b_k*lnK + b_m*lnM，每组一套系数
+# 返回 (TFP Series，系数表)；TFP 与 TFP_OLS 口径一致 (残差 + 截距)
+def estimate_ols_grouped(df, group_col='TFP_Group', y='lnY', xs=('lnL', 'lnK', 'lnM')):
+    data = df[[group_col, y] + list(xs)].dropna()
+    groups = pd.Categorical(data[group_col])
+    codes = groups.codes
+    n_groups = len(groups.categories)
+
+    X = np.column_stack([np.ones(len(data))] + [data[x].to_numpy(dtype='float64') for x in xs])
+    Y = data[y].to_numpy(dtype='float64')
+    p = X.shape[1]
+
+    # 按组累加 X'X 和 X'y
+    XtX = np.empty((n_groups, p, p))
+    Xty = np.empty((n_groups, p))
+    for a in range(p):
+        Xty[:, a] = np.bincount(codes, weights=X[:, a] * Y, minlength=n_groups)
+        for b in range(a, p):
+            XtX[:, a, b] = XtX[:, b, a] = np.bincount(codes, weights=X[:, a] * X[:, b], minlength=n_groups)
+
+    beta = np.linalg.solve(XtX, Xty[:, :, None])[:, :, 0]
+    resid = Y - np.einsum('ij,ij->i', X, beta[codes])
+
+    tfp = pd.Series(resid + beta[codes, 0], index=data.index).reindex(df.index)
+    coef = pd.DataFrame(beta, columns=['Intercept'] + list(xs), index=groups.categories)
+    coef['N'] = np.bincount(codes, minlength=n_groups)
+    coef.index.name = group_col
+    return tfp, coef
+
+
+# 单组 LP 估计 (在子进程中执行)；样本不足以完成第二步时返回 None
+def _lp_one(name, part, gross_output):
+    try:
+        res = estimate_lp(part, gross_output=gross_output)
+    except (ValueError, np.linalg.LinAlgError) as e:
+        print(f"Warning: LP failed for group {name}: {e}")
+        return name, None
+    return name, res
+
+
+# 各组 LP 估计，组之间互不相关，按组分发到进程池
+def estimate_lp_grouped(df, group_col='TFP_Group', gross_output=True, max_workers=None):
+    cols = ['Stkcd', 'Year', 'lnY', 'lnL', 'lnK', 'lnM']
+    parts = [(name, part[cols]) for name, part in df.groupby(group_col, sort=True)]
+
+    if max_workers is None:
+        max_workers = min(len(parts), os.cpu_count() or 1)
+    if max_workers <= 1:
+        results = [_lp_one(name, part, gross_output) for name, part in parts]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = [pool.submit(_lp_one, name, part, gross_output) for name, part in parts]
+            results = [f.result() for f in futures]
+
+    tfp = pd.Series(np.nan, index=df.index)
+    rows = []
+    for name, res in results:
+        if res is None:
+            continue
+        tfp.loc[res.tfp.index] = res.tfp
+        rows.append({group_col: name, 'beta_l': res.beta_l, 'beta_k': res.beta_k, 'beta_m': res.beta_m,
+                     'N': res.n_obs, 'N_GMM': res.n_gmm})
+    coef = pd.DataFrame(rows).set_index(group_col) if rows else pd.DataFrame()
+    return tfp, coef
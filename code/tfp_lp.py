@@ -0,0 +1,136 @@
+import pandas as pd
+import numpy as np
+from dataclasses import dataclass
+from scipy.optimize import minimize
+
+# Levinsohn-Petrin (2003) 法估计 TFP
+# 生产函数 (Gross Output)：y = b_l*l + b_k*k + b_m*m + omega + e，中间投入 m 作为生产率 omega 的代理变量。
+# gross_output=False 时按增加值模型估计 (m 只作代理变量、不进入生产函数，b_m = 0)。
+#
+# 第一步：y = b_l*l + phi(k, m) + e，phi 用 (k, m) 的三阶多项式近似，OLS 得到 b_l 和 phi_hat。
+# 第二步：对给定的 (b_k, b_m)
+#     omega_t   = phi_hat_t   - b_k*k_t   - b_m*m_t
+#     omega_t-1 = phi_hat_t-1 - b_k*k_t-1 - b_m*m_t-1   (同一企业上一年，年份必须连续)
+#     omega_t = g(omega_t-1) + xi_t，g 用三阶多项式近似
+#     残差 r_t = y_t - b_l*l_t - b_k*k_t - b_m*m_t - g(omega_t-1) = xi_t + e_t
+#   矩条件 E[r_t * Z] = 0，Z = (k_t, m_t-1, l_t-1, k_t-1)，最小化 GMM 目标函数得到 (b_k, b_m)。
+# 注意：若 m 几乎完全由 (k, omega) 决定，总产出模型中的 b_m 识别会很弱 (Gandhi et al. 2020)，
+# 这时应对照 TFP_OLS 和增加值模型的结果检查。
+#
+# 第二步的目标函数会被优化器调用几百次，每次都只做预分配数组上的向量化运算 (没有逐观测的 Python 循环)；
+# 长度为 n 的中间结果都写进预分配的数组 (out=)，每次调用新建的只有 (degree+1) 维和工具变量个数维的小矩阵，
+# 完整的 A 股面板 (约 5000 家 x 10 多年) 几秒内就能算完。
+#
+# 用法：
+#   from tfp_lp import estimate_lp
+#   res = estimate_lp(df)          # df 需要 Stkcd, Year, lnY, lnL, lnK, lnM
+#   df['TFP_LP'] = res.tfp
+
+
+@dataclass
+class LPResult:
+    beta_l: float
+    beta_k: float
+    beta_m: float
+    tfp: pd.Series        # 与输入 df 同索引的 ln(TFP) = y - b_l*l - b_k*k - b_m*m
+    n_obs: int            # 第一步样本量
+    n_gmm: int            # 第二步样本量 (有连续上一年观测的企业-年度)
+    objective: float      # GMM 目标函数最优值
+
+    def summary(self):
+        return (f"LP estimates: beta_l={self.beta_l:.4f}, beta_k={self.beta_k:.4f}, beta_m={self.beta_m:.4f} "
+                f"(N={self.n_obs}, GMM N={self.n_gmm}, J={self.objective:.3e})")
+
+
+# 同一企业上一年观测所在的行号 (数据已按企业、年份排序)；没有上一年或年份不连续时为 -1
+def lag_positions(firm_codes, years):
+    n = len(years)
+    pos = np.full(n, -1, dtype='int64')
+    if n > 1:
+        same = (firm_codes[1:] == firm_codes[:-1]) & (years[1:] == years[:-1] + 1)
+        pos[1:][same] = np.arange(n - 1)[same]
+    return pos
+
+
+# (k, m) 的多项式展开：所有 k^i * m^j (1 <= i+j <= degree)，加常数项
+def poly_terms(k, m, degree=3):
+    cols = [np.ones_like(k)]
+    for total in range(1, degree + 1):
+        for i in range(total + 1):
+            cols.append(k ** (total - i) * m ** i)
+    return np.column_stack(cols)
+
+
+def estimate_lp(df, y='lnY', free='lnL', state='lnK', proxy='lnM', firm='Stkcd', year='Year', degree=3,
+                gross_output=True):
+    data = df[[firm, year, y, free, state, proxy]].dropna()
+    order = np.lexsort((data[year].to_numpy(), pd.Categorical(data[firm]).codes))
+    data = data.iloc[order]
+
+    Y = data[y].to_numpy(dtype='float64')
+    L = data[free].to_numpy(dtype='float64')
+    K = data[state].to_numpy(dtype='float64')
+    M = data[proxy].to_numpy(dtype='float64')
+
+    # 第一步：y 对 l 和 phi(k, m) 的多项式回归
+    X1 = np.column_stack([L, poly_terms(K, M, degree)])
+    coef1, *_ = np.linalg.lstsq(X1, Y, rcond=None)
+    beta_l = coef1[0]
+    phi = X1[:, 1:] @ coef1[1:]
+
+    # 对齐同一企业的上一年观测
+    lag = lag_positions(pd.Categorical(data[firm]).codes, data[year].to_numpy(dtype='int64'))
+    has_lag = lag >= 0
+    cur = np.flatnonzero(has_lag)
+    prev = lag[has_lag]
+    n = len(cur)
+    if n < 10:
+        raise ValueError(f"only {n} firm-years have a consecutive previous year, cannot run LP second stage")
+
+    phi_t, k_t, m_t = phi[cur], K[cur], M[cur]
+    phi_l, k_l, m_l, l_l = phi[prev], K[prev], M[prev], L[prev]
+    # 第二步的被解释变量：y 扣除劳动贡献
+    y_t = Y[cur] - beta_l * L[cur]
+
+    # 工具变量及权重矩阵 W = (Z'Z/n)^-1
+    Z = np.column_stack([k_t, m_l, l_l, k_l] if gross_output else [k_t, l_l, k_l])
+    W = np.linalg.inv(Z.T @ Z / n)
+
+    # 预分配目标函数里用到的数组
+    omega = np.empty(n)
+    omega_l = np.empty(n)
+    resid = np.empty(n)
+    inputs = np.empty(n)      # b_k*k + b_m*m (当年)，omega 和残差共用
+    inputs_l = np.empty(n)    # 同上 (上一年)
+    scratch = np.empty(n)
+    fitted = np.empty(n)
+    G = np.empty((n, degree + 1))
+    powers = np.arange(degree + 1)
+
+    def objective(beta):
+        bk, bm = beta if gross_output else (beta[0], 0.0)
+        for out, k, m in ((inputs, k_t, m_t), (inputs_l, k_l, m_l)):
+            np.multiply(k, bk, out=out)
+            if bm:
+                np.multiply(m, bm, out=scratch)
+                np.add(out, scratch, out=out)
+        np.subtract(phi_t, inputs, out=omega)
+        np.subtract(phi_l, inputs_l, out=omega_l)
+        np.power(omega_l[:, None], powers, out=G)
+        # g(omega_t-1) 的多项式系数：用正规方程求解 (degree+1 维，很小)
+        gcoef = np.linalg.solve(G.T @ G, G.T @ omega)
+        np.dot(G, gcoef, out=fitted)
+        np.subtract(y_t, inputs, out=resid)
+        np.subtract(resid, fitted, out=resid)
+        moments = Z.T @ resid / n
+        return moments @ W @ moments
+
+    # 以 OLS 系数为初值
+    X0 = np.column_stack([np.ones_like(Y), L, K, M] if gross_output else [np.ones_like(Y), L, K])
+    ols_coef, *_ = np.linalg.lstsq(X0, Y, rcond=None)
+    start = ols_coef[2:]
+    opt = minimize(objective, start, method='Nelder-Mead', options={'xatol': 1e-7, 'fatol': 1e-12, 'maxiter': 4000})
+    beta_k, beta_m = (opt.x[0], opt.x[1]) if gross_output else (opt.x[0], 0.0)
+
+    tfp = pd.Series(Y - beta_l * L - beta_k * K - beta_m * M, index=data.index).reindex(df.index)
+    return LPResult(beta_l, beta_k, beta_m, tfp, len(data), n, float(opt.fun))
@@ -0,0 +1,188 @@
+import pandas as pd
+import numpy as np
+import os
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
+from spec_grid import parse_terms, build_design
+
+# 野聚类自助法 (wild cluster bootstrap, WCR) 检验单个系数 (默认 Treat_time)
+# 聚类数很少时 (行业、省份) 聚类稳健标准误的 t 检验会过度拒绝，这里用施加原假设的 WCR 自助法：
+#   y* = Z*gamma_r + b0*x + u_r * v_g，u_r 为施加 beta = b0 后的约束残差，v_g 为每个聚类一个的随机权重
+#   (Rademacher：+-1；Webb：+-sqrt(1/2), +-1, +-sqrt(3/2) 六点分布)。
+# 不对每次抽样重新回归：系数和聚类稳健方差都是 v 的线性 / 二次函数，只需预先算好按聚类汇总的量
+#   d_g = sum_{i in g} w_i u_i        (w = X (X'X)^-1 e_j)
+#   F_g = sum_{i in g} x_i u_i        (k 维)
+#   Q   = (X'X)^-1 W'，W_g = sum_{i in g} w_i x_i
+# 则一批抽样 V (B x G) 的 t 统计量为
+#   beta*_j - b0 = V d，  s* = V * d - (V F) Q，  t* = V d / sqrt(adj * rowsum(s*^2))
+# 每次抽样的计算量只和聚类数 G、变量数 k 有关，与样本量 n 无关。
+# 约束残差对 b0 是线性的 (u_r = u_y - b0 * u_x)，置信区间通过在 b0 网格上反转检验得到。
+# 权重按批生成 (B x G 的矩阵)，各批交给进程池并行计算。
+#
+# 用法：
+#   res = wild_cluster_bootstrap(df, 'TFP_OLS', "Size + Lev + C(Year)", cluster='IndustryCode')
+#   print(res.summary())
+
+webb_points = np.array([-np.sqrt(1.5), -1.0, -np.sqrt(0.5), np.sqrt(0.5), 1.0, np.sqrt(1.5)])
+
+
+@dataclass
+class WildBootResult:
+    dep: str
+    term: str
+    coef: float
+    se: float                 # 聚类稳健标准误 (CR1)
+    t: float
+    pvalue: float             # 自助法 p 值 (对称，H0: beta = 0)
+    ci: tuple                 # 自助法置信区间 (检验反转)
+    reps: int
+    weights: str
+    cluster: str
+    n_clusters: int
+    nobs: int
+
+    def summary(self):
+        lo, hi = self.ci
+        return (f"Wild cluster bootstrap ({self.weights}, {self.reps} replications, "
+                f"clustered by {self.cluster}, G = {self.n_clusters}, N = {self.nobs}): {self.dep}\n"
+                f"  {self.term}: coef = {self.coef:.4f}, CR1 se = {self.se:.4f}, t = {self.t:.3f}, "
+                f"bootstrap p = {self.pvalue:.4f}, 95% CI [{lo:.4f}, {hi:.4f}]")
+
+
+# 一批权重 (B x G)
+def draw_weights(rng, n_draws, n_clusters, weights='rademacher'):
+    if weights == 'rademacher':
+        return rng.integers(0, 2, size=(n_draws, n_clusters), dtype=np.int8) * 2.0 - 1.0
+    if weights == 'webb':
+        return webb_points[rng.integers(0, 6, size=(n_draws, n_clusters))]
+    raise ValueError(f"unknown bootstrap weights: {weights}")
+
+
+# 聚类数很少时 Rademacher 权重只有 2^G 种组合，直接全部枚举 (结果是精确的)
+def all_rademacher(n_clusters):
+    codes = np.arange(2 ** n_clusters)[:, None] >> np.arange(n_clusters)
+    return (codes & 1) * 2.0 - 1.0
+
+
+# 给定权重矩阵 V，在每个 b0 上计算 |t*| >= |t(b0)| 的次数
+# s*(b0) = S_y - b0 * S_x，所以 rowsum(s*^2) = a - 2*b0*b + b0^2*c，各 b0 只需 O(B) 的运算
+def _exceed_counts(V, stats, b0_grid, t_obs):
+    d_y, d_x, F_y, F_x, Q, adj = stats
+    S_y = V * d_y - (V @ F_y) @ Q
+    S_x = V * d_x - (V @ F_x) @ Q
+    a = np.einsum('ij,ij->i', S_y, S_y)
+    b = np.einsum('ij,ij->i', S_y, S_x)
+    c = np.einsum('ij,ij->i', S_x, S_x)
+    Vd_y, Vd_x = V @ d_y, V @ d_x
+    counts = np.zeros(len(b0_grid), dtype=np.int64)
+    for i, (b0, t0) in enumerate(zip(b0_grid, t_obs)):
+        var = adj * (a - 2 * b0 * b + b0 * b0 * c)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t_star = (Vd_y - b0 * Vd_x) / np.sqrt(np.maximum(var, 0))
+        counts[i] = np.count_nonzero(np.abs(t_star) >= abs(t0) - 1e-12)
+    return counts
+
+
+def _boot_batch(seed, n_draws, weights, stats, b0_grid, t_obs):
+    rng = np.random.default_rng(seed)
+    V = draw_weights(rng, n_draws, len(stats[0]), weights)
+    return _exceed_counts(V, stats, b0_grid, t_obs)
+
+
+class WildClusterBootstrap:
+    # 预计算：全模型的 (X'X)^-1、观测 t 统计量，以及约束残差按聚类汇总的量
+    def __init__(self, X, y, clusters, j):
+        n, k = X.shape
+        A = np.linalg.pinv(X.T @ X)
+        a = A[j]
+        w = X @ a
+        G = clusters.max() + 1
+        self.n, self.k, self.G = n, k, int(G)
+        self.adj = G / (G - 1) * (n - 1) / (n - k)
+
+        # 无约束估计及 CR1 标准误
+        beta = A @ (X.T @ y)
+        u = y - X @ beta
+        score = np.bincount(clusters, weights=w * u, minlength=G)
+        self.coef = beta[j]
+        self.se = np.sqrt(self.adj * score @ score)
+
+        # 约束模型 (去掉第 j 列) 的残差：u_r(b0) = M_Z y - b0 * M_Z x_j
+        Z = np.delete(X, j, axis=1)
+        Az = np.linalg.pinv(Z.T @ Z)
+        u_y = y - Z @ (Az @ (Z.T @ y))
+        u_x = X[:, j] - Z @ (Az @ (Z.T @ X[:, j]))
+
+        def by_cluster(v):
+            return np.bincount(clusters, weights=v, minlength=G)
+
+        d_y, d_x = by_cluster(w * u_y), by_cluster(w * u_x)
+        F_y = np.column_stack([by_cluster(X[:, c] * u_y) for c in range(k)])
+        F_x = np.column_stack([by_cluster(X[:, c] * u_x) for c in range(k)])
+        W = np.column_stack([by_cluster(w * X[:, c]) for c in range(k)])
+        Q = A @ W.T
+        self.stats = (d_y, d_x, F_y, F_x, Q, self.adj)
+
+    def t_obs(self, b0_grid):
+        return (self.coef - np.asarray(b0_grid)) / self.se
+
+    # 在 b0 网格上计算自助法 p 值
+    def pvalues(self, b0_grid, reps=9999, weights='rademacher', seed=0, batch_size=1000, max_workers=None):
+        b0_grid = np.atleast_1d(np.asarray(b0_grid, dtype='float64'))
+        t_obs = self.t_obs(b0_grid)
+        if weights == 'rademacher' and self.G < 30 and 2 ** self.G <= reps:
+            V = all_rademacher(self.G)
+            return _exceed_counts(V, self.stats, b0_grid, t_obs) / len(V), len(V)
+
+        sizes = [batch_size] * (reps // batch_size) + ([reps % batch_size] if reps % batch_size else [])
+        seeds = np.random.SeedSequence(seed).generate_state(len(sizes))
+        if max_workers is None:
+            max_workers = min(len(sizes), os.cpu_count() or 1)
+        args = [(s, m, weights, self.stats, b0_grid, t_obs) for s, m in zip(seeds, sizes)]
+        if max_workers <= 1:
+            counts = [_boot_batch(*a) for a in args]
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                counts = list(pool.map(_boot_batch, *zip(*args)))
+        return np.sum(counts, axis=0) / reps, reps
+
+    # 置信区间：p(b0) >= alpha 的 b0 集合。先在 coef +- 6se 的粗网格上找到边界所在区间，再在区间内细分
+    def confint(self, alpha=0.05, **kwargs):
+        grid = self.coef + self.se * np.linspace(-6, 6, 49)
+        p, _ = self.pvalues(grid, **kwargs)
+        inside = np.flatnonzero(p >= alpha)
+        if not len(inside):
+            return (np.nan, np.nan)
+        lo_i, hi_i = inside[0], inside[-1]
+        if lo_i == 0 or hi_i == len(grid) - 1:
+            print("Warning: bootstrap confidence set extends beyond coef +- 6 se; interval truncated")
+        fine_lo = np.linspace(grid[max(lo_i - 1, 0)], grid[lo_i], 21)
+        fine_hi = np.linspace(grid[hi_i], grid[min(hi_i + 1, len(grid) - 1)], 21)
+        p_fine, _ = self.pvalues(np.concatenate([fine_lo, fine_hi]), **kwargs)
+        p_lo, p_hi = p_fine[:21], p_fine[21:]
+        lo = fine_lo[np.flatnonzero(p_lo >= alpha)[0]]
+        hi = fine_hi[np.flatnonzero(p_hi >= alpha)[-1]]
+        return (lo, hi)
+
+
+def wild_cluster_bootstrap(df, y, controls, key='Treat_time', cluster='IndustryCode', reps=9999,
+                           weights='rademacher', alpha=0.05, ci=True, seed=0, batch_size=1000, max_workers=None):
+    terms = [key] + [t for t in parse_terms(controls) if t != key]
+    X, names, columns = build_design(df, terms)
+    Y = pd.to_numeric(df[y], errors='coerce').to_numpy(dtype='float64')
+    ok = ~np.isnan(X).any(axis=1) & ~np.isnan(Y) & df[cluster].notna().to_numpy()
+    X, Y = X[ok], Y[ok]
+    clusters = pd.factorize(df[cluster].to_numpy()[ok])[0]
+    # 子样本中全为 0 的虚拟变量列去掉
+    keep = (X != 0).any(axis=0)
+    if not keep[columns[key][0]]:
+        raise ValueError(f"{key} is 0 for every observation in this sample, its coefficient is not identified")
+    j = int(keep[:columns[key][0]].sum())
+    X = X[:, keep]
+
+    boot = WildClusterBootstrap(X, Y, clusters, j)
+    opts = dict(reps=reps, weights=weights, seed=seed, batch_size=batch_size, max_workers=max_workers)
+    p, used = boot.pvalues([0.0], **opts)
+    interval = boot.confint(alpha, **opts) if ci else (np.nan, np.nan)
+    return WildBootResult(y, key, float(boot.coef), float(boot.se), float(boot.coef / boot.se), float(p[0]),
+                          interval, used, weights, cluster, int(boot.G), int(len(Y)))
@@ -0,0 +1,145 @@
+import pandas as pd
+import numpy as np
+from dataclasses import dataclass
+from scipy import stats
+from spec_grid import parse_terms, build_design
+
+# 样本区间稳定性检验 (window sweep)
+# 《样本区间选择建议》比较了 2016-2024 / 2018-2024 / 2020-2024 等区间，要回答 "Treat_time 的系数对起止年份是否敏感"，
+# 需要对所有连续的 [起始年, 结束年] 组合各估计一次 (15 年的数据、至少 3 年的区间就有 91 个)。
+# 模型为 y ~ Treat_time + 控制变量 + 年份固定效应 (03_regression.py 中 C(Year) 的模型)。年份固定效应只在年内起作用：
+#   1. 每个变量在年内去均值 (吸收年份固定效应，FWL 定理)，只做一次；
+#   2. 每个年份的充分统计量：Z_t'Z_t (Z = [y, X]，含 X'X、X'y、y'y) 和观测数，共 T 个 p x p 小矩阵；
+#   3. 按年份求前缀和，任意区间 [a, b] 的 X'X、X'y 就是两个前缀和之差，解一个 p 维方程组得到系数。
+# 所以几百个区间的成本和估计一次差不多 (数据只扫一遍，之后都是 p x p 的小矩阵运算)。
+# 系数与对该区间单独跑 ols('y ~ Treat_time + controls + C(Year)') 完全相同；
+# 标准误为经典 (同方差) 标准误 —— HC1 / 聚类标准误需要逐个观测的残差，不能由分块累加得到，
+# 选定区间后请用 03_regression.py 的主回归 (HC1) 或 hdfe.py (企业聚类) 报告正式结果。
+# 样本为全部变量都不缺失的观测 (每个被解释变量各自剔除)；整列缺失的控制变量会提示后去掉。
+#
+# 用法：
+#   table = sweep_windows(df, ['TFP_OLS', 'ROA'], "Size + Lev + Age + C(SOE) + C(Year)", min_years=3)
+#   grid = stability_grid(table, 'TFP_OLS')            # 起始年 x 结束年 的系数矩阵 (画热力图用)
+#   path = stability_path(table, 'TFP_OLS', end=2024)  # 固定结束年份，系数和置信区间随起始年份的变化
+
+key_default = 'Treat_time'
+
+
+@dataclass
+class YearBlocks:
+    years: np.ndarray       # 有观测的年份 (升序)
+    names: list             # Z 的列名：[被解释变量, 核心变量, 控制变量 ...]
+    gram: np.ndarray        # T x p x p，每年的 Z_t'Z_t (年内去均值后)
+    counts: np.ndarray      # 每年的观测数
+    treated: np.ndarray     # 每年核心变量 (未去均值) 之和，即处理组观测数
+
+
+# 一个被解释变量的逐年充分统计量
+def year_blocks(y, X, years, names):
+    ok = np.isfinite(y) & np.isfinite(X).all(axis=1) & np.isfinite(years)
+    Z = np.column_stack([y[ok], X[ok]])
+    key_raw = X[ok, 0].copy()
+    codes, uniq = pd.factorize(years[ok].astype('int64'), sort=True)
+    counts = np.bincount(codes, minlength=len(uniq))
+    # 年内去均值
+    for j in range(Z.shape[1]):
+        Z[:, j] -= (np.bincount(codes, weights=Z[:, j], minlength=len(uniq)) / counts)[codes]
+    # 按年份排序后每年是连续的一段，逐年累加 Z_t'Z_t
+    order = np.argsort(codes, kind='stable')
+    Z, key_raw = Z[order], key_raw[order]
+    bounds = np.concatenate([[0], np.cumsum(counts)])
+    gram = np.stack([Z[lo:hi].T @ Z[lo:hi] for lo, hi in zip(bounds[:-1], bounds[1:])]) if len(uniq) else \
+        np.zeros((0, Z.shape[1], Z.shape[1]))
+    treated = np.add.reduceat(key_raw, bounds[:-1]) if len(uniq) else np.zeros(0)
+    return YearBlocks(np.asarray(uniq), names, gram, counts, treated)
+
+
+# 由一个区间的 Z'Z 求核心变量的系数和经典标准误
+def _fit(G, n, n_years):
+    XtX, Xty, yty = G[1:, 1:], G[1:, 0], G[0, 0]
+    # 区间内核心变量去均值后没有变化 (如区间内全部未处理) 时无法识别
+    if n == 0 or XtX[0, 0] <= 1e-10 * max(n, 1):
+        return None
+    inv = np.linalg.pinv(XtX)
+    beta = inv @ Xty
+    rank = np.linalg.matrix_rank(XtX)
+    rss = max(yty - beta @ Xty, 0.0)
+    df_resid = n - rank - n_years
+    if df_resid <= 0:
+        return None
+    se = np.sqrt(rss / df_resid * inv[0, 0])
+    return beta[0], se, df_resid, (1 - rss / yty) if yty > 0 else np.nan
+
+
+# 全部连续区间 (至少 min_years 个有数据的年份)，返回长表：
+# dep, start, end, years, nobs, treated, coef, se, t, p, ci_low, ci_high, r2_within
+def sweep_windows(df, deps, controls, key=key_default, year='Year', min_years=3, alpha=0.05):
+    # 年份固定效应已由年内去均值吸收
+    terms = [t for t in parse_terms(controls) if t not in (f"C({year})", year, key)]
+    missing = [t for t in terms if not t.startswith('C(') and (t not in df.columns or df[t].isna().all())]
+    for t in missing:
+        print(f"Warning: {t} is entirely missing, dropped from the window sweep")
+    terms = [t for t in terms if t not in missing]
+
+    X, names, _ = build_design(df, [key] + terms)
+    X = X[:, 1:]
+    names = names[1:]
+    years = pd.to_numeric(df[year], errors='coerce').to_numpy(dtype='float64')
+
+    rows = []
+    for dep in deps:
+        if dep not in df.columns:
+            print(f"Warning: {dep} not found, skipped in the window sweep")
+            continue
+        y = pd.to_numeric(df[dep], errors='coerce').to_numpy(dtype='float64')
+        blocks = year_blocks(y, X, years, [dep] + names)
+        # 前缀和：区间统计量 = P[b + 1] - P[a]
+        P = np.concatenate([np.zeros((1,) + blocks.gram.shape[1:]), np.cumsum(blocks.gram, axis=0)])
+        N = np.concatenate([[0], np.cumsum(blocks.counts)])
+        D = np.concatenate([[0.0], np.cumsum(blocks.treated)])
+        T = len(blocks.years)
+        for a in range(T):
+            for b in range(a + min_years - 1, T):
+                n = int(N[b + 1] - N[a])
+                row = {'dep': dep, 'start': int(blocks.years[a]), 'end': int(blocks.years[b]), 'years': b - a + 1,
+                       'nobs': n, 'treated': int(D[b + 1] - D[a])}
+                fit = _fit(P[b + 1] - P[a], n, b - a + 1)
+                if fit is None:
+                    row.update(coef=np.nan, se=np.nan, t=np.nan, p=np.nan, ci_low=np.nan, ci_high=np.nan,
+                               r2_within=np.nan)
+                else:
+                    coef, se, df_resid, r2 = fit
+                    t = coef / se if se > 0 else np.nan
+                    crit = stats.t.ppf(1 - alpha / 2, df_resid)
+                    row.update(coef=coef, se=se, t=t, p=2 * stats.t.sf(abs(t), df_resid),
+                               ci_low=coef - crit * se, ci_high=coef + crit * se, r2_within=r2)
+                rows.append(row)
+    return pd.DataFrame(rows, columns=['dep', 'start', 'end', 'years', 'nobs', 'treated', 'coef', 'se', 't', 'p',
+                                       'ci_low', 'ci_high', 'r2_within'])
+
+
+# 画图数据：起始年 (行) x 结束年 (列) 的系数 (或 value 指定的列) 矩阵
+def stability_grid(table, dep, value='coef'):
+    return table[table['dep'] == dep].pivot(index='start', columns='end', values=value)
+
+
+# 画图数据：固定结束年份 (默认最后一年)，系数和置信区间随起始年份的变化
+def stability_path(table, dep, end=None):
+    part = table[table['dep'] == dep]
+    end = part['end'].max() if end is None else end
+    return part[part['end'] == end][['start', 'years', 'nobs', 'coef', 'ci_low', 'ci_high', 'p']].reset_index(drop=True)
+
+
+# 稳定性摘要：每个被解释变量的系数范围、与全区间同号的比例、5% 水平显著的比例
+def stability_summary(table, alpha=0.05):
+    rows = []
+    for dep, part in table.groupby('dep', sort=False):
+        part = part.dropna(subset=['coef'])
+        if part.empty:
+            continue
+        full = part.loc[part['years'].idxmax()]
+        rows.append({'dep': dep, 'windows': len(part), 'full_window': f"{full['start']}-{full['end']}",
+                     'full_coef': full['coef'], 'min_coef': part['coef'].min(), 'max_coef': part['coef'].max(),
+                     'same_sign': (np.sign(part['coef']) == np.sign(full['coef'])).mean(),
+                     'significant': (part['p'] < alpha).mean()})
+    return pd.DataFrame(rows)